@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the per-call overhead of the `unit_mag`, `check_units`, and `check_enums` decorators.
+
+Run with ``python benchmarks/bench_decorators.py``. Each case is compared against the undecorated
+function and against the previous implementation, which built its wrappers with the vendored
+``decorator.decorate`` and repacked the argument lists on every call. That implementation is
+reproduced below as ``legacy_unit_mag``, so the numbers come from the same interpreter and pint.
+"""
+from __future__ import print_function
+import timeit
+from enum import Enum
+from inspect import getargspec
+
+from instrumental import Q_
+from instrumental.drivers import decorator
+from instrumental.drivers.util import unit_mag, check_units, check_enums, to_quantity
+
+
+def legacy_unit_mag(**named):
+    """The previous `unit_mag` implementation (input args only)"""
+    def in_map(arg, unit_info, name):
+        if unit_info is None:
+            return arg
+        optional, units = unit_info
+        if optional and arg is None:
+            return None
+        elif arg == 0:
+            return arg
+        q = to_quantity(arg)
+        if q.units == units:
+            return q.magnitude
+        return q.to(units).magnitude
+
+    def wrap(func):
+        arg_names, _, _, defaults = getargspec(func)
+        named_units = {name: (False, to_quantity(spec)) for name, spec in named.items()}
+        pos_units = [named_units.get(name) for name in arg_names]
+        defaults = defaults or ()
+        ndefs = len(defaults)
+        new_defaults = {n: d if unit is None else in_map(d, unit, n)
+                        for d, unit, n in zip(defaults, pos_units[-ndefs:], arg_names[-ndefs:])}
+
+        def wrapper(func, *args, **kwargs):
+            new_args = [in_map(a, u, n) for a, u, n in zip(args, pos_units, arg_names)]
+            new_kwargs = {n: in_map(a, named_units.get(n, None), n) for n, a in kwargs.items()}
+            for name in arg_names[max(len(args), len(arg_names)-len(defaults)):]:
+                if name not in new_kwargs:
+                    new_kwargs[name] = new_defaults[name]
+            return func(*new_args, **new_kwargs)
+        return decorator.decorate(func, wrapper)
+    return wrap
+
+
+class Mode(Enum):
+    fast = 1
+    slow = 2
+
+
+def read(self, timeout, n_samples=100):
+    return timeout
+
+
+new_read = unit_mag(timeout='s')(read)
+old_read = legacy_unit_mag(timeout='s')(read)
+checked_read = check_units(timeout='s')(read)
+enum_read = check_enums(timeout=Mode)(read)
+
+
+def run(benchmarks, number=20000):
+    for label, stmt in benchmarks:
+        t = min(timeit.repeat(stmt, number=number, repeat=3))
+        print('{:<50} {:8.2f} us/call'.format(label, t / number * 1e6))
+
+
+def main():
+    q_s, q_ms = Q_(0.5, 's'), Q_(500, 'ms')
+
+    for label, arg in [('Quantity in target units', q_s),
+                       ('Quantity needing conversion', q_ms),
+                       ('str', '500 ms'),
+                       ('bare zero', 0.)]:
+        print('unit_mag, {}'.format(label))
+        run([
+            ('  undecorated', lambda: read(None, arg)),
+            ('  previous implementation', lambda: old_read(None, arg)),
+            ('  current implementation', lambda: new_read(None, arg)),
+        ])
+
+    print('check_units, Quantity in target units')
+    run([('  current implementation', lambda: checked_read(None, q_s))])
+    print('check_enums, enum member')
+    run([('  current implementation', lambda: enum_read(None, Mode.fast))])
+
+
+if __name__ == '__main__':
+    main()
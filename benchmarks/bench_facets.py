@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Microbenchmarks of the per-call overhead of Facet gets/sets and unit conversion.
+
+Run with ``python benchmarks/bench_facets.py``. No hardware is needed; the facets use dummy
+fget/fset functions, so the numbers are pure Instrumental/pint overhead.
+"""
+from __future__ import print_function
+import timeit
+
+from instrumental import Q_, u
+from instrumental.drivers import Instrument, Facet
+from instrumental.drivers.util import magnitude_in
+
+
+class Dummy(Instrument):
+    def _get_voltage(self):
+        return 1.5
+
+    def _set_voltage(self, value):
+        pass
+
+    voltage = Facet(_get_voltage, _set_voltage, type=float, units='V')
+
+
+def run(benchmarks, number=20000):
+    for label, stmt in benchmarks:
+        t = min(timeit.repeat(stmt, number=number, repeat=3))
+        print('{:<45} {:8.2f} us/call'.format(label, t / number * 1e6))
+
+
+def main():
+    inst = Dummy()
+    q_mv, q_v = Q_(250, 'mV'), Q_(2.5, 'V')
+    volt = u.parse_units('V')
+
+    print('Unit conversion')
+    run([
+        ('pint: q.to(units).magnitude', lambda: q_mv.to(volt).magnitude),
+        ('magnitude_in(q, units)', lambda: magnitude_in(q_mv, volt)),
+        ('magnitude_in(q, units), same units', lambda: magnitude_in(q_v, volt)),
+    ])
+
+    print('\nFacet access')
+    run([
+        ('get', lambda: inst.voltage),
+        ('get, raw=True', lambda: Dummy.voltage.get_value(inst, raw=True)),
+        ('set Quantity (needs conversion)', lambda: setattr(inst, 'voltage', q_mv)),
+        ('set Quantity (same units)', lambda: setattr(inst, 'voltage', q_v)),
+        ("set str ('250 mV')", lambda: setattr(inst, 'voltage', '250 mV')),
+        ('set, raw=True', lambda: Dummy.voltage.set_value(inst, 0.25, raw=True)),
+    ])
+
+
+if __name__ == '__main__':
+    main()
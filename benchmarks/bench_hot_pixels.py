@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of hot pixel correction on a large sCMOS-sized frame.
+
+Run with ``python benchmarks/bench_hot_pixels.py``. Compares the precompiled `HotPixelPlan` used
+by `Camera._correct_hot_pixels()` with the per-pixel loop it replaced.
+"""
+from __future__ import print_function
+import timeit
+
+import numpy as np
+
+from instrumental.drivers.cameras import HotPixelPlan
+
+
+def correct_loop(img, hot_pixels):
+    img = img.copy()
+    for y, x in hot_pixels:
+        left = max(0, x-1)
+        right = min(img.shape[1], x+2)
+        top = max(0, y-1)
+        bot = min(img.shape[0], y+2)
+        img[y, x] = (img[top:bot, left:right].sum() - img[y, x])/((bot-top)*(right-left)-1)
+    return img
+
+
+def main(n_pixels=3000):
+    rng = np.random.RandomState(0)
+    img = rng.randint(100, 200, size=(2048, 2048)).astype(np.uint16)
+    hot_pixels = np.column_stack([rng.randint(0, 2048, n_pixels),
+                                  rng.randint(0, 2048, n_pixels)]).tolist()
+
+    plan = HotPixelPlan(hot_pixels, img.shape)
+    private = img.copy()
+    cases = [
+        ('per-pixel loop (old)', lambda: correct_loop(img, hot_pixels), 3),
+        ('build plan', lambda: HotPixelPlan(hot_pixels, img.shape), 20),
+        ('plan, with copy', lambda: plan.apply(img.copy()), 50),
+        ('plan, in place', lambda: plan.apply(private), 200),
+    ]
+    print('{} hot pixels in a 2048x2048 uint16 frame'.format(n_pixels))
+    for label, func, number in cases:
+        t = min(timeit.repeat(func, number=number, repeat=3)) / number
+        print('{:<25} {:8.3f} ms'.format(label, t * 1e3))
+
+
+if __name__ == '__main__':
+    main()
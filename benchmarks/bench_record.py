@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of `Camera.record()` writing live video to disk.
+
+Run with ``python benchmarks/bench_record.py [directory]``. A simulated sCMOS camera, with 2048x2048
+16-bit frames, fills a `FramePool` at 100 fps (about 840 MB/s, the native rate of e.g. a PCO.edge
+4.2) and faster. Each recording reports the rate at which frames were written, measured from the
+first frame's timestamp to the last's, and the number of frames dropped.
+"""
+from __future__ import print_function
+import os
+import sys
+import time
+import shutil
+import tempfile
+from collections import deque
+
+import numpy as np
+
+from instrumental.drivers.cameras import Camera, FramePool
+
+
+class SimCamera(Camera):
+    """Camera that fills `n_buffers` preallocated buffers at `fps`
+
+    A frame that arrives when no buffer is free is lost, as with a real camera.
+    """
+    width = height = max_width = max_height = 2048
+    _leases_frames = True
+
+    def start_capture(self, **kwds):
+        pass
+
+    def get_captured_image(self, timeout='1s', copy=True):
+        pass
+
+    def grab_image(self, timeouts='1s', copy=True, **kwds):
+        pass
+
+    def start_live_video(self, **kwds):
+        self._handle_kwds(kwds)
+        self.buffers = [np.full((self.height, self.width), i, np.uint16)
+                        for i in range(kwds['n_buffers'])]
+        self.free = deque(range(len(self.buffers)))
+        self.pool = FramePool(requeue=self.free.append)
+        self.frame_number = 0
+        self.next_time = time.time()
+
+    def stop_live_video(self):
+        self.pool.close()
+
+    def wait_for_frame(self, timeout=None):
+        self.next_time += 1. / self.fps
+        time.sleep(max(self.next_time - time.time(), 0))
+        self.frame_number += 1
+        if not self.free:
+            return False  # The camera had nowhere to put this frame, so it's lost
+        buf = self.free.popleft()
+        self.pool.push(buf, self.buffers[buf], frame_number=self.frame_number)
+        return True
+
+    def latest_frame(self, copy=True):
+        return self.pool.latest(copy)
+
+
+def make_camera(fps):
+    cam = SimCamera(reopen_policy='new')
+    cam.fps = fps
+    return cam
+
+
+def main(directory=None, n_frames=300):
+    directory = tempfile.mkdtemp(dir=directory)
+    frame_mb = 2048 * 2048 * 2 / 1e6
+    print('{} frames of {:.1f} MB, written to {}'.format(n_frames, frame_mb, directory))
+    try:
+        for fps in (100, 150, 200):
+            for format in ('raw', 'npy-mmap'):
+                cam = make_camera(fps)
+                path = os.path.join(directory, 'video')
+                recording = cam.record(path, n_frames=n_frames, format=format, n_buffers=8)
+                timestamps = recording.index['timestamp']
+                rate = (len(timestamps) - 1) * frame_mb / (timestamps[-1] - timestamps[0])
+
+                label = '{}, {} fps'.format(format, fps)
+                print('{:<25} {:8.0f} MB/s, {:4} dropped'.format(label, rate, recording.dropped))
+                for filename in os.listdir(directory):
+                    os.remove(os.path.join(directory, filename))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
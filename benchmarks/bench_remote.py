@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of transferring camera-sized arrays, and of making small requests, to a remote
+instrument server.
+
+Run with ``python benchmarks/bench_remote.py``. A server and client are run in this process and
+talk over the loopback interface, using a fake camera defined below. Frames are sent through
+shared memory (on Python 3.8+), as out-of-band buffers, both by the compact codec and by the
+pickle codec (when pickle protocol 5 is available), and pickled in-band, as they were previously.
+"""
+from __future__ import print_function
+import time
+import threading
+
+import numpy as np
+
+from instrumental.drivers import Instrument, ParamSet, remote
+from instrumental.drivers.remote import ThreadedTCPServer, ClientSession
+from instrumental.drivers.remote_codec import get_codec
+
+
+class FakeCamera(Instrument):
+    exposure_time = 0.01
+
+    def _initialize(self):
+        self.frame = np.zeros((2048, 2048), dtype=np.uint16)
+        self._handle = threading.Lock()  # Unpicklable, like a real camera
+
+    def grab_image(self):
+        return self.frame
+
+
+def _instrument(params):
+    return FakeCamera._create(params)
+
+
+def run_frames(cam, label, n_frames=50):
+    grab_image = cam.grab_image
+    grab_image()
+
+    start = time.time()
+    for _ in range(n_frames):
+        frame = grab_image()
+    elapsed = time.time() - start
+    print('{:<30} {:8.1f} frames/s {:8.1f} MB/s'.format(label, n_frames / elapsed,
+                                                          n_frames * frame.nbytes / elapsed / 1e6))
+
+
+def run_requests(cam, label, n_requests=2000):
+    start = time.time()
+    for _ in range(n_requests):
+        cam.exposure_time
+    elapsed = time.time() - start
+    print('{:<30} {:8.0f} requests/s'.format(label, n_requests / elapsed))
+
+
+def main():
+    server = ThreadedTCPServer(('127.0.0.1', 0))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    host, port = server.server_address
+
+    cases = []
+    if remote.remote_shm is not None:
+        cases.append(('compact, shared memory', 'compact', True))
+    cases.append(('compact', 'compact', False))
+    if remote.OUT_OF_BAND:
+        cases.append(('pickle, out-of-band', 'pickle', False))
+    cases.append(('pickle, in-band', 'pickle', False))
+
+    results = []
+    for label, codec, shared_memory in cases:
+        get_codec('pickle').out_of_band = (label != 'pickle, in-band')
+        session = ClientSession(host, port, 'bench', timeout=10., codec=codec,
+                                shared_memory=shared_memory)
+        cam = session.instrument(ParamSet(module=__name__, serial=label, server='bench'))
+        results.append((label, cam, session))
+
+    print('2048x2048 uint16 frames over loopback')
+    for label, cam, session in results:
+        get_codec('pickle').out_of_band = (label != 'pickle, in-band')
+        run_frames(cam, label)
+
+    print('Attribute requests over loopback')
+    for label, cam, session in results:
+        get_codec('pickle').out_of_band = (label != 'pickle, in-band')
+        run_requests(cam, label)
+
+    for label, cam, session in results:
+        session.close()
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
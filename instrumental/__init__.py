@@ -5,15 +5,9 @@
 import sys
 from types import ModuleType
 
-from pint import _DEFAULT_REGISTRY
-
 from .__about__ import (__author__, __copyright__, __email__, __license__, __distname__, __url__,
                         __version__)
 
-# Use the default UnitRegistry instance for the entire package
-u = _DEFAULT_REGISTRY
-Q_ = u.Quantity
-
 
 # NOTE: Lazy-loading code from (http://github.com/mitsuhiko/werkzeug)
 #
@@ -29,9 +23,15 @@ all_by_module = {
     'instrumental.drivers': ['instrument', 'list_instruments',
                              'list_visa_instruments', 'list_saved_instruments'],
     'instrumental.tools': ['fit_scan', 'fit_ringdown'],
-    'instrumental.conf': ['load_config_file']
+    'instrumental.conf': ['load_config_file'],
+    'instrumental.util': ['startup_profile'],
 }
 
+# Objects that are expensive to create and are built on first access. Importing pint and building
+# its default registry dominates the cost of `import instrumental`, so `u` and `Q_` are deferred
+# until someone actually needs units.
+lazy_attributes = frozenset(['u', 'Q_'])
+
 # Modules that should be imported when accessed as attributes of instrumental
 attribute_modules = frozenset(['appdirs', 'conf', 'plotting'])
 
@@ -53,8 +53,16 @@ class module(ModuleType):
             return getattr(module, name)
         elif name in attribute_modules:
             __import__('instrumental.' + name)
+        elif name in lazy_attributes:
+            self._load_units()
         return ModuleType.__getattribute__(self, name)
 
+    def _load_units(self):
+        # Use the default UnitRegistry instance for the entire package
+        from pint import _DEFAULT_REGISTRY
+        self.u = _DEFAULT_REGISTRY
+        self.Q_ = _DEFAULT_REGISTRY.Quantity
+
     def __dir__(self):
         """Just show what we want to show."""
         result = list(new_module.__all__)
@@ -77,6 +85,4 @@ new_module.__dict__.update({
     '__version__': __version__,
     '__all__': tuple(object_origins) + tuple(attribute_modules),
     '__docformat__': 'restructuredtext en',
-    'u': u,
-    'Q_': Q_
 })
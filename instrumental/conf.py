@@ -8,12 +8,13 @@ except ImportError:
 
 import sys
 import os.path
+from types import ModuleType
 from warnings import warn
 from ast import literal_eval
 from . import appdirs
 
 __all__ = ['servers', 'instruments', 'prefs']
-servers, instruments, prefs = {}, {}, {}
+_loaded = False
 appname = 'instrumental'
 appauthor = 'mabuchilab'
 user_conf_dir = appdirs.user_config_dir(appname, appauthor)
@@ -43,7 +44,11 @@ def install_default_conf():
 
 
 def load_config_file():
-    global servers, instruments, prefs # Not strictly necessary, but suggestive
+    global servers, instruments, prefs, _loaded # Not strictly necessary, but suggestive
+    if not _loaded:
+        servers, instruments, prefs = {}, {}, {}
+        _loaded = True
+
     parser = configparser.RawConfigParser()
     parser.optionxform = str  # Re-enable case sensitivity
 
@@ -87,5 +92,33 @@ def load_config_file():
         prefs['driver_blacklist'] = [entry.strip() for entry in blacklist.split(',')]
 
 
-# Run on import
-load_config_file()
+def get_float_pref(name, default):
+    """Get the value of pref `name` as a float, or `default` if it's missing or invalid"""
+    if not _loaded:
+        load_config_file()
+    value = prefs.get(name)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        warn("Invalid value {!r} for pref '{}' in instrumental.conf, using default of {}".format(
+             value, name, default))
+        return default
+
+
+class _ConfModule(ModuleType):
+    """Module type that parses the config file the first time a section is accessed"""
+    def __getattr__(self, name):
+        if _loaded or name.startswith('__'):
+            raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+        load_config_file()
+        return ModuleType.__getattribute__(self, name)
+
+
+# Defer parsing until a section is actually needed, which keeps it out of `import instrumental`.
+# Modules can't change their type on Python 2, so there we fall back to parsing on import.
+try:
+    sys.modules[__name__].__class__ = _ConfModule
+except TypeError:
+    load_config_file()
@@ -1,4 +1,4 @@
-# Auto-generated 2020-07-17T21:30:05.830772
+# Auto-generated 2026-10-18T05:03:47.584851
 from collections import OrderedDict
 
 driver_info = OrderedDict([
@@ -6,32 +6,40 @@ driver_info = OrderedDict([
         'params': ['number'],
         'classes': ['Pixelfly'],
         'imports': ['nicelib', 'win32event'],
+        'priority': 5,
     }),
     ('cameras.tsi', {
         'params': ['number', 'serial'],
         'classes': ['TSI_Camera'],
         'imports': ['cffi'],
+        'priority': 5,
     }),
     ('cameras.uc480', {
         'params': ['id', 'model', 'serial'],
         'classes': ['UC480_Camera'],
         'imports': ['nicelib >= 0.5', 'pywin32'],
+        'priority': 5,
     }),
     ('daq.ni', {
         'params': ['model', 'name', 'serial'],
         'classes': ['NIDAQ'],
         'imports': ['nicelib >= 0.5'],
+        'priority': 5,
     }),
     ('frequencycounters.keysight', {
         'params': ['visa_address'],
         'classes': ['FC53220A'],
         'imports': [],
+        'priority': 5,
+        'visa_check': False,
         'visa_info': {},
     }),
     ('funcgenerators.agilent', {
         'params': ['visa_address'],
         'classes': ['Agilent33250A', 'Agilent81110A', 'AgilentE4400B', 'AgilentMXG'],
         'imports': [],
+        'priority': 5,
+        'visa_check': False,
         'visa_info': {
             'Agilent33250A': ('Agilent Technologies', ['33250A']),
             'Agilent81110A': ('HEWLETT-PACKARD', ['HP81110A']),
@@ -43,6 +51,8 @@ driver_info = OrderedDict([
         'params': ['visa_address'],
         'classes': [],
         'imports': ['visa'],
+        'priority': 5,
+        'visa_check': False,
         'visa_info': {
             'DG800': ('Rigol Technologies', ['DG811', 'DG812']),
         },
@@ -51,6 +61,8 @@ driver_info = OrderedDict([
         'params': ['visa_address'],
         'classes': [],
         'imports': [],
+        'priority': 5,
+        'visa_check': False,
         'visa_info': {
             'AFG_3000': ('TEKTRONIX', ['AFG3011', 'AFG3021B', 'AFG3022B', 'AFG3101', 'AFG3102', 'AFG3251', 'AFG3252']),
         },
@@ -59,6 +71,8 @@ driver_info = OrderedDict([
         'params': ['visa_address'],
         'classes': ['LDC3724B'],
         'imports': [],
+        'priority': 5,
+        'visa_check': False,
         'visa_info': {
             'LDC3724B': ('ILX Lightwave', ['3724B']),
         },
@@ -67,6 +81,8 @@ driver_info = OrderedDict([
         'params': ['visa_address'],
         'classes': ['Model5005'],
         'imports': [],
+        'priority': 5,
+        'visa_check': False,
         'visa_info': {
             'Model5005': ('Newport', ['5005']),
         },
@@ -75,6 +91,8 @@ driver_info = OrderedDict([
         'params': ['visa_address'],
         'classes': [],
         'imports': ['visa'],
+        'priority': 5,
+        'visa_check': False,
         'visa_info': {
             'SR844': ('Stanford_Research_Systems', ['SR844']),
         },
@@ -83,6 +101,8 @@ driver_info = OrderedDict([
         'params': ['visa_address'],
         'classes': [],
         'imports': ['visa'],
+        'priority': 5,
+        'visa_check': False,
         'visa_info': {
             'SR850': ('Stanford_Research_Systems', ['SR850']),
         },
@@ -91,47 +111,58 @@ driver_info = OrderedDict([
         'params': ['serial'],
         'classes': ['FilterFlipper'],
         'imports': ['nicelib'],
+        'priority': 5,
     }),
     ('motion._kinesis.isc', {
         'params': ['serial'],
         'classes': ['K10CR1'],
         'imports': ['nicelib'],
+        'priority': 5,
     }),
     ('motion.apt', {
         'params': ['serial'],
         'classes': ['TDC001_APT'],
         'imports': ['serial'],
+        'priority': 5,
     }),
     ('motion.ecc100', {
         'params': ['id'],
         'classes': ['ECC100'],
         'imports': [],
+        'priority': 5,
     }),
     ('motion.filter_flipper', {
         'params': ['serial'],
         'classes': ['Filter_Flipper'],
         'imports': ['cffi', 'nicelib'],
+        'priority': 5,
     }),
     ('motion.klinger', {
         'params': ['visa_address'],
         'classes': ['KlingerMotorController'],
         'imports': ['visa'],
+        'priority': 5,
+        'visa_check': False,
         'visa_info': {},
     }),
     ('motion.newmark', {
         'params': ['serial'],
         'classes': ['NSCA1'],
         'imports': ['visa'],
+        'priority': 5,
     }),
     ('motion.tdc_001', {
         'params': ['serial'],
         'classes': ['TDC001'],
         'imports': ['cffi', 'nicelib'],
+        'priority': 5,
     }),
     ('multimeters.hp', {
         'params': ['visa_address'],
         'classes': [],
         'imports': [],
+        'priority': 5,
+        'visa_check': False,
         'visa_info': {
             'HPMultimeter': ('HEWLETT-PACKARD', ['34401A']),
         },
@@ -140,11 +171,14 @@ driver_info = OrderedDict([
         'params': ['port'],
         'classes': ['DiConOpticalSwitch'],
         'imports': ['serial'],
+        'priority': 5,
     }),
     ('powermeters.hp', {
         'params': ['visa_address'],
         'classes': ['HP_8153A'],
         'imports': [],
+        'priority': 5,
+        'visa_check': False,
         'visa_info': {
             'HP_8153A': ('HP Lightwave', ['8153A']),
         },
@@ -153,6 +187,8 @@ driver_info = OrderedDict([
         'params': ['visa_address'],
         'classes': ['OMM_6810B'],
         'imports': [],
+        'priority': 5,
+        'visa_check': False,
         'visa_info': {
             'OMM_6810B': ('ILX Lightwave', ['6810B']),
         },
@@ -161,6 +197,8 @@ driver_info = OrderedDict([
         'params': ['visa_address'],
         'classes': ['PM100A', 'PM100D'],
         'imports': [],
+        'priority': 5,
+        'visa_check': False,
         'visa_info': {
             'PM100A': ('Thorlabs', ['PM100A']),
             'PM100D': ('Thorlabs', ['PM100D']),
@@ -170,6 +208,8 @@ driver_info = OrderedDict([
         'params': ['visa_address'],
         'classes': ['GPD_3303S'],
         'imports': [],
+        'priority': 5,
+        'visa_check': False,
         'visa_info': {
             'GPD_3303S': ('GW INSTEK', ['GPD-3303S']),
         },
@@ -178,6 +218,8 @@ driver_info = OrderedDict([
         'params': ['visa_address'],
         'classes': ['ProbecardInterface'],
         'imports': [],
+        'priority': 5,
+        'visa_check': False,
         'visa_info': {
             'ProbecardInterface': ('MIT POE GROUP', ['Probecard-interface']),
         },
@@ -186,6 +228,8 @@ driver_info = OrderedDict([
         'params': ['visa_address'],
         'classes': ['DSO_1000'],
         'imports': ['pyvisa', 'visa'],
+        'priority': 5,
+        'visa_check': False,
         'visa_info': {
             'DSO_1000': ('Agilent Technologies', ['DSO1024A']),
         },
@@ -194,6 +238,8 @@ driver_info = OrderedDict([
         'params': ['visa_address'],
         'classes': ['MSO_DPO_2000', 'MSO_DPO_4000', 'TDS_1000', 'TDS_200', 'TDS_2000', 'TDS_3000', 'TDS_7000'],
         'imports': ['pyvisa', 'visa'],
+        'priority': 5,
+        'visa_check': False,
         'visa_info': {
             'MSO_DPO_2000': ('TEKTRONIX', ['MSO2012', 'MSO2014', 'MSO2024', 'DPO2012', 'DPO2014', 'DPO2024']),
             'MSO_DPO_4000': ('TEKTRONIX', ['MSO4032', 'DPO4032', 'MSO4034', 'DPO4034', 'MSO4054', 'DPO4054', 'MSO4104', 'DPO4104']),
@@ -208,6 +254,8 @@ driver_info = OrderedDict([
         'params': ['visa_address'],
         'classes': ['HP_4156C'],
         'imports': [],
+        'priority': 5,
+        'visa_check': False,
         'visa_info': {
             'HP_4156C': ('HEWLETT-PACKARD', ['4156C']),
         },
@@ -216,6 +264,8 @@ driver_info = OrderedDict([
         'params': ['visa_address'],
         'classes': ['Keithley_2400'],
         'imports': [],
+        'priority': 5,
+        'visa_check': False,
         'visa_info': {
             'Keithley_2400': ('Keithley', ['2400']),
         },
@@ -224,6 +274,8 @@ driver_info = OrderedDict([
         'params': ['visa_address'],
         'classes': ['B2902A'],
         'imports': [],
+        'priority': 5,
+        'visa_check': False,
         'visa_info': {
             'B2902A': ('Keysight', ['B2902A']),
         },
@@ -232,56 +284,72 @@ driver_info = OrderedDict([
         'params': ['port'],
         'classes': ['Bristol_721'],
         'imports': [],
+        'priority': 5,
     }),
     ('spectrometers.thorlabs_ccs', {
         'params': ['model', 'serial', 'usb'],
         'classes': ['CCS'],
         'imports': ['cffi', 'nicelib', 'visa'],
+        'priority': 5,
     }),
     ('spectrumanalyzers.rohde_schwarz', {
         'params': ['visa_address'],
         'classes': [],
         'imports': [],
+        'priority': 5,
+        'visa_check': False,
         'visa_info': {},
     }),
     ('tempcontrollers.covesion', {
         'params': ['visa_address'],
         'classes': ['CovesionOC'],
         'imports': ['pyvisa'],
+        'priority': 5,
+        'visa_check': True,
         'visa_info': {},
     }),
     ('tempcontrollers.hcphotonics', {
         'params': ['visa_address'],
         'classes': ['TC038'],
         'imports': ['pyvisa'],
+        'priority': 5,
+        'visa_check': True,
         'visa_info': {},
     }),
     ('lasers.femto_ferb', {
         'params': ['visa_address'],
         'classes': [],
         'imports': [],
+        'priority': 6,
+        'visa_check': True,
         'visa_info': {},
     }),
     ('powermeters.newport', {
         'params': ['visa_address'],
         'classes': ['Newport_1830_C'],
         'imports': [],
+        'priority': 8,
+        'visa_check': True,
         'visa_info': {},
     }),
     ('cameras.pco', {
         'params': ['interface', 'number'],
         'classes': ['PCO_Camera'],
         'imports': ['cffi', 'nicelib', 'pycparser'],
+        'priority': 9,
     }),
     ('vacuum.sentorr_mod', {
         'params': ['port'],
         'classes': ['SenTorrMod'],
         'imports': ['serial'],
+        'priority': 9,
     }),
     ('wavemeters.burleigh', {
         'params': ['visa_address'],
         'classes': ['WA_1000'],
         'imports': [],
+        'priority': 9,
+        'visa_check': True,
         'visa_info': {},
     }),
 ])
@@ -8,6 +8,7 @@ from future.utils import with_metaclass
 import os
 import re
 import abc
+import time
 import atexit
 import socket
 import inspect
@@ -199,13 +200,31 @@ def add_driver_info(classname, classdict):
 
     if 'visa_address' in cls_params:
         visa_info = entry.setdefault('visa_info', {})
-        visa_info['classname'] = classdict.get('_INST_VISA_INFO_')
+        if classdict.get('_INST_VISA_INFO_'):
+            visa_info[classname] = classdict['_INST_VISA_INFO_']
+        reset_visa_driver_table()
 
 
 def driver_takes_param(module_name, param_name):
     return param_name in driver_info.get(module_name, {}).get('params', ())
 
 
+def visa_driver_table():
+    """Get the VisaDriverTable built from `driver_info`, building it if necessary"""
+    global _visa_driver_table
+    if _visa_driver_table is None:
+        from .discovery import VisaDriverTable, get_miss_ttl
+        _visa_driver_table = VisaDriverTable(driver_info, miss_ttl=get_miss_ttl())
+    return _visa_driver_table
+
+
+def reset_visa_driver_table():
+    """Discard the VisaDriverTable, e.g. because `driver_info` has changed"""
+    global _visa_driver_table
+    _visa_driver_table = None
+_visa_driver_table = None
+
+
 class Instrument(with_metaclass(InstrumentMeta, object)):
     """
     Base class for all instruments.
@@ -310,11 +329,61 @@ class Instrument(with_metaclass(InstrumentMeta, object)):
         else:
             log.info("Driver module missing `list_instruments()`, not filling out paramset")
 
-    def get(self, facet_name, use_cache=False):
+    def _get_facet(self, facet_name):
         facet = getattr(self.__class__, facet_name)
         if not isinstance(facet, Facet):
             raise ValueError("'{}' is not a Facet".format(facet_name))
-        return facet.get_value(self, use_cache=use_cache)
+        return facet
+
+    def get(self, facet_name, use_cache=False, raw=False):
+        return self._get_facet(facet_name).get_value(self, use_cache=use_cache, raw=raw)
+
+    def get_many(self, facet_names, use_cache=False):
+        """Get the values of several facets, batching the reads where possible
+
+        Facets that support batching (e.g. those made by `SCPI_Facet`) are read using as few
+        round-trips as the driver allows, and their cached values are updated just as if they'd
+        been read individually. Any other facets are read one at a time.
+
+        Parameters
+        ----------
+        facet_names : sequence of str
+            Names of the facets to read
+        use_cache : bool, optional
+            Whether to use the cached values of cacheable facets rather than querying them
+
+        Returns
+        -------
+        values : list
+            The facets' values, in the same order as `facet_names`
+        """
+        facets = [self._get_facet(name) for name in facet_names]
+        values = {}
+        batch = []
+        for facet in facets:
+            if facet.name in values or facet in batch:
+                continue
+            instance = facet.instance(self)
+            if use_cache and instance.cache_is_valid():
+                values[facet.name] = instance.cached_val
+            elif facet.batch_msg is not None:
+                batch.append(facet)
+            else:
+                values[facet.name] = facet.get_value(self, use_cache=use_cache)
+
+        if len(batch) > 1:
+            values.update(self._get_batch(batch))
+        elif batch:
+            values[batch[0].name] = batch[0].get_value(self, use_cache=use_cache)
+
+        return [values[facet.name] for facet in facets]
+
+    def _get_batch(self, facets):
+        """Read a list of batchable facets, returning a dict mapping facet names to values
+
+        Drivers that can combine queries override this. The default reads each facet separately.
+        """
+        return {facet.name: facet.get_value(self, use_cache=False) for facet in facets}
 
     def __enter__(self):
         return self
@@ -479,6 +548,34 @@ class VisaMixin(Instrument):
             self._flush_message_queue()  # TODO: combine query with this message?
         return self._rsrc.query(message.format(*args, **kwds))
 
+    def _get_batch(self, facets):
+        """Read all facets using a single ';'-joined query
+
+        Like transaction-chained writes, each message after the first is made absolute by
+        prefixing it with ':'. Falls back to individual queries if the number of fields in the
+        reply doesn't match the number of messages.
+        """
+        messages = []
+        for i, facet in enumerate(facets):
+            msg = facet.batch_msg
+            if i > 0 and msg[0] not in ':*':
+                msg = ':' + msg
+            messages.append(msg)
+
+        reply = self.query(';'.join(messages))
+        fields = reply.strip().split(';')
+        if len(fields) != len(facets):
+            log.info("Combined query returned %d fields for %d facets, querying individually",
+                     len(fields), len(facets))
+            return Instrument._get_batch(self, facets)
+
+        values = {}
+        for facet, field in zip(facets, fields):
+            convert = facet.batch_convert
+            raw_value = convert(field) if convert else field
+            values[facet.name] = facet.store_value(self, raw_value)
+        return values
+
     @contextlib.contextmanager
     def transaction(self):
         """Transaction context manager to auto-chain VISA messages
@@ -533,13 +630,13 @@ class VisaMixin(Instrument):
         return self._rsrc
 
 
-def open_visa_inst(visa_address, raise_errors=False):
+def open_visa_inst(visa_address, raise_errors=False, rm=None):
     """Try to open a visa instrument.
 
     Logs well-known errors, and also suppress them if raise_errors is False.
     """
     import visa
-    rm = visa.ResourceManager()
+    rm = rm or visa.ResourceManager()
     try:
         log.info("Opening VISA resource '{}'".format(visa_address))
         visa_inst = rm.open_resource(visa_address, open_timeout=50, timeout=200)
@@ -561,34 +658,76 @@ def open_visa_inst(visa_address, raise_errors=False):
     return visa_inst
 
 
-def gen_visa_instruments():
+def gen_visa_instruments(index=None, rm=None):
+    """Yield a ParamSet for each VISA address that has a matching driver
+
+    Addresses are probed concurrently (see `discovery.scan_visa_addresses()`), and ParamSets are
+    yielded as soon as each probe finishes, so they are not necessarily in address order.
+
+    If a `DiscoveryIndex` is given, addresses with unexpired entries are not probed, and newly
+    probed addresses are added to the index. `rm` is the VISA ResourceManager to use, e.g. one with
+    a pyvisa-sim backend; by default, the default ResourceManager is used.
+    """
     import visa
+    from .discovery import scan_visa_addresses
     prev_addr = 'START'
-    rm = visa.ResourceManager()
+    rm = rm or visa.ResourceManager()
     visa_list = rm.list_resources()
+
+    if index is not None:
+        index.prune_visa(visa_list)
+
+    to_probe = []
     for addr in visa_list:
         if addr.startswith(prev_addr):
             continue
-
         prev_addr = addr
-        visa_inst = open_visa_inst(addr, raise_errors=False)
-        if visa_inst is None:
-            continue
 
-        try:
-            driver_module, classname = find_visa_driver_class(visa_inst)
-            cls = getattr(driver_module, classname)
-        except Exception as e:
-            log.info('Exception occurred when getting correct visa driver module:')
-            log.info(str(e))
-            continue
-        else:
-            params = ParamSet(cls, visa_address=addr)
+        if index is not None:
+            found, params = index.visa_entry(addr)
+            if found:
+                log.info("Using indexed result for VISA address '%s'", addr)
+                if params is not None:
+                    yield params
+                continue
+        to_probe.append(addr)
+
+    for addr, params in scan_visa_addresses(to_probe, lambda a: probe_visa_address(a, rm)):
+        if index is not None:
+            index.set_visa_entry(addr, params)
+        if params is not None:
             yield params
-            try_close_visa_resource(cls, visa_inst)
 
-        finally:
-            visa_inst.close()
+
+def probe_visa_address(addr, rm=None):
+    """Open the VISA resource at `addr` and find its driver
+
+    Returns the instrument's ParamSet, or None if the resource couldn't be opened or no driver
+    matched it. Addresses which recently failed to match are skipped without being opened.
+    """
+    table = visa_driver_table()
+    if table.is_miss(addr):
+        log.info("Skipping VISA address '%s', which recently matched no driver", addr)
+        return None
+
+    visa_inst = open_visa_inst(addr, raise_errors=False, rm=rm)
+    if visa_inst is None:
+        table.add_miss(addr)
+        return None
+
+    try:
+        driver_module, classname = find_visa_driver_class(visa_inst, cache_misses=True)
+        cls = getattr(driver_module, classname)
+    except Exception as e:
+        log.info('Exception occurred when getting correct visa driver module:')
+        log.info(str(e))
+        table.add_miss(addr)
+        return None
+    else:
+        try_close_visa_resource(cls, visa_inst)
+        return ParamSet(cls, visa_address=addr)
+    finally:
+        visa_inst.close()
 
 
 def try_close_visa_resource(inst_class, resource):
@@ -603,7 +742,7 @@ def try_close_visa_resource(inst_class, resource):
         log.info(e)
 
 
-def list_visa_instruments():
+def list_visa_instruments(index=None):
     """Returns a list of info about available VISA instruments.
 
     May take a few seconds because it must poll the network.
@@ -618,10 +757,10 @@ def list_visa_instruments():
     [<TEKTRONIX 'TDS 3032'>, <TEKTRONIX 'AFG3021B'>]
     >>> inst = instrument(inst_list[0])
     """
-    return list(gen_visa_instruments())
+    return list(gen_visa_instruments(index))
 
 
-def list_instruments(server=None, module=None, blacklist=None):
+def list_instruments(server=None, module=None, blacklist=None, refresh=False, servers=None):
     """Returns a list of info about available instruments.
 
     May take a few seconds because it must poll hardware devices.
@@ -651,12 +790,35 @@ def list_instruments(server=None, module=None, blacklist=None):
         A str to filter what driver modules are checked. A driver module gets checked only if it
         contains the substring ``module`` in its full name. The full name includes both the driver
         group and the module, e.g. ``'cameras.pco'``.
+    refresh : bool, optional
+        If True, ignore the discovery index and query every driver module and VISA address. The
+        index is still updated with the results. By default, results which were indexed recently
+        are reused, so only expired driver modules and newly-seen VISA addresses get queried. See
+        `instrumental.drivers.discovery` for details. With `servers`, it instead means to query
+        every server again, rather than reusing their recently listed instruments.
+    servers : list of str, or str, optional
+        Remote servers to query all at once, rather than the local machine. Each may be an alias
+        or an address, as with `server`, or use 'all' for every server in your instrumental.conf.
+        Servers which can't be reached in time are skipped with a warning, and the results are
+        merged, with the 'server' entry of each giving the server it's on. See
+        `remote.list_remote_instruments()` for details.
     """
+    if servers is not None:
+        from . import remote
+        return remote.list_remote_instruments(servers, refresh=refresh)
+
     if server is not None:
         from . import remote
         session = remote.client_session(server)
         return session.list_instruments()
 
+    from . import discovery
+    index = discovery.get_index()
+    if refresh:
+        visa_driver_table().clear_misses()
+        if index is not None:
+            index.clear(module)
+
     if blacklist is None:
         blacklist = conf.prefs['driver_blacklist']
     elif isinstance(blacklist, basestring):
@@ -674,7 +836,7 @@ def list_instruments(server=None, module=None, blacklist=None):
         try:
             import visa
             try:
-                inst_list.extend(list_visa_instruments())
+                inst_list.extend(list_visa_instruments(index))
             except visa.VisaIOError:
                 pass  # Hide visa errors
         except (ImportError, ConfigError):
@@ -691,17 +853,35 @@ def list_instruments(server=None, module=None, blacklist=None):
             log.info("Skipping blacklisted driver module '%s'", mod_name)
             continue
 
-        driver_module = import_driver(mod_name, raise_errors=False)
-        if driver_module is None:
-            continue
+        if index is not None:
+            paramsets = index.module_entries(mod_name)
+            if paramsets is not None:
+                log.info("Using indexed instruments for driver module '%s'", mod_name)
+                inst_list.extend(paramsets)
+                continue
 
-        try:
-            inst_list.extend(driver_module.list_instruments())
-        except AttributeError:
-            continue  # Module doesn't have a list_instruments() function
+        paramsets = list_module_instruments(mod_name)
+        if index is not None:
+            index.set_module_entries(mod_name, paramsets)
+        inst_list.extend(paramsets)
+
+    if index is not None:
+        index.save()
     return inst_list
 
 
+def list_module_instruments(mod_name):
+    """Get the instruments listed by a single driver module, or [] if it can't be imported"""
+    driver_module = import_driver(mod_name, raise_errors=False)
+    if driver_module is None:
+        return []
+
+    try:
+        return list(driver_module.list_instruments())
+    except AttributeError:
+        return []  # Module doesn't have a list_instruments() function
+
+
 def list_saved_instruments():
     return {k: ParamSet(**v) for k,v in conf.instruments.items()}
 
@@ -743,9 +923,15 @@ def _get_visa_instrument(params):
     return visa_inst
 
 
-def _extract_params(inst, kwargs):
+def _extract_params(inst, kwargs, use_index=True):
+    """Get (params, alias, from_index) from the args given to `instrument()`
+
+    `from_index` is True if the params came from the discovery index rather than a fresh scan, in
+    which case they may be stale.
+    """
     # Look for params in a bunch of ways
     alias = None
+    from_index = False
     if inst is None:
         raw_params = {}
     elif isinstance(inst, ParamSet):
@@ -755,14 +941,21 @@ def _extract_params(inst, kwargs):
     elif isinstance(inst, basestring):
         name = inst
         raw_params = conf.instruments.get(name, None)
+        if raw_params is None:
+            # Try the discovery index first, which doesn't need to touch any hardware
+            if use_index:
+                from . import discovery
+                raw_params = discovery.lookup(name)
+                from_index = raw_params is not None
+
         if raw_params is None:
             # Try looking for the string in the output of list_instruments()
             test_str = name.lower()
-            for inst_params in list_instruments():
+            for inst_params in list_instruments(refresh=True):
                 if test_str in str(inst_params).lower():
                     raw_params = inst_params
                     break
-        else:
+        elif not from_index:
             alias = name
 
         if raw_params is None:
@@ -771,7 +964,18 @@ def _extract_params(inst, kwargs):
 
     params = ParamSet(**raw_params)  # Copy first to avoid modifying input dicts
     params.update(kwargs)
-    return params, alias
+
+    # Fill in the driver of an instrument given by serial, so we needn't try every driver
+    if (use_index and not from_index and 'serial' in params and
+            not any(key in params for key in ('module', 'server', 'visa_address'))):
+        from . import discovery
+        indexed = discovery.find_serial(params['serial'])
+        if indexed is not None and all(indexed[k] == v for k, v in params.items()
+                                       if k in indexed and k != 'serial'):
+            indexed.update(params)
+            params, from_index = indexed, True
+
+    return params, alias, from_index
 
 
 def _init_instrument(new_inst, params):
@@ -943,39 +1147,38 @@ def find_visa_instrument_by_module(in_paramset):
     raise Exception("No instrument from driver {} detected".format(driver_name))
 
 
-def find_visa_driver_class(visa_inst, module=None):
+def find_visa_driver_class(visa_inst, module=None, cache_misses=False):
     """Search for the appropriate VISA driver, returning (driver_module, classname)
 
     First checks based on the manufacturer/model returned by ``*IDN?``, then ``_check_visa_support``
     until a match is found. Raises an exception if no match is found.
-    """
-    if module:
-        all_info = [(drv_name, mod_info['visa_info'])
-                    for (drv_name, mod_info) in driver_info.items()
-                    if 'visa_info' in mod_info and drv_name == module]
-    else:
-        all_info = [(drv_name, mod_info['visa_info'])
-                    for (drv_name, mod_info) in driver_info.items()
-                    if 'visa_info' in mod_info]
 
-    module_supports_idn = any(info for _,info in all_info)
-    if module_supports_idn:
+    If `cache_misses` is True, an IDN response that matches no driver is remembered, and other
+    instruments giving the same response fail immediately rather than running every
+    ``_check_visa_support``.
+    """
+    table = visa_driver_table()
+    idn = None
+    if table.has_idn_info(module):
         log.info('Checking IDN...')
         inst_manufac, inst_model = get_idn(visa_inst)
 
         # Match IDN against driver manufac/model
         if inst_manufac:
-            for driver_fullname, visa_info in all_info:
-                log.info("Checking manufac/model against those in %s", driver_fullname)
-                for classname, (cls_manufac, cls_models) in visa_info.items():
-                    if inst_manufac == cls_manufac and inst_model in cls_models:
-                        log.info("Match found: %s, %s", driver_fullname, classname)
-                        driver_module = import_driver(driver_fullname, raise_errors=True)
-                        return driver_module, classname
+            match = table.match_idn(inst_manufac, inst_model, module)
+            if match:
+                driver_fullname, classname = match
+                log.info("Match found: %s, %s", driver_fullname, classname)
+                driver_module = import_driver(driver_fullname, raise_errors=True)
+                return driver_module, classname
+
+            idn = (inst_manufac, inst_model, module)
+            if cache_misses and table.is_miss(idn):
+                raise Exception("No matching VISA driver found (cached)")
 
     # Manually try visa-based drivers
     log.info('Checking support via `_check_visa_support()`...')
-    for driver_fullname, _ in all_info:
+    for driver_fullname in table.check_order(module):
         driver_module = import_driver(driver_fullname, raise_errors=False)
         if driver_module is None:
             continue
@@ -985,11 +1188,15 @@ def find_visa_driver_class(visa_inst, module=None):
             continue
 
         log.info("Checking if '%s' has a matching class", driver_fullname)
+        start = time.time()
         classname = driver_module._check_visa_support(visa_inst)
+        table.record_check_time(driver_fullname, time.time() - start)
 
         if classname:
             return driver_module, classname
 
+    if cache_misses and idn:
+        table.add_miss(idn)
     raise Exception("No matching VISA driver found")
 
 
@@ -1124,25 +1331,45 @@ def instrument(inst=None, **kwargs):
         return inst
 
     with _reopen_context(kwargs.pop('reopen_policy', 'strict')):
-        params, alias = _extract_params(inst, kwargs)
-
-        if 'server' in params:
-            from . import remote
-            host = params['server']
-            session = remote.client_session(host)
-            inst = session.instrument(params)
-        elif 'visa_address' in params:
-            inst = find_visa_instrument(params)
-        elif 'module' in params and driver_takes_param(params['module'], 'visa_address'):
-            inst = find_visa_instrument_by_module(params)
-        else:
-            inst = find_nonvisa_instrument(params)
+        params, alias, from_index = _extract_params(inst, kwargs)
 
-        if inst is None:
-            raise Exception("No instrument found that matches {}".format(params))
+        try:
+            new_inst = _open_instrument(params)
+        except InstrumentExistsError:
+            raise
+        except Exception as e:
+            if not from_index:
+                raise
+            # The indexed params may be stale (e.g. the device was unplugged), so rescan
+            log.info("Failed to open instrument from indexed params %r: %s", params, e)
+            from . import discovery
+            try:
+                discovery.invalidate(params)
+            except Exception as err:
+                log.info("Could not remove params %r from the discovery index: %s", params, err)
+            params, alias, _ = _extract_params(inst, kwargs, use_index=False)
+            new_inst = _open_instrument(params)
 
-        inst._alias = alias
-        return inst
+        new_inst._alias = alias
+        return new_inst
+
+
+def _open_instrument(params):
+    if 'server' in params:
+        from . import remote
+        host = params['server']
+        session = remote.client_session(host)
+        inst = session.instrument(params)
+    elif 'visa_address' in params:
+        inst = find_visa_instrument(params)
+    elif 'module' in params and driver_takes_param(params['module'], 'visa_address'):
+        inst = find_visa_instrument_by_module(params)
+    else:
+        inst = find_nonvisa_instrument(params)
+
+    if inst is None:
+        raise Exception("No instrument found that matches {}".format(params))
+    return inst
 
 
 def register_cleanup(func):
@@ -8,9 +8,18 @@ import json
 import os.path
 import numpy as np
 from .. import Instrument
+from ..util import check_units
 from ... import Q_, conf
 from ...errors import Error
+from ._frames import Frame, FramePool
+from ._stream import FrameStream
+from ._record import FORMATS as RECORDING_FORMATS, Recording, load_recording
 
+# Bits of a pixel map, as made by `Camera.calibrate_pixels()`
+HOT_PIXEL = 1  # Dark level far above the rest of the sensor
+WARM_PIXEL = 2  # Dark level noticeably above the rest, but not enough to be corrected
+DEAD_PIXEL = 4  # Stuck at one value, or dark level far below the rest
+CORRECTED_PIXELS = HOT_PIXEL | DEAD_PIXEL  # Those fixed by hot pixel correction
 
 
 class Camera(Instrument):
@@ -26,20 +35,33 @@ class Camera(Instrument):
 
     In *continuous* or *live* mode, the camera continuously retrieves images until it is manually
     stopped. This mode can be used e.g. to make a GUI that looks at a live view of the camera. The
-    process looks like this::
+    simplest way to use it is via `stream()`::
+
+        >>> for arr in cam.stream(n=100):
+        >>>     do_stuff_with(arr)
+
+    which does the same as::
 
         >>> cam.start_live_video()
-        >>> while not_done():
-        >>>     frame_ready = cam.wait_for_frame()
-        >>>     if frame_ready:
-        >>>         arr = cam.latest_frame()
-        >>>         do_stuff_with(arr)
+        >>> for i in range(100):
+        >>>     if not cam.wait_for_frame(timeout='1s'):
+        >>>         raise TimeoutError
+        >>>     arr = cam.latest_frame(copy=False)
+        >>>     do_stuff_with(arr)
         >>> cam.stop_live_video()
+
+    Drivers that support it keep a pool of buffers for live video (see `FramePool`), so that
+    ``latest_frame(copy=False)`` can give you a `Frame` that views a buffer directly. The camera
+    doesn't write to the buffer again until you release the frame (or it's garbage collected), and
+    keeps filling its other buffers in the meantime::
+
+        >>> with cam.latest_frame(copy=False) as frame:
+        >>>     do_stuff_with(frame)
     """
 
     DEFAULT_KWDS = dict(n_frames=1, vbin=1, hbin=1, exposure_time=Q_('10ms'), gain=0, width=None,
                         height=None, cx=None, cy=None, left=None, right=None, top=None, bot=None,
-                        fix_hotpixels=False)
+                        fix_hotpixels=False, n_buffers=4)
 
     @abc.abstractproperty
     def width(self):
@@ -61,7 +83,10 @@ class Camera(Instrument):
         """Max settable height of the camera image, given current binning/subpixel settings"""
         pass
 
+    _leases_frames = False  # Whether latest_frame(copy=False) gives leased Frames
     _hot_pixels = None
+    _hot_pixel_plan = None
+    _pixel_map = None
     _defaults = None
 
     @abc.abstractmethod
@@ -157,7 +182,9 @@ class Camera(Instrument):
         acquired. You can check if the next frame is ready by using `wait_for_frame()`, and access
         the most recent image's data with `get_captured_image()`.
 
-        See `grab_image()` for the set of available kwds.
+        See `grab_image()` for the set of available kwds. Drivers with a buffer pool also accept
+        `n_buffers`, the number of buffers to give the camera (4 by default). Use more of them if
+        you hold on to several frames at once.
         """
 
     @abc.abstractmethod
@@ -193,9 +220,117 @@ class Camera(Instrument):
         ----------
         copy : bool, optional
             Whether to copy the image memory or directly reference the underlying buffer. It is
-            recommended to use *True* (the default) unless you know what you're doing.
+            recommended to use *True* (the default) unless you know what you're doing. For drivers
+            with a buffer pool, a *False* value gives a `Frame` that leases its buffer until it's
+            released.
         """
 
+    @check_units(timeout='?s')
+    def stream(self, n=None, timeout='1s', copy=None, background=False, queue_size=2,
+               callback=None, **kwds):
+        """Start live video, and get a stream of its frames.
+
+        Iterate over the returned `FrameStream` (or call its `get()` method) to get each new frame
+        as it arrives. The stream stops live video once it has given `n` frames, or when you
+        ``close()`` it, e.g. by using it as a context manager::
+
+            >>> with cam.stream(background=True) as stream:
+            >>>     for frame in stream:
+            >>>         if do_stuff_with(frame):
+            >>>             break
+            >>> print(stream.stats())
+
+        Parameters
+        ----------
+        n : int, optional
+            Number of frames to give before stopping. If *None* (the default), the stream goes on
+            until it's closed.
+        timeout : Quantity([time]) or None, optional
+            Max time to wait for each frame. If it's exceeded, a TimeoutError is raised. If *None*,
+            will wait forever.
+        copy : bool, optional
+            Whether to copy each frame, as with `latest_frame()`. By default, frames are leased
+            views of the driver's buffers where the driver supports it, and copies otherwise.
+            Background streams always copy frames from drivers that don't lease them, since a
+            queued view of such a buffer would be overwritten by later frames.
+        background : bool, optional
+            Whether to pull frames from the camera on a capture thread, into a queue that you read
+            from. This lets you await frames in an event loop or GUI without polling the camera,
+            and keeps the camera's buffers turning over while you're busy with a frame.
+        queue_size : int, optional
+            Max number of frames in the capture thread's queue. When a frame arrives while the
+            queue is full, the oldest one is dropped. Keep this below `n_buffers` when not copying
+            frames, since each queued frame holds one of the driver's buffers.
+        callback : callable, optional
+            Called with no arguments by the capture thread each time it queues a frame
+
+        You can specify other parameters of live video as keyword arguments, as with
+        `start_live_video()`.
+        """
+        if copy is None or (background and not self._leases_frames):
+            copy = not self._leases_frames
+        self.start_live_video(**kwds)
+        timeout = None if timeout is None else timeout.m_as('s')
+        return FrameStream(self, n, timeout, copy, background, queue_size, callback)
+
+    @check_units(duration='?s', timeout='?s')
+    def record(self, path, n_frames=None, duration=None, format='npy-mmap', timeout='1s',
+               wait=True, **kwds):
+        """Record live video straight to a file.
+
+        Frames are taken from the driver's buffers by a writer thread, which copies them into a
+        preallocated, memory-mapped file, so long recordings needn't fit in memory. Frames that
+        arrive while the writer is behind are dropped, and counted in the returned `Recording`'s
+        ``dropped`` attribute. Load a finished recording with `load_recording()`.
+
+        Parameters
+        ----------
+        path : str
+            Path of the file to write
+        n_frames : int, optional
+            Number of frames to record
+        duration : Quantity([time]), optional
+            How long to record for. If neither `n_frames` nor `duration` is given, recording goes
+            on until you call the `Recording`'s ``stop()`` method.
+        format : {'npy-mmap', 'raw', 'hdf5'}, optional
+            Format of the file. 'npy-mmap' (the default) writes a .npy file of shape
+            *(n_frames, height, width)*, and 'raw' writes just the frames' bytes. Both save the
+            per-frame index to ``<path>.index.npy`` and a description of the recording to
+            ``<path>.json``. 'hdf5' writes the frames, the index, and the description to one HDF5
+            file, and requires h5py.
+        timeout : Quantity([time]) or None, optional
+            Max time to wait for each frame. If it's exceeded, recording stops with a TimeoutError.
+        wait : bool, optional
+            Whether to wait for the recording to finish before returning. If False, the recording
+            goes on in the background.
+
+        You can specify other parameters of live video as keyword arguments, as with
+        `start_live_video()`. For drivers with a buffer pool, more buffers (via `n_buffers`) give
+        the writer more room to fall behind without dropping frames.
+
+        Returns
+        -------
+        recording : Recording
+            The recording, with its index and count of dropped frames
+        """
+        if format not in RECORDING_FORMATS:
+            raise ValueError("format must be one of {}".format(RECORDING_FORMATS))
+
+        # Each queued frame holds a driver buffer, as do the latest frame and the one being written
+        defaults = self._defaults or self.DEFAULT_KWDS
+        queue_size = max(kwds.get('n_buffers', defaults['n_buffers']) - 2, 1)
+        stream = self.stream(n_frames, timeout, background=True, queue_size=queue_size, **kwds)
+        try:
+            recording = Recording(stream, path, n_frames,
+                                  None if duration is None else duration.m_as('s'), format)
+        except Exception:
+            stream.close()
+            raise
+
+        if wait:
+            recording.wait()
+        return recording
+
     def set_defaults(self, **kwds):
         if self._defaults is None:
             self._defaults = self.DEFAULT_KWDS.copy()
@@ -275,8 +410,64 @@ class Camera(Instrument):
 
         kwds.update(zip(names, (width, cx, left, right)))
 
+    def calibrate_pixels(self, n_frames=20, hot_stddevs=10, warm_stddevs=5, dead_fraction=0.1,
+                         **kwds):
+        """Find the hot, warm, and dead pixels of the sensor from a series of dark frames.
+
+        Each pixel's mean and variance are accumulated over `n_frames` frames, one frame at a
+        time, so the frames are never all held in memory. Pixels whose mean is more than
+        `hot_stddevs` (or `warm_stddevs`) standard deviations above the sensor's median are hot
+        (or warm), using a robust estimate of the spread of pixel means. Pixels whose variance is
+        below `dead_fraction` times the median variance (i.e. that are stuck), or whose mean is
+        more than `hot_stddevs` below the median, are dead.
+
+        Hot and dead pixels are then fixed by hot pixel correction (``fix_hotpixels=True``). Use
+        `save_hot_pixels()` to save the results.
+
+        Any other kwds are passed to `grab_image()`, and should give the capture settings (e.g.
+        ROI and binning) that the frames being corrected will use. Cover the sensor first.
+
+        Returns
+        -------
+        pixel_map : array of uint8
+            Map of the sensor, whose value for each pixel is a combination of the `HOT_PIXEL`,
+            `WARM_PIXEL`, and `DEAD_PIXEL` bits
+        """
+        stats = PixelStats()
+        for _ in range(n_frames):
+            stats.add(self.grab_image(**kwds))
+        mean, var = stats.mean, stats.variance
+
+        median = np.median(mean)
+        sigma = 1.4826 * np.median(np.abs(mean - median))  # Robust to the outliers we want to find
+        if sigma == 0:
+            sigma = np.sqrt(np.median(var))
+
+        pixel_map = np.zeros(mean.shape, dtype=np.uint8)
+        pixel_map[mean > median + warm_stddevs*sigma] = WARM_PIXEL
+        pixel_map[mean > median + hot_stddevs*sigma] = HOT_PIXEL
+        pixel_map[(var < dead_fraction*np.median(var)) |
+                  (mean < median - hot_stddevs*sigma)] |= DEAD_PIXEL
+
+        self._set_pixel_map(pixel_map)
+        return pixel_map
+
+    def _set_pixel_map(self, pixel_map):
+        self._pixel_map = pixel_map
+        self._hot_pixels = None  # Found from the map when first needed
+
+    def _get_hot_pixels(self):
+        if self._hot_pixels is None and self._pixel_map is not None:
+            # Cast to avoid the indices being longs in Py2
+            pixels = np.argwhere(self._pixel_map & CORRECTED_PIXELS)
+            self._hot_pixels = pixels.astype('int32', copy=False)
+        return self._hot_pixels
+
     def find_hot_pixels(self, stddevs=10, **kwds):
-        """Generate the list of hot pixels on the camera sensor."""
+        """Generate the list of hot pixels on the camera sensor.
+
+        This uses a single frame. For a more reliable result, use `calibrate_pixels()`.
+        """
         img = self.grab_image(**kwds)
         avg = np.mean(img)
         stddev = np.sqrt(np.var(img))
@@ -286,50 +477,166 @@ class Camera(Instrument):
 
         # Cast to avoid the indices being longs in Py2
         self._hot_pixels = pixels.astype('int32', copy=False).tolist()
+        self._pixel_map = None
 
     def save_hot_pixels(self, path=None):
-        """Save a file listing the hot pixels."""
-        if self._hot_pixels is None:
+        """Save a file listing the hot pixels.
+
+        The pixel map made by `calibrate_pixels()` is saved as a ``.npy`` file, which is memory
+        mapped when loaded. A list of hot pixels from `find_hot_pixels()` is saved as JSON, or as
+        a ``.npy`` array of indices if `path` ends in ``.npy``.
+        """
+        if self._get_hot_pixels() is None:
             raise Error("No existing list of hot pixels to save. Generate one first by using "
-                        "`find_hot_pixels()`")
+                        "`calibrate_pixels()` or `find_hot_pixels()`")
 
+        ext = '.json' if self._pixel_map is None else '.npy'
         if not path:
             if self._alias:
-                path = os.path.join(conf.user_conf_dir, 'hotpixel_{}.json'.format(self._alias))
+                path = os.path.join(conf.user_conf_dir, 'hotpixel_{}{}'.format(self._alias, ext))
             else:
-                path = 'hotpixel.json'
+                path = 'hotpixel' + ext
 
-        with open(path, 'w') as f:
-            json.dump({'hot_pixels': self._hot_pixels}, f)
+        if path.endswith('.npy'):
+            if self._pixel_map is not None:
+                np.save(path, self._pixel_map)
+            else:
+                np.save(path, np.asarray(self._hot_pixels, dtype='int32').reshape(-1, 2))
+        else:
+            with open(path, 'w') as f:
+                json.dump({'hot_pixels': np.asarray(self._get_hot_pixels()).tolist()}, f)
 
         new_path = os.path.abspath(path)
         if self._alias and self._param_dict.get('hotpixel_file', None) != new_path:
             self._param_dict['hotpixel_file'] = new_path
             self.save_instrument(self._alias, force=True)
 
-    def _correct_hot_pixels(self, img):
-        """Correct hot pixels by averaging their neighbors."""
-        if self._hot_pixels is None:
+    def _correct_hot_pixels(self, img, in_place=False):
+        """Correct hot pixels by averaging their neighbors.
+
+        Neighbors which are themselves hot pixels are left out of the average. If `in_place` is
+        True, `img` is corrected directly rather than copied first, which is only safe if it's a
+        private copy rather than a view of a driver buffer.
+        """
+        hot_pixels = self._get_hot_pixels()
+        if hot_pixels is None:
             raise Error("Could not correct hot pixels because we have no existing list of hot "
-                        "pixels. Generate one first by using `find_hot_pixels()`")
+                        "pixels. Generate one first by using `calibrate_pixels()` or "
+                        "`find_hot_pixels()`")
 
         if len(img.shape) != 2:
             raise NotImplementedError("Hot pixel correction currently implemented only for "
                                       "monochrome sensors")
 
-        # TODO: Probably shouldn't include adjacent hot pixels
-        img = img.copy()
-        for y, x in self._hot_pixels:
-            left = max(0, x-1)
-            right = min(img.shape[1], x+2)
-            top = max(0, y-1)
-            bot = min(img.shape[0], y+2)
-            img[y, x] = (img[top:bot, left:right].sum() - img[y, x])/((bot-top)*(right-left)-1)
+        plan = self._hot_pixel_plan
+        if plan is None or plan.hot_pixels is not hot_pixels or plan.shape != img.shape:
+            # The pixels are indices into the image, so a new ROI or binning changes its shape
+            plan = self._hot_pixel_plan = HotPixelPlan(hot_pixels, img.shape)
+
+        if not in_place or not img.flags.writeable:
+            img = img.copy()
+        plan.apply(img)
         return img
 
 
+class PixelStats(object):
+    """Per-pixel mean and variance of a series of frames, accumulated one frame at a time
+
+    Uses Welford's algorithm, with float32 accumulators that are allocated for the first frame and
+    updated in place for each one after that.
+    """
+    def __init__(self):
+        self.n = 0
+        self.mean = None
+        self._m2 = None  # Sum of squared differences from the mean
+
+    def add(self, frame):
+        if self.mean is None:
+            self.mean = np.zeros(frame.shape, dtype=np.float32)
+            self._m2 = np.zeros(frame.shape, dtype=np.float32)
+            self._delta = np.empty(frame.shape, dtype=np.float32)
+            self._scratch = np.empty(frame.shape, dtype=np.float32)
+        elif frame.shape != self.mean.shape:
+            raise ValueError("Frame shape {} doesn't match earlier frames' shape {}".format(
+                frame.shape, self.mean.shape))
+
+        self.n += 1
+        delta, scratch = self._delta, self._scratch
+        np.subtract(frame, self.mean, out=delta)
+        np.multiply(delta, 1. / self.n, out=scratch)
+        self.mean += scratch
+        np.subtract(frame, self.mean, out=scratch)
+        scratch *= delta
+        self._m2 += scratch
+
+    @property
+    def variance(self):
+        """Population variance of each pixel"""
+        if self.n == 0:
+            return None
+        return self._m2 / self.n
+
+
+class HotPixelPlan(object):
+    """Precomputed indices and weights for correcting hot pixels in images of a given shape
+
+    Each hot pixel is replaced by the mean of its (up to eight) neighbors, rounded for integer
+    images, leaving out any that are outside the image or are hot pixels themselves. A pixel with
+    no such neighbors is left as-is. Since hot pixels never read from each other, they can all be
+    corrected with a single gather and a single scatter, in place.
+
+    Parameters
+    ----------
+    hot_pixels : sequence of (y, x) pairs
+        Indices of the hot pixels. Any that lie outside the image are ignored.
+    shape : tuple of int
+        Shape of the images to be corrected, as (height, width)
+    """
+    OFFSETS_Y = np.array([-1, -1, -1, 0, 0, 1, 1, 1])
+    OFFSETS_X = np.array([-1, 0, 1, -1, 1, -1, 0, 1])
+
+    def __init__(self, hot_pixels, shape):
+        self.hot_pixels = hot_pixels
+        self.shape = tuple(shape)
+        height, width = self.shape
+
+        pixels = np.asarray(hot_pixels, dtype=np.intp).reshape(-1, 2)
+        ys, xs = pixels[:, 0], pixels[:, 1]
+        inside = (ys >= 0) & (ys < height) & (xs >= 0) & (xs < width)
+        hot = np.unique(ys[inside] * width + xs[inside])
+        ys, xs = hot // width, hot % width
+
+        nys = ys[:, None] + self.OFFSETS_Y
+        nxs = xs[:, None] + self.OFFSETS_X
+        valid = (nys >= 0) & (nys < height) & (nxs >= 0) & (nxs < width)
+        np.clip(nys, 0, height - 1, out=nys)
+        np.clip(nxs, 0, width - 1, out=nxs)
+        valid &= ~np.isin(nys * width + nxs, hot, assume_unique=False)
+
+        counts = valid.sum(axis=1)
+        fixable = counts > 0
+        self.ys, self.xs = ys[fixable], xs[fixable]
+        self.neighbor_ys, self.neighbor_xs = nys[fixable], nxs[fixable]
+        self.weights = valid[fixable] / counts[fixable, None].astype(float)
+
+    def apply(self, img):
+        """Correct the hot pixels of `img` in place"""
+        means = (img[self.neighbor_ys, self.neighbor_xs] * self.weights).sum(axis=1)
+        if img.dtype.kind in 'iu':
+            means = np.rint(means, out=means)
+        img[self.ys, self.xs] = means
+
+
 def _init_instrument(cam, params):
     if 'hotpixel_file' in params:
-        with open(params['hotpixel_file']) as f:
-            hotpixel_data = json.load(f)
-            cam._hot_pixels = hotpixel_data['hot_pixels']
+        path = params['hotpixel_file']
+        if path.endswith('.npy'):
+            data = np.load(path, mmap_mode='r')
+            if data.dtype == np.uint8:
+                cam._set_pixel_map(data)
+            else:
+                cam._hot_pixels = data
+        else:
+            with open(path) as f:
+                hotpixel_data = json.load(f)
+                cam._hot_pixels = hotpixel_data['hot_pixels']
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Nate Bogdanowicz
+"""
+Frame buffers shared between camera drivers and the code that uses their frames.
+"""
+import time
+import threading
+import weakref
+import numpy as np
+
+from ...errors import Error
+
+__all__ = ['Frame', 'FramePool']
+
+# Weak references whose callbacks release leases, kept alive until they fire. Keyed by id, since
+# refs to arrays aren't hashable.
+_lease_refs = {}
+
+
+def _release_when_collected(frame, lease):
+    def callback(ref):
+        _lease_refs.pop(id(ref), None)
+        lease.release()
+    ref = weakref.ref(frame, callback)
+    _lease_refs[id(ref)] = ref
+
+
+class Frame(np.ndarray):
+    """An image frame from live video, as a numpy array
+
+    A frame gotten with ``copy=False`` views a driver buffer directly, and holds a lease on it: the
+    camera won't write to the buffer again until the lease is released. That happens when you call
+    `release()` (or leave a ``with frame:`` block), or once the frame and any views of it have been
+    garbage collected. Don't use the frame's data after releasing it.
+
+    Attributes
+    ----------
+    seq : int
+        Sequence number of the frame, counting from 1 at the start of acquisition. Dropped frames
+        are counted too, so a gap in the sequence means frames were dropped.
+    timestamp : float
+        Time at which the driver received the frame, as given by `time.time()`
+    dropped : int
+        Number of frames dropped so far during this acquisition, i.e. that arrived (or that the
+        camera reported missing) but were never handed out
+    """
+    def __array_finalize__(self, obj):
+        self.seq = getattr(obj, 'seq', None)
+        self.timestamp = getattr(obj, 'timestamp', None)
+        self.dropped = getattr(obj, 'dropped', None)
+        # Views share the lease, but new arrays (e.g. the results of arithmetic) don't
+        lease = getattr(obj, '_lease', None)
+        self._lease = lease if lease is not None and np.may_share_memory(self, obj) else None
+
+    def release(self):
+        """Give the frame's buffer back to the camera. Does nothing if it's a copy."""
+        if self._lease is not None:
+            self._lease.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.release()
+
+
+class _Slot(object):
+    """A buffer holding a frame, and the state of the leases on it"""
+    __slots__ = ('buffer', 'array', 'seq', 'timestamp', 'dropped', 'refs', 'is_latest', 'taken')
+
+    def __init__(self, buffer, array, seq, timestamp, dropped):
+        self.buffer = buffer
+        self.array = array
+        self.seq = seq
+        self.timestamp = timestamp
+        self.dropped = dropped
+        self.refs = 0  # Number of unreleased leases
+        self.is_latest = True
+        self.taken = False  # Whether the frame has been handed out
+
+
+class _Lease(object):
+    __slots__ = ('pool', 'slot', 'released', '__weakref__')
+
+    def __init__(self, pool, slot):
+        self.pool = pool
+        self.slot = slot
+        self.released = False
+
+    def release(self):
+        with self.pool.lock:
+            if self.released:
+                return
+            self.released = True
+            self.slot.refs -= 1
+        self.pool._check_done(self.slot)
+
+
+class FramePool(object):
+    """Buffers shared between a camera driver and the frames it hands out in live mode
+
+    The driver gives each of its buffers to the camera, and `push()`es each one back to the pool
+    once the camera has written a frame to it. The most recent frame is the pool's latest frame,
+    which `latest()` returns, either as a copy or as a `Frame` that leases the buffer. A buffer is
+    given back to the camera via `requeue` as soon as it's no longer the latest frame and all of its
+    leases have been released.
+
+    A frame that's replaced by a newer one before being handed out is counted as dropped, as are
+    any frames that the camera reports having missed.
+
+    Parameters
+    ----------
+    requeue : callable
+        Called with a buffer to give it back to the camera
+    free : callable, optional
+        Called with a buffer to free it, once the pool has been closed and the buffer is no longer
+        in use
+    """
+    def __init__(self, requeue, free=None):
+        self._requeue = requeue
+        self._free = free
+        self.lock = threading.RLock()
+        self.closed = False
+        self.seq = 0  # Sequence number of the latest frame
+        self.dropped = 0
+        self._latest = None
+        self._held = []  # Slots not with the camera
+        self._last_number = None
+
+    def push(self, buffer, array, frame_number=None):
+        """Add a frame that the camera has written to `buffer`
+
+        Parameters
+        ----------
+        buffer : object
+            The driver's buffer, as passed to `requeue`
+        array : ndarray
+            Array that views the frame's data in `buffer`
+        frame_number : int, optional
+            The camera's own count of the frames it has acquired, if it has one. Gaps in this
+            count are treated as dropped frames.
+        """
+        with self.lock:
+            if frame_number is not None and self._last_number is not None:
+                missed = max(frame_number - self._last_number - 1, 0)
+                self.seq += missed
+                self.dropped += missed
+            self._last_number = frame_number
+
+            old = self._latest
+            if old is not None:
+                old.is_latest = False
+                if not old.taken:
+                    self.dropped += 1
+
+            self.seq += 1
+            self._latest = _Slot(buffer, array, self.seq, time.time(), self.dropped)
+            self._held.append(self._latest)
+        if old is not None:
+            self._check_done(old)
+
+    def has_frame(self):
+        """Whether there's a latest frame"""
+        return self._latest is not None
+
+    def latest(self, copy=True):
+        """Get the latest frame, as a `Frame`
+
+        If `copy` is True, the frame is a copy of the buffer's data. Otherwise it views the buffer
+        directly, leasing it until the frame is released.
+        """
+        with self.lock:
+            slot = self._latest
+            if slot is None:
+                raise Error("No frame has been received yet")
+            slot.taken = True
+            slot.refs += 1
+            lease = _Lease(self, slot)
+
+        if copy:
+            try:
+                frame = np.array(slot.array).view(Frame)
+            finally:
+                lease.release()
+        else:
+            frame = slot.array.view(Frame)
+            frame._lease = lease
+            _release_when_collected(frame, lease)
+
+        frame.seq, frame.timestamp, frame.dropped = slot.seq, slot.timestamp, slot.dropped
+        return frame
+
+    def latest_buffer(self):
+        """Get the buffer holding the latest frame, or None if there isn't one"""
+        slot = self._latest
+        return None if slot is None else slot.buffer
+
+    def leased_buffers(self):
+        """Get the buffers with unreleased leases"""
+        with self.lock:
+            return [slot.buffer for slot in self._held if slot.refs > 0]
+
+    def _check_done(self, slot):
+        """Give `slot`'s buffer back to the camera (or free it) if it's no longer in use"""
+        with self.lock:
+            if slot.refs > 0 or slot.is_latest or slot not in self._held:
+                return
+            self._held.remove(slot)
+            done = self._free if self.closed else self._requeue
+        if done is not None:
+            done(slot.buffer)
+
+    def close(self):
+        """Stop handing buffers back to the camera, e.g. because acquisition has stopped
+
+        Leased buffers are freed via `free` once their leases are released. All other buffers
+        are the driver's responsibility again.
+
+        Returns
+        -------
+        A list of the buffers that the pool held, but that weren't leased
+        """
+        with self.lock:
+            self.closed = True
+            if self._latest is not None:
+                self._latest.is_latest = False
+                self._latest = None
+            unleased = [slot for slot in self._held if slot.refs == 0]
+            for slot in unleased:
+                self._held.remove(slot)
+        return [slot.buffer for slot in unleased]
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Nate Bogdanowicz
+"""
+Recording of live video straight to disk, as done by `Camera.record()`.
+
+Frames are written to a file that's preallocated and memory mapped, so each frame is copied once,
+from the driver's buffer into the file's pages, and the OS writes it out in the background. The
+file grows (by doubling) when a recording outlasts its preallocated size, and is trimmed to the
+frames actually written once it's done.
+
+Each recording also has an index, giving the sequence number, timestamp, and dropped-frame count
+of each frame. For the 'raw' and 'npy-mmap' formats, the index is saved alongside the data as
+``<path>.index.npy``, along with a ``<path>.json`` file describing the recording. The 'hdf5'
+format keeps everything in the one file.
+"""
+import os
+import json
+import time
+import threading
+
+import numpy as np
+
+from ...errors import Error
+from ...log import get_logger
+
+log = get_logger(__name__)
+
+__all__ = ['Recording', 'load_recording']
+
+FORMATS = ('raw', 'npy-mmap', 'hdf5')
+
+# Number of frames preallocated for a recording with no set length
+INITIAL_FRAMES = 64
+
+INDEX_DTYPE = np.dtype([('seq', np.int64), ('timestamp', np.float64), ('dropped', np.int64)])
+
+NPY_HEADER_SIZE = 128  # Fixed, so the header can be rewritten once the frame count is known
+
+
+def _npy_header(dtype, shape):
+    """Make a version 1.0 .npy header, padded to `NPY_HEADER_SIZE` bytes"""
+    header = "{{'descr': {!r}, 'fortran_order': False, 'shape': {!r}, }}".format(
+        np.lib.format.dtype_to_descr(dtype), tuple(shape))
+    pad = NPY_HEADER_SIZE - len(np.lib.format.MAGIC_PREFIX) - 4 - len(header) - 1
+    if pad < 0:
+        raise Error("Frame shape {} is too large for a .npy header".format(shape))
+    header = (header + ' '*pad + '\n').encode('latin1')
+    return np.lib.format.magic(1, 0) + np.array(len(header), '<u2').tobytes() + header
+
+
+class _MemmapWriter(object):
+    """Appends frames to a preallocated, memory-mapped file"""
+    header_size = 0
+
+    def __init__(self, path, capacity):
+        self.path = path
+        self.capacity = capacity
+        self.n_frames = 0
+        self.frames = None
+        self.file = None
+
+    def _start(self, frame):
+        self.shape, self.dtype = frame.shape, frame.dtype
+        self.frame_nbytes = frame.nbytes
+        self.file = open(self.path, 'wb+')
+        self.file.write(self._header(self.capacity))
+        self._resize(self.capacity)
+
+    def _header(self, n_frames):
+        return b''
+
+    def _resize(self, capacity):
+        self.frames = None  # Unmap before resizing
+        old_size = os.fstat(self.file.fileno()).st_size
+        size = self.header_size + capacity*self.frame_nbytes
+        self.file.truncate(size)
+        if hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(self.file.fileno(), old_size, size - old_size)
+        self.capacity = capacity
+        self.frames = np.memmap(self.file, self.dtype, 'r+', self.header_size,
+                                (capacity,) + self.shape)
+
+    def append(self, frame):
+        if self.file is None:
+            self._start(frame)
+        elif frame.shape != self.shape or frame.dtype != self.dtype:
+            raise Error("Frame has shape {} and dtype {}, but the recording has shape {} and dtype "
+                        "{}".format(frame.shape, frame.dtype, self.shape, self.dtype))
+
+        if self.n_frames == self.capacity:
+            self._resize(2*self.capacity)
+        self.frames[self.n_frames] = frame
+        self.n_frames += 1
+
+    def close(self, index, metadata):
+        """Trim the file to the frames written, and save the index and metadata"""
+        if self.file is not None:
+            self.frames.flush()
+            self.frames = None
+            self.file.truncate(self.header_size + self.n_frames*self.frame_nbytes)
+            self.file.seek(0)
+            self.file.write(self._header(self.n_frames))
+            self.file.close()
+            metadata.update(dtype=self.dtype.str, shape=list(self.shape))
+
+        np.save(self.path + '.index.npy', index)
+        with open(self.path + '.json', 'w') as f:
+            json.dump(metadata, f, indent=2)
+
+
+class _RawWriter(_MemmapWriter):
+    pass
+
+
+class _NpyWriter(_MemmapWriter):
+    header_size = NPY_HEADER_SIZE
+
+    def _header(self, n_frames):
+        return _npy_header(self.dtype, (n_frames,) + self.shape)
+
+
+class _HDF5Writer(object):
+    """Appends frames to a chunked HDF5 dataset, which is resized like the memory-mapped files"""
+    def __init__(self, path, capacity):
+        try:
+            import h5py
+        except ImportError:
+            raise Error("Recording to HDF5 requires the h5py package")
+        self.path = path
+        self.capacity = capacity
+        self.n_frames = 0
+        self.file = h5py.File(path, 'w')
+        self.frames = None
+
+    def append(self, frame):
+        if self.frames is None:
+            self.frames = self.file.create_dataset(
+                'frames', (self.capacity,) + frame.shape, frame.dtype,
+                maxshape=(None,) + frame.shape, chunks=(1,) + frame.shape)
+        if self.n_frames == self.capacity:
+            self.capacity *= 2
+            self.frames.resize(self.capacity, axis=0)
+        self.frames.write_direct(np.ascontiguousarray(frame), dest_sel=np.s_[self.n_frames])
+        self.n_frames += 1
+
+    def close(self, index, metadata):
+        if self.frames is not None:
+            self.frames.resize(self.n_frames, axis=0)
+        self.file.create_dataset('index', data=index)
+        self.file.attrs.update(metadata)
+        self.file.close()
+
+
+_WRITERS = {'raw': _RawWriter, 'npy-mmap': _NpyWriter, 'hdf5': _HDF5Writer}
+
+
+class Recording(object):
+    """A recording of a camera's live video to a file, as made by `Camera.record()`
+
+    The frames are written on a writer thread, which takes them from a `FrameStream` of the
+    camera. Call `wait()` to wait for the recording to finish, or `stop()` to end it early.
+
+    Attributes
+    ----------
+    path : str
+        Path of the file that the frames are written to
+    format : str
+        Format of the file: 'raw', 'npy-mmap', or 'hdf5'
+    n_frames : int
+        Number of frames written so far
+    dropped : int
+        Number of frames dropped so far, either by the camera, or because the writer fell behind
+    done : bool
+        Whether the recording has finished
+    """
+    def __init__(self, stream, path, n_frames=None, duration=None, format='npy-mmap'):
+        if format not in _WRITERS:
+            raise ValueError("format must be one of {}".format(FORMATS))
+        self.stream = stream
+        self.path = path
+        self.format = format
+        self.duration = duration
+        self.n_frames = 0
+        self.done = False
+        self._error = None
+        self._stopped = threading.Event()
+
+        capacity = n_frames or INITIAL_FRAMES
+        self._writer = _WRITERS[format](path, capacity)
+        self._index = np.zeros(capacity, INDEX_DTYPE)
+        self._thread = threading.Thread(target=self._write, name='Recording writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __repr__(self):
+        return "<Recording of {} frames to '{}'>".format(self.n_frames, self.path)
+
+    @property
+    def dropped(self):
+        return self.stream.dropped
+
+    def _write(self):
+        start = time.time()
+        try:
+            for frame in self.stream:
+                timestamp = getattr(frame, 'timestamp', None) or time.time()
+                self._writer.append(frame)
+                if hasattr(frame, 'release'):
+                    frame.release()
+
+                if self.n_frames == len(self._index):
+                    self._index = np.resize(self._index, 2*len(self._index))
+                self._index[self.n_frames] = (self.stream.seq, timestamp, self.stream.dropped)
+                self.n_frames += 1
+
+                if self._stopped.is_set() or (self.duration is not None and
+                                              timestamp - start >= self.duration):
+                    break
+        except Exception as e:
+            if not self._stopped.is_set():  # Otherwise it's from stop() closing the stream
+                log.info("Recording to '%s' failed: %s", self.path, e)
+                self._error = e
+        finally:
+            self.stream.close()
+            try:
+                metadata = dict(format=self.format, n_frames=self.n_frames, dropped=self.dropped,
+                                start_time=start)
+                self._writer.close(self._index[:self.n_frames], metadata)
+            except Exception as e:
+                self._error = self._error or e
+            self.done = True
+
+    def wait(self, timeout=None):
+        """Wait for the recording to finish, raising any error that ended it
+
+        Returns True if it has finished, or False if `timeout` (in seconds) was reached first.
+        """
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            return False
+        if self._error is not None:
+            raise self._error
+        return True
+
+    def stop(self):
+        """End the recording early, and wait for it to finish"""
+        self._stopped.set()
+        self.stream.close()
+        self.wait()
+
+    @property
+    def index(self):
+        """Structured array with the 'seq', 'timestamp', and 'dropped' of each frame written"""
+        return self._index[:self.n_frames]
+
+    def load(self):
+        """Load the finished recording. See `load_recording()`."""
+        if not self.done:
+            raise Error("Recording is not finished yet")
+        return load_recording(self.path)
+
+
+def load_recording(path):
+    """Load a recording made by `Camera.record()`
+
+    Returns (frames, index), where `frames` is a read-only, memory-mapped array of the frames (or
+    an h5py Dataset, for HDF5 recordings), and `index` is the structured array described in
+    `Recording.index`.
+    """
+    if not os.path.exists(path + '.json'):
+        import h5py
+        f = h5py.File(path, 'r')
+        return f['frames'], f['index'][...]
+
+    with open(path + '.json') as f:
+        metadata = json.load(f)
+    index = np.load(path + '.index.npy')
+    if metadata['n_frames'] == 0:
+        return np.zeros((0,) + tuple(metadata.get('shape', ())), metadata.get('dtype', 'u1')), index
+    elif metadata['format'] == 'npy-mmap':
+        return np.load(path, mmap_mode='r'), index
+    shape = (metadata['n_frames'],) + tuple(metadata['shape'])
+    return np.memmap(path, metadata['dtype'], 'r', shape=shape), index
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Nate Bogdanowicz
+"""
+Streams of live video frames, as made by `Camera.stream()`.
+"""
+import time
+import threading
+from collections import deque
+
+from ... import Q_
+from ...errors import Error, TimeoutError
+from ...log import get_logger
+
+log = get_logger(__name__)
+
+__all__ = ['FrameStream']
+
+# How often (in seconds) a capture thread checks whether its stream has been closed
+POLL_INTERVAL = 0.1
+
+# Number of recent frames over which the rate and latency are measured
+STATS_WINDOW = 100
+
+
+def _release(frame):
+    release = getattr(frame, 'release', None)
+    if release is not None:
+        release()
+
+
+class FrameStream(object):
+    """Frames from a camera in live mode, as made by `Camera.stream()`
+
+    Read frames with `get()` or by iterating over the stream (including with ``async for``). The
+    stream stops the camera's live video once it has given `n` frames, or when it's closed.
+
+    With a capture thread, frames are pulled from the camera in the background into a queue of at
+    most `queue_size` frames, whose oldest frame is dropped whenever a new one arrives while it's
+    full. Without one, each frame is waited for when it's asked for.
+
+    `seq` is the sequence number of the last frame read, and `dropped` is the number of frames
+    dropped so far, both by the camera or driver and by the stream's queue.
+    """
+    def __init__(self, camera, n=None, timeout=1., copy=False, background=False, queue_size=2,
+                 callback=None):
+        self.camera = camera
+        self.n = n
+        self.timeout = timeout
+        self.copy = copy
+        self.callback = callback
+        self.seq = None
+        self.dropped = 0
+        self.n_frames = 0
+        self.closed = False
+        self._last_seq = None  # Sequence number of the last frame gotten from the camera
+        self._deliveries = deque(maxlen=STATS_WINDOW)  # (time, latency) of recent frames
+        self._lock = threading.Lock()
+
+        self._thread = None
+        if background:
+            self._queue = deque()
+            self._queue_size = max(queue_size, 1)
+            self._cond = threading.Condition()
+            self._error = None
+            self._thread = threading.Thread(target=self._capture, name='FrameStream capture')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def __repr__(self):
+        return "<FrameStream from {!r}>".format(self.camera)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __iter__(self):
+        try:
+            while not self._finished():
+                yield self.get()
+        finally:
+            self.close()
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        """Await the next frame, waiting for it on the event loop's default executor"""
+        import asyncio
+        return asyncio.get_event_loop().run_in_executor(None, self._anext)
+
+    def _anext(self):
+        if self._finished():
+            self.close()
+            raise StopAsyncIteration
+        return self.get()
+
+    def _finished(self):
+        return self.closed or (self.n is not None and self.n_frames >= self.n)
+
+    def _fetch(self, timeout):
+        """Get a new frame from the camera, as (frame, timestamp), or None if there isn't one"""
+        if not self.camera.wait_for_frame(None if timeout is None else Q_(timeout, 's')):
+            return None
+        frame = self.camera.latest_frame(copy=self.copy)
+
+        # Drivers with a FramePool give frames with a sequence number and timestamp
+        seq = getattr(frame, 'seq', None)
+        if seq is not None:
+            if self._last_seq is not None:
+                with self._lock:
+                    self.dropped += max(seq - self._last_seq - 1, 0)
+            self._last_seq = seq
+        timestamp = getattr(frame, 'timestamp', None) or time.time()
+        return frame, timestamp
+
+    def _deliver(self, item):
+        frame, timestamp = item
+        now = time.time()
+        with self._lock:
+            self.n_frames += 1
+            self._deliveries.append((now, now - timestamp))
+        self.seq = getattr(frame, 'seq', self.n_frames)
+        return frame
+
+    def _capture(self):
+        try:
+            while not self.closed:
+                item = self._fetch(POLL_INTERVAL)
+                if item is None:
+                    continue
+
+                with self._cond:
+                    if len(self._queue) >= self._queue_size:
+                        old_frame, _ = self._queue.popleft()
+                        _release(old_frame)
+                        with self._lock:
+                            self.dropped += 1
+                    self._queue.append(item)
+                    self._cond.notify()
+
+                if self.callback is not None:
+                    self.callback()
+        except Exception as e:
+            log.info("Capture thread of %r failed: %s", self, e)
+            with self._cond:
+                self._error = e
+                self._cond.notify_all()
+
+    def get(self):
+        """Get the next frame, waiting up to the stream's timeout for it
+
+        Raises a TimeoutError if no frame arrives in time.
+        """
+        if self.closed:
+            raise Error("Stream is closed")
+
+        if self._thread is None:
+            item = self._fetch(self.timeout)
+        else:
+            deadline = None if self.timeout is None else time.time() + self.timeout
+            with self._cond:
+                while not self._queue and self._error is None and not self.closed:
+                    remaining = None if deadline is None else deadline - time.time()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._queue:
+                    item = self._queue.popleft()
+                elif self._error is not None:
+                    raise self._error
+                elif self.closed:
+                    raise Error("Stream is closed")
+                else:
+                    item = None
+
+        if item is None:
+            raise TimeoutError("Timed out while waiting for a frame")
+        return self._deliver(item)
+
+    def get_async(self):
+        """Await the next frame, waiting for it on the event loop's default executor"""
+        import asyncio
+        return asyncio.get_event_loop().run_in_executor(None, self.get)
+
+    def poll(self):
+        """Get the newest frame without waiting, or None if there isn't a new one
+
+        With a capture thread, any older frames waiting in the queue are dropped. This is useful
+        for GUIs, e.g. when called from a `callback` that the capture thread uses to signal the GUI
+        thread.
+        """
+        if self.closed:
+            return None
+
+        if self._thread is None:
+            item = self._fetch(0)
+        else:
+            with self._cond:
+                items = list(self._queue)
+                self._queue.clear()
+            for old_frame, _ in items[:-1]:
+                _release(old_frame)
+            with self._lock:
+                self.dropped += max(len(items) - 1, 0)
+            item = items[-1] if items else None
+
+        return None if item is None else self._deliver(item)
+
+    def stats(self):
+        """Get the stream's statistics
+
+        Returns a dict with 'frames', the number of frames read, 'dropped', the number of frames
+        dropped, and 'fps' and 'latency', the rate at which frames were read and the mean time
+        from the driver receiving a frame to its being read. The last two are measured over the
+        most recent frames, and are None until there are enough frames to measure them.
+        """
+        with self._lock:
+            deliveries = list(self._deliveries)
+            stats = {'frames': self.n_frames, 'dropped': self.dropped, 'fps': None,
+                     'latency': None}
+
+        if len(deliveries) > 1 and deliveries[-1][0] > deliveries[0][0]:
+            elapsed = deliveries[-1][0] - deliveries[0][0]
+            stats['fps'] = Q_((len(deliveries) - 1) / elapsed, 'Hz')
+        if deliveries:
+            latency = sum(latency for _, latency in deliveries) / len(deliveries)
+            stats['latency'] = Q_(latency, 's')
+        return stats
+
+    def close(self):
+        """Stop the stream and the camera's live video"""
+        if self.closed:
+            return
+        self.closed = True
+
+        if self._thread is not None:
+            with self._cond:
+                self._cond.notify_all()
+            if threading.current_thread() is not self._thread:
+                self._thread.join()
+            with self._cond:
+                for frame, _ in self._queue:
+                    _release(frame)
+                self._queue.clear()
+
+        self.camera.stop_live_video()
@@ -17,7 +17,7 @@ from cffi import FFI, cparser
 from pycparser import CParser
 from nicelib import NiceLib, Sig, NiceObject, RetHandler
 
-from . import Camera
+from . import Camera, FramePool
 from ..util import as_enum, unit_mag, check_units
 from .. import ParamSet
 from ...errors import Error, TimeoutError, PCOError
@@ -257,10 +257,12 @@ class PCO_Camera(Camera):
 
     DEFAULT_KWDS = Camera.DEFAULT_KWDS.copy()
     DEFAULT_KWDS.update(trig='software', rising=True)
+    _leases_frames = True
 
     def _initialize(self):
         self.buffers = []
         self.queue = []
+        self._frames = None  # FramePool used in live mode
         self._partial_sequence = []
         self._buf_size = 0
         self.shutter = None
@@ -528,10 +530,28 @@ class PCO_Camera(Camera):
             self.buffers.append(BufferInfo(bufnum, buf_p, event))
 
     def _free_buffers(self):
+        # Buffers that are still leased get freed by the pool once they're released
+        self._close_frame_pool()
+        leased = self._frames.leased_buffers() if self._frames is not None else []
         for buf in self.buffers:
-            self._cam.FreeBuffer(buf.num)
+            if buf not in leased:
+                self._cam.FreeBuffer(buf.num)
         self.buffers = []
 
+    def _close_frame_pool(self):
+        """Stop the pool from giving buffers back to the camera"""
+        if self._frames is not None:
+            self._frames.close()
+
+    def _free_leased_buffer(self, buf):
+        self._cam.FreeBuffer(buf.num)
+
+    def _buffer_array(self, buf):
+        """Get an array that views the frame in `buf` (currently assumes mono16)"""
+        width, height, _, _ = self._get_sizes()
+        array = np.frombuffer(memoryview(ffi.buffer(buf.address, self._frame_size())), np.uint16)
+        return array.reshape((height, width))
+
     def _clear_queue(self):
         self.queue = []
         self._cam.CancelImages()
@@ -630,7 +650,8 @@ class PCO_Camera(Camera):
                     break
 
             if copy:
-                image_buf = memoryview(ffi.buffer(buf.address, frame_size)[:])
+                # Writable, so hot pixels can be fixed without another copy
+                image_buf = memoryview(bytearray(ffi.buffer(buf.address, frame_size)))
             else:
                 image_buf = memoryview(ffi.buffer(buf.address, frame_size))
 
@@ -639,7 +660,7 @@ class PCO_Camera(Camera):
             array = array.reshape((height, width))
 
             if kwds['fix_hotpixels']:
-                array = self._correct_hot_pixels(array)
+                array = self._correct_hot_pixels(array, in_place=copy)
 
             # Handle soft ROI
             left, top = self._roi_trim_left, self._roi_trim_top
@@ -701,8 +722,19 @@ class PCO_Camera(Camera):
             self._cam.CamLinkSetImageParameters(width, height)
 
         self.shutter = 'continuous'
-        if self._frame_size() != self._buf_size or len(self.buffers) < 2:
-            self._allocate_buffers(nbufs=2)
+        nbufs = max(kwds['n_buffers'], 2)
+
+        # A closed pool frees its leased buffers once they're released, so those can't be reused
+        self._close_frame_pool()
+        leased = self._frames.leased_buffers() if self._frames is not None else []
+        if self._frame_size() != self._buf_size or len(self.buffers) != nbufs or leased:
+            self._allocate_buffers(nbufs=nbufs)
+        else:
+            # Reuse the buffers, which are all queued again below
+            if self._cam.GetRecordingState():
+                self._cam.SetRecordingState(0)
+            self._clear_queue()
+        self._frames = FramePool(requeue=self._push_on_queue, free=self._free_leased_buffer)
         self._cam.ArmCamera()
 
         # Counterintuitively we have to start recording before adding the image
@@ -723,6 +755,7 @@ class PCO_Camera(Camera):
         self._cam.ForceTrigger()
 
     def stop_live_video(self):
+        self._close_frame_pool()
         self._cam.SetRecordingState(0)
         self._clear_queue()
         self._free_buffers()
@@ -731,6 +764,9 @@ class PCO_Camera(Camera):
     @unit_mag(timeout='?ms')
     def wait_for_frame(self, timeout=None):
         if not self.queue:
+            if self.shutter == 'continuous':
+                raise Error("All buffers are held by leased frames. Release some frames, or use "
+                            "more buffers via the `n_buffers` parameter")
             raise Exception("No queued buffers!")
 
         timeout = winlib.INFINITE if timeout is None else max(0, timeout)
@@ -751,20 +787,18 @@ class PCO_Camera(Camera):
         self.last_buffer = self.queue.pop(0)  # Pop and save only on success
 
         if self.shutter == 'continuous':
-            self._push_on_queue(buf)  # Add buf back to the end of the queue
+            # The pool adds buf back to the end of the queue once it's no longer in use
+            self._frames.push(buf, self._buffer_array(buf))
 
         return True
 
     def latest_frame(self, copy=True):
-        buf_info = self.last_buffer
-        if copy:
-            buf = memoryview(ffi.buffer(buf_info.address, self._frame_size())[:])
+        if self._frames is not None and not self._frames.closed:  # In live mode
+            array = self._frames.latest(copy)
         else:
-            buf = memoryview(ffi.buffer(buf_info.address, self._frame_size()))
-
-        width, height, _, _ = self._get_sizes()
-        array = np.frombuffer(buf, np.uint16)
-        array = array.reshape((height, width))
+            array = self._buffer_array(self.last_buffer)
+            if copy:
+                array = array.copy()
 
         # Handle soft ROI
         left, top = self._roi_trim_left, self._roi_trim_top
@@ -407,14 +407,16 @@ class Pixelfly(Camera):
                 raise TimeoutError
 
             if copy:
-                buf = memoryview(ffi.buffer(self._bufptrs[self._buf_i], self._frame_size())[:])
+                # Writable, so hot pixels can be fixed without another copy
+                buf = memoryview(bytearray(ffi.buffer(self._bufptrs[self._buf_i],
+                                                      self._frame_size())))
             else:
                 buf = memoryview(ffi.buffer(self._bufptrs[self._buf_i], self._frame_size()))
 
             arrays = self._arrays_from_buffer(buf)
 
             if kwds['fix_hotpixels']:
-                arrays = [self._correct_hot_pixels(a) for a in arrays]
+                arrays = [self._correct_hot_pixels(a, in_place=copy) for a in arrays]
 
             # Software ROI
             kwds = self._last_kwds
@@ -10,7 +10,7 @@ import numpy as np
 from cffi import FFI
 from enum import Enum
 
-from . import Camera
+from . import Camera, FramePool
 from ..util import as_enum, unit_mag, check_units
 from .. import ParamSet, register_cleanup
 from ...errors import Error, TimeoutError
@@ -364,6 +364,7 @@ def _ro_property(param):
 class TSI_Camera(Camera):
     DEFAULT_KWDS = Camera.DEFAULT_KWDS.copy()
     DEFAULT_KWDS.update(trig='auto', rising=True)
+    _leases_frames = True
 
     class TriggerMode(Enum):
         auto = OpMode.NORMAL
@@ -383,6 +384,7 @@ class TSI_Camera(Camera):
         self._next_frame_idx = 0
         self._tot_frames = None  # Zero means 'infinite' capture
         self._trig_mode = None
+        self._frames = None  # FramePool of the SDK's images
         self._dev = sdk.GetCamera(self._paramset.get('number', 0))
 
         if self._dev.Status() != Status.CLOSED:
@@ -393,6 +395,7 @@ class TSI_Camera(Camera):
 
     def close(self):
         log.info('Closing TSI camera...')
+        self._close_frame_pool()
         self._dev.Stop()
         self._dev.Close()
 
@@ -435,11 +438,13 @@ class TSI_Camera(Camera):
         try:
             images = self.get_captured_image(timeout=timeout, copy=copy, **kwds)
         finally:
+            self._close_frame_pool()
             self._dev.Stop()
         return images
 
     def cancel_capture(self):
         """Cancel a capture sequence, cleaning up and stopping the camera"""
+        self._close_frame_pool()
         self._dev.Stop()
 
     @check_units(timeout='?ms')
@@ -469,6 +474,7 @@ class TSI_Camera(Camera):
         image_arrs = self._partial_sequence + image_arrs
 
         if self._tot_frames and self._next_frame_idx >= self._tot_frames:
+            self._close_frame_pool()
             self._dev.Stop()
             self._partial_sequence = []
 
@@ -488,7 +494,9 @@ class TSI_Camera(Camera):
         self._partial_sequence = []
         self._next_frame_idx = 0
 
+        self._close_frame_pool()
         self._dev.Stop()  # Ensure old captures are finished
+        self._frames = FramePool(requeue=self._dev.FreeImage, free=self._dev.FreeImage)
         self._dev.Start()
 
     @unit_mag(timeout='?s')
@@ -499,7 +507,9 @@ class TSI_Camera(Camera):
         while True:
             img = self._dev.GetPendingImage()
             if img != ffi.NULL:
-                self._latest_tsi_img = img
+                # The pool frees the image once it's no longer in use
+                array = self._arr_from_img_struct(img)
+                self._frames.push(img, array, frame_number=img.m_FrameNumber)
                 self._next_frame_idx += 1
                 return True
 
@@ -508,23 +518,21 @@ class TSI_Camera(Camera):
                 return False
 
     def latest_frame(self, copy=True):
-        # Frees the TSI image buffer if `copy` is true. Otherwise, it's the user's responsibility
-        # If no buffers are available for use, the frame count will never increment, and
+        # If all of the SDK's images are leased, the frame count will never increment, and
         # wait_for_frame will block (until its timeout is reached)
-        img = self._arr_from_img_struct(self._latest_tsi_img, copy)
-        self._dev.FreeImage(self._latest_tsi_img)
-        return img
+        return self._frames.latest(copy)
 
-    def _arr_from_img_struct(self, tsi_img, copy):
+    def _close_frame_pool(self):
+        """Stop the pool from freeing images as they're replaced, and free the unleased ones"""
+        if self._frames is not None:
+            for img in self._frames.close():
+                self._dev.FreeImage(img)
+
+    def _arr_from_img_struct(self, tsi_img):
         p_buf = tsi_img.m_PixelData.ui16
         # Note: m_SizeInBytes doesn't seem to work correctly
         frame_size = tsi_img.m_Width * tsi_img.m_Height * tsi_img.m_BytesPerPixel
-        self._tsi_img = tsi_img
-
-        if copy:
-            image_buf = memoryview(ffi.buffer(p_buf, frame_size)[:])
-        else:
-            image_buf = memoryview(ffi.buffer(p_buf, frame_size))
+        image_buf = memoryview(ffi.buffer(p_buf, frame_size))
 
         # Convert to array (currently assumes mono16)
         array = np.frombuffer(image_buf, np.uint16)
@@ -539,13 +547,17 @@ class TSI_Camera(Camera):
         self._set_trig_mode(self.TriggerMode.auto)
         self._set_exposure_time(kwds['exposure_time'])
         self._set_n_frames(0)
+        self._set_parameter(Param.NUM_IMAGE_BUFFERS, max(kwds['n_buffers'], 2))
         self._tot_frames = 0
         self._next_frame_idx = 0
 
+        self._close_frame_pool()
         self._dev.Stop()  # Ensure old captures are finished
+        self._frames = FramePool(requeue=self._dev.FreeImage, free=self._dev.FreeImage)
         self._dev.Start()
 
     def stop_live_video(self):
+        self._close_frame_pool()
         self._dev.Stop()
 
     def _set_trig_mode(self, mode, rising=True):
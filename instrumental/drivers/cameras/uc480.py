@@ -16,7 +16,7 @@ import win32event  # req: pywin32
 from nicelib import (NiceLib, NiceObject, load_lib,
                      RetHandler, Sig, ret_return)  # req: nicelib >= 0.5
 
-from . import Camera
+from . import Camera, FramePool
 from ..util import check_units
 from .. import ParamSet, Facet
 from ...errors import (InstrumentNotFoundError, Error, TimeoutError, LibError,
@@ -163,6 +163,7 @@ class NiceUC480(NiceLib):
         HasVideoStarted = Sig('in', 'out')
         InitEvent = Sig('in', 'in', 'in')
         InitImageQueue = Sig('in', 'in')
+        LockSeqBuf = Sig('in', 'in', 'in')
         ParameterSet = Sig('in', 'in', 'inout', 'in')
         ResetToDefault = Sig('in')
         SetAutoParameter = Sig('in', 'in', 'inout', 'inout')
@@ -178,6 +179,7 @@ class NiceUC480(NiceLib):
         SetSubSampling = Sig('in', 'in', ret=cmd_ret_handler('IS_GET_*SUBSAMPLING*'))
         SetTriggerDelay = Sig('in', 'in', ret=cmd_ret_handler('IS_GET_*TRIGGER*'))
         StopLiveVideo = Sig('in', 'in')
+        UnlockSeqBuf = Sig('in', 'in', 'in')
         SetHardwareGain = Sig('in', 'in', 'in', 'in', 'in',
                               ret=cmd_ret_handler(
                                   ('IS_GET_MASTER_GAIN', 'IS_GET_RED_GAIN', 'IS_GET_GREEN_GAIN',
@@ -574,6 +576,7 @@ class UC480_Camera(Camera):
     """A uc480-supported Camera"""
     DEFAULT_KWDS = Camera.DEFAULT_KWDS.copy()
     DEFAULT_KWDS.update(vsub=1, hsub=1)
+    _leases_frames = True
 
     def _initialize(self):
         """Create a UC480_Camera object.
@@ -609,6 +612,7 @@ class UC480_Camera(Camera):
         self._list_memid = None
 
         self._buffers = []
+        self._frames = None  # FramePool used in live mode
         self._queue_enabled = False
         self._trigger_mode = lib.SET_TRIGGER_OFF
 
@@ -715,10 +719,30 @@ class UC480_Camera(Camera):
 
     def _free_image_mem_seq(self):
         self._dev.ClearSequence()
+
+        # Buffers that are still leased get freed by the pool once they're released
+        self._close_frame_pool()
+        leased = self._frames.leased_buffers() if self._frames is not None else []
         for buf in self._buffers:
-            self._dev.FreeImageMem(buf.ptr, buf.id)
+            if buf not in leased:
+                self._dev.FreeImageMem(buf.ptr, buf.id)
         self._buffers = []
 
+    def _close_frame_pool(self):
+        """Stop the pool from giving buffers back to the camera"""
+        if self._frames is not None:
+            self._frames.close()
+
+    def _unlock_buffer(self, buf):
+        self._dev.UnlockSeqBuf(lib.IGNORE_PARAMETER, buf.ptr)
+
+    def _free_leased_buffer(self, buf):
+        self._dev.FreeImageMem(buf.ptr, buf.id)
+
+    def _buffer_array(self, buf):
+        buf_size = self.bytes_per_line * self.height
+        return self._array_from_buffer(ffi.buffer(buf.ptr, buf_size))
+
     def _allocate_mem_seq(self, num_bufs):
         """Create and setup the image memory for live capture."""
         for i in range(num_bufs):
@@ -842,8 +866,7 @@ class UC480_Camera(Camera):
         # Assumes we have exactly as many images as buffers
         arrays = []
         for buf in self._buffers:
-            buf_size = self.bytes_per_line * self.height
-            array = self._array_from_buffer(ffi.buffer(buf.ptr, buf_size))
+            array = self._buffer_array(buf)
             arrays.append(np.copy(array) if copy else array)
 
         self._dev.StopLiveVideo(lib.WAIT)
@@ -879,7 +902,8 @@ class UC480_Camera(Camera):
         self._set_gain(kwds['gain'])
 
         self._free_image_mem_seq()
-        self._allocate_mem_seq(num_bufs=2)
+        self._allocate_mem_seq(num_bufs=max(kwds['n_buffers'], 2))
+        self._frames = FramePool(requeue=self._unlock_buffer, free=self._free_leased_buffer)
         self._set_queueing(False)
 
         self._trigger_mode = lib.SET_TRIGGER_OFF
@@ -888,6 +912,7 @@ class UC480_Camera(Camera):
         self._dev.CaptureVideo(lib.WAIT)
 
     def stop_live_video(self):
+        self._close_frame_pool()
         self._dev.StopLiveVideo(lib.WAIT)
         self._dev.DisableEvent(lib.SET_EVENT_FRAME)
 
@@ -902,12 +927,22 @@ class UC480_Camera(Camera):
         elif ret != win32event.WAIT_OBJECT_0:
             raise Error("Failed to grab image: Windows event return code 0x{:x}".format(ret))
 
+        # Lock the new frame's buffer, so the camera skips it until the pool unlocks it
+        last_buf_ptr = self._last_img_mem()
+        latest = self._frames.latest_buffer()
+        if latest is None or latest.ptr != last_buf_ptr:
+            buf = next(buf for buf in self._buffers if buf.ptr == last_buf_ptr)
+            self._dev.LockSeqBuf(lib.IGNORE_PARAMETER, buf.ptr)
+            self._frames.push(buf, self._buffer_array(buf))
+
         return True
 
     def latest_frame(self, copy=True):
-        buf_num, buf_ptr, last_buf_ptr = self._dev.GetActSeqBuf()
+        if self._frames is not None and not self._frames.closed:  # In live mode
+            return self._frames.latest(copy)
+
         buf_size = self.bytes_per_line * self.height
-        array = self._array_from_buffer(ffi.buffer(last_buf_ptr, buf_size))
+        array = self._array_from_buffer(ffi.buffer(self._last_img_mem(), buf_size))
         return np.copy(array) if copy else array
 
     def _get_AOI(self):
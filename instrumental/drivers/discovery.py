@@ -0,0 +1,528 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Nate Bogdanowicz
+"""
+On-disk index of the instruments found by `list_instruments()`.
+
+Scanning for instruments is slow, since it imports every driver module and opens every VISA
+resource. The discovery index remembers what each driver module and each VISA address reported
+last time, so later scans only need to requery drivers whose entries have expired and VISA
+addresses that weren't seen before.
+
+Entries are keyed by driver module and by VISA address, and ParamSets can be looked up by serial.
+How long entries stay valid is set by the ``discovery_ttl`` and ``discovery_miss_ttl`` prefs (in
+seconds) of ``instrumental.conf``. A ``discovery_ttl`` of 0 disables the index entirely.
+
+This module also provides `scan_visa_addresses()`, which probes VISA addresses concurrently so that
+a scan takes about as long as its slowest probe, rather than the sum of all of them.
+"""
+from __future__ import division
+from past.builtins import basestring
+
+import os
+import os.path
+import json
+import time
+import threading
+
+from .. import conf
+from ..log import get_logger
+
+# Python 2 and 3 support
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+log = get_logger(__name__)
+
+__all__ = ['DiscoveryIndex', 'get_index', 'lookup', 'find_serial', 'invalidate', 'clear',
+           'scan_visa_addresses', 'VisaDriverTable']
+
+INDEX_VERSION = 1
+INDEX_FILENAME = 'discovery_index.json'
+DEFAULT_TTL = 3600.  # One hour
+DEFAULT_MISS_TTL = 300.  # How long to remember VISA addresses that had no matching driver
+
+# Params that identify an instrument. Two ParamSets can only match if they share one of these.
+IDENTIFYING_KEYS = ('module', 'serial', 'visa_address')
+
+VISA_SCAN_WORKERS = 16
+VISA_SCAN_DEADLINE = 2.  # Seconds, for each address
+VISA_SCAN_TOTAL_DEADLINE = 30.  # Seconds, for the whole scan
+# Max number of simultaneous probes per interface board (e.g. 'GPIB0'), by interface type. Devices
+# on a GPIB bus share the bus, so probing them concurrently gains nothing.
+VISA_INTERFACE_LIMITS = {
+    'GPIB': 1,
+    'ASRL': 1,
+    'USB': 4,
+    'TCPIP': 8,
+}
+DEFAULT_INTERFACE_LIMIT = 4
+
+
+class DiscoveryIndex(object):
+    """Persistent cache of discovered ParamSets
+
+    Parameters
+    ----------
+    path : str
+        Path of the JSON file backing the index. Created on first save if it doesn't exist.
+    ttl : float
+        Seconds for which a driver module's or VISA address's entry is considered valid.
+    miss_ttl : float
+        Seconds for which a VISA address that did not match any driver is remembered. These are
+        usually the slowest addresses to probe, but are also the likeliest to change (e.g. when an
+        instrument is switched on).
+    """
+    def __init__(self, path, ttl=DEFAULT_TTL, miss_ttl=DEFAULT_MISS_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self._lock = threading.RLock()
+        self._data = None
+        self._dirty = False
+
+    def __repr__(self):
+        return "<DiscoveryIndex '{}'>".format(self.path)
+
+    @property
+    def data(self):
+        with self._lock:
+            if self._data is None:
+                self._data = self._load()
+            return self._data
+
+    def _load(self):
+        empty = {'version': INDEX_VERSION, 'modules': {}, 'visa': {}}
+        if not os.path.isfile(self.path):
+            return empty
+
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError) as e:
+            log.info("Could not read discovery index '%s': %s", self.path, e)
+            return empty
+
+        if not isinstance(data, dict) or data.get('version') != INDEX_VERSION:
+            log.info("Ignoring discovery index with unknown version")
+            return empty
+        return data
+
+    def save(self):
+        """Write the index to disk, if it has changed since it was loaded"""
+        with self._lock:
+            if not self._dirty:
+                return
+
+            dirname = os.path.dirname(self.path)
+            if dirname and not os.path.exists(dirname):
+                os.makedirs(dirname)
+
+            # Write to a temp file first so a concurrent reader never sees a partial file
+            tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(self._data, f, indent=1, sort_keys=True)
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                os.rename(tmp_path, self.path)
+            except (IOError, OSError) as e:
+                log.info("Could not write discovery index '%s': %s", self.path, e)
+                return
+            self._dirty = False
+
+    def clear(self, module=None):
+        """Remove entries from the index
+
+        If `module` is given, only driver modules whose names contain it are removed, along with
+        every VISA entry (since we can't know which driver a VISA address matches without probing
+        it). Otherwise, the whole index is cleared.
+        """
+        with self._lock:
+            if module is None:
+                self._data = {'version': INDEX_VERSION, 'modules': {}, 'visa': {}}
+            else:
+                modules = self.data['modules']
+                for module_name in [m for m in modules if module in m]:
+                    del modules[module_name]
+                self.data['visa'].clear()
+            self._dirty = True
+
+    def _is_fresh(self, entry, ttl):
+        return (time.time() - entry['timestamp']) < ttl
+
+    def module_entries(self, module_name):
+        """Get the cached ParamSets of a driver module, or None if missing or expired"""
+        from . import ParamSet
+        with self._lock:
+            entry = self.data['modules'].get(module_name)
+            if entry is None or not self._is_fresh(entry, self.ttl):
+                return None
+            return [ParamSet(**params) for params in entry['paramsets']]
+
+    def set_module_entries(self, module_name, paramsets):
+        """Record the ParamSets that a driver module's `list_instruments()` returned"""
+        try:
+            serialized = [_serialize_params(p) for p in paramsets]
+        except TypeError as e:
+            log.info("Not indexing driver module %s: %s", module_name, e)
+            return
+
+        with self._lock:
+            self.data['modules'][module_name] = {'timestamp': time.time(),
+                                                 'paramsets': serialized}
+            self._dirty = True
+
+    def visa_entry(self, address):
+        """Look up a VISA address
+
+        Returns a tuple ``(found, paramset)``. `found` is False if the address is missing or
+        expired. Otherwise, `paramset` is the address's ParamSet, or None if no driver matched it.
+        """
+        from . import ParamSet
+        with self._lock:
+            entry = self.data['visa'].get(address)
+            if entry is None:
+                return False, None
+
+            params = entry['paramset']
+            ttl = self.miss_ttl if params is None else self.ttl
+            if not self._is_fresh(entry, ttl):
+                return False, None
+            return True, (None if params is None else ParamSet(**params))
+
+    def set_visa_entry(self, address, paramset):
+        """Record the result of probing a VISA address. `paramset` is None for a miss."""
+        try:
+            params = None if paramset is None else _serialize_params(paramset)
+        except TypeError as e:
+            log.info("Not indexing VISA address %s: %s", address, e)
+            return
+
+        with self._lock:
+            self.data['visa'][address] = {'timestamp': time.time(), 'paramset': params}
+            self._dirty = True
+
+    def prune_visa(self, live_addresses):
+        """Drop entries for VISA addresses which are no longer listed by the resource manager"""
+        live_addresses = set(live_addresses)
+        with self._lock:
+            visa = self.data['visa']
+            for address in [a for a in visa if a not in live_addresses]:
+                del visa[address]
+                self._dirty = True
+
+    def all_paramsets(self):
+        """Get a list of every unexpired ParamSet in the index"""
+        from . import ParamSet
+        paramsets = []
+        with self._lock:
+            for entry in self.data['visa'].values():
+                if entry['paramset'] is not None and self._is_fresh(entry, self.ttl):
+                    paramsets.append(ParamSet(**entry['paramset']))
+            for entry in self.data['modules'].values():
+                if self._is_fresh(entry, self.ttl):
+                    paramsets.extend(ParamSet(**params) for params in entry['paramsets'])
+        return paramsets
+
+    def lookup(self, name):
+        """Find an indexed ParamSet whose string representation contains `name`
+
+        This matches the way `instrument()` looks up non-alias strings in the output of
+        `list_instruments()`. Returns None if there is no match.
+        """
+        test_str = name.lower()
+        for paramset in self.all_paramsets():
+            if test_str in str(paramset).lower():
+                return paramset
+        return None
+
+    def find_serial(self, serial):
+        """Find the indexed ParamSet having the given serial, or None"""
+        for paramset in self.all_paramsets():
+            if 'serial' in paramset and str(paramset['serial']) == str(serial):
+                return paramset
+        return None
+
+    def invalidate(self, params):
+        """Remove every entry that matches `params`
+
+        Used when opening an instrument from an indexed ParamSet fails, e.g. because it has been
+        unplugged. Removing a driver module's entry forces it to be requeried on the next scan.
+        """
+        params = _serialize_params(params)
+        with self._lock:
+            data = self.data
+            if 'visa_address' in params:
+                if data['visa'].pop(params['visa_address'], None) is not None:
+                    self._dirty = True
+
+            for module_name, entry in list(data['modules'].items()):
+                if any(_params_match(params, p) for p in entry['paramsets']):
+                    del data['modules'][module_name]
+                    self._dirty = True
+
+
+class VisaDriverTable(object):
+    """Precompiled lookup table for finding the driver class of a VISA instrument
+
+    Built once from `driver_info`. Maps ``*IDN?`` (manufacturer, model) pairs directly to
+    (driver module name, classname). A model string ending in ``*`` in a class's
+    ``_INST_VISA_INFO_`` is treated as a prefix, e.g. ``'TDS 3*'``, with longer prefixes taking
+    precedence.
+
+    It also keeps track of which driver modules provide a ``_check_visa_support()`` function, so
+    that modules without one never need to be imported, and orders these checks so that within a
+    given ``_INST_PRIORITY``, the checks which have been fastest so far run first.
+
+    Finally, it remembers addresses and IDN strings which did not match any driver, for up to
+    `miss_ttl` seconds.
+    """
+    # Weight of the newest sample in each module's moving average of check durations
+    TIME_WEIGHT = 0.3
+
+    def __init__(self, driver_info, miss_ttl=DEFAULT_MISS_TTL):
+        self.miss_ttl = miss_ttl
+        self._exact = {}
+        self._prefixes = []
+        self._checks = []  # (priority, rank, module_name)
+        self._check_times = {}
+        self._misses = {}
+        self._lock = threading.Lock()
+
+        for rank, (module_name, info) in enumerate(driver_info.items()):
+            if 'visa_info' not in info:
+                continue
+
+            for classname, (manufac, models) in info['visa_info'].items():
+                for model in models:
+                    if model.endswith('*'):
+                        self._prefixes.append((manufac, model[:-1], module_name, classname))
+                    else:
+                        self._exact.setdefault((manufac, model), []).append((module_name,
+                                                                              classname))
+
+            # External drivers lack static info, so we assume they might have a check
+            if info.get('visa_check', True):
+                self._checks.append((info.get('priority', 5), rank, module_name))
+
+        self._prefixes.sort(key=lambda entry: -len(entry[1]))
+
+    def match_idn(self, manufac, model, module=None):
+        """Get the (module_name, classname) matching an IDN, or None
+
+        If `module` is given, only classes from that driver module are considered.
+        """
+        for match in self._exact.get((manufac, model), ()):
+            if module is None or match[0] == module:
+                return match
+
+        for cls_manufac, prefix, module_name, classname in self._prefixes:
+            if module is not None and module_name != module:
+                continue
+            if manufac == cls_manufac and model.startswith(prefix):
+                return module_name, classname
+        return None
+
+    def has_idn_info(self, module=None):
+        """Whether any (or `module`'s) classes list IDN info"""
+        entries = [m for matches in self._exact.values() for m in matches]
+        entries.extend(p[2:] for p in self._prefixes)
+        return any(module is None or module_name == module for module_name, _ in entries)
+
+    def check_order(self, module=None):
+        """Get the names of driver modules to try `_check_visa_support()` on, in order"""
+        with self._lock:
+            times = dict(self._check_times)
+
+        checks = [c for c in self._checks if module is None or c[2] == module]
+        checks.sort(key=lambda c: (c[0], times.get(c[2], 0.), c[1]))
+        return [module_name for _, _, module_name in checks]
+
+    def record_check_time(self, module_name, duration):
+        """Record how long a module's `_check_visa_support()` took"""
+        with self._lock:
+            old = self._check_times.get(module_name)
+            if old is None:
+                self._check_times[module_name] = duration
+            else:
+                w = self.TIME_WEIGHT
+                self._check_times[module_name] = w*duration + (1-w)*old
+
+    def is_miss(self, key):
+        """Whether `key` (an address or IDN tuple) recently failed to match any driver"""
+        with self._lock:
+            timestamp = self._misses.get(key)
+            if timestamp is None:
+                return False
+            if time.time() - timestamp >= self.miss_ttl:
+                del self._misses[key]
+                return False
+            return True
+
+    def add_miss(self, key):
+        with self._lock:
+            self._misses[key] = time.time()
+
+    def clear_misses(self):
+        with self._lock:
+            self._misses.clear()
+
+
+def _serialize_params(paramset):
+    """Convert a ParamSet to a JSON-safe dict, raising TypeError if impossible"""
+    params = {k: v for k, v in paramset.items() if not k.startswith('**')}
+    json.dumps(params)  # Raises TypeError if not serializable
+    return params
+
+
+def _params_match(a, b):
+    """True iff `a` and `b` share an identifying key, and all common keys have matching values"""
+    common = [k for k in a if k in b]
+    return (any(k in IDENTIFYING_KEYS for k in common) and
+            all(a[k] == b[k] for k in common))
+
+
+def get_index():
+    """Get the shared DiscoveryIndex, or None if it has been disabled in ``instrumental.conf``"""
+    ttl = conf.get_float_pref('discovery_ttl', DEFAULT_TTL)
+    if ttl <= 0:
+        return None
+
+    index = get_index.index
+    if index is None:
+        path = os.path.join(conf.user_data_dir, INDEX_FILENAME)
+        index = get_index.index = DiscoveryIndex(path)
+    index.ttl = ttl
+    index.miss_ttl = get_miss_ttl()
+    return index
+get_index.index = None
+
+
+def get_miss_ttl():
+    """Get the configured time (in seconds) to remember VISA addresses which matched no driver"""
+    return conf.get_float_pref('discovery_miss_ttl', DEFAULT_MISS_TTL)
+
+
+def lookup(name):
+    """Look up a string in the discovery index without touching any hardware"""
+    index = get_index()
+    if index is None or not isinstance(name, basestring):
+        return None
+    return index.lookup(name)
+
+
+def find_serial(serial):
+    """Find an instrument's indexed ParamSet by its serial, without touching any hardware"""
+    index = get_index()
+    if index is None:
+        return None
+    return index.find_serial(serial)
+
+
+def invalidate(params):
+    """Remove entries matching `params` from the discovery index"""
+    index = get_index()
+    if index is not None:
+        index.invalidate(params)
+        index.save()
+
+
+def clear():
+    """Clear the discovery index, forcing a full scan on the next `list_instruments()`"""
+    index = get_index()
+    if index is not None:
+        index.clear()
+        index.save()
+
+
+def visa_interface(address):
+    """Get the interface board of a VISA address, e.g. 'GPIB0' for 'GPIB0::8::INSTR'"""
+    board = address.split('::', 1)[0].upper()
+    if board.startswith('ASRL'):
+        return board  # Each serial port is its own interface
+    return board if board[-1:].isdigit() else board + '0'
+
+
+def _interface_limit(board):
+    for intf_type, limit in VISA_INTERFACE_LIMITS.items():
+        if board.startswith(intf_type):
+            return limit
+    return DEFAULT_INTERFACE_LIMIT
+
+
+def scan_visa_addresses(addresses, probe, max_workers=VISA_SCAN_WORKERS,
+                        deadline=VISA_SCAN_DEADLINE, total_deadline=VISA_SCAN_TOTAL_DEADLINE):
+    """Probe VISA addresses concurrently, yielding ``(address, result)`` as each probe finishes
+
+    Each address is probed by calling ``probe(address)`` in a worker thread. At most `max_workers`
+    probes run at once, and each interface board is further limited by `VISA_INTERFACE_LIMITS`.
+
+    If a probe is still running `deadline` seconds after it started, the address is given up on and
+    is not yielded. Blocking VISA calls can't be interrupted, so the probe's thread is left to finish
+    in the background and its result is discarded, while the next address on its board is started.
+    Once `total_deadline` seconds have passed since the scan began, any addresses still waiting or
+    running are given up on as well. Exceptions raised by `probe` are logged and the address is
+    skipped.
+
+    Closing the generator early (e.g. by breaking out of a for-loop) prevents any probes which have
+    not yet started from running.
+    """
+    waiting = list(addresses)
+    if not waiting:
+        return
+
+    scan_start = time.time()
+    results = queue.Queue()
+    running = {}  # address -> time its probe started
+    n_running = {}  # board -> number of running probes
+
+    def worker(address):
+        try:
+            result = probe(address)
+        except Exception as e:
+            log.info("Exception while probing VISA address '%s': %s", address, e)
+            result = None
+        results.put((address, result))
+
+    def start_probes():
+        # The slots of each board are taken and freed here, rather than by the workers, so a
+        # probe that's been given up on doesn't hold up the rest of its board
+        for address in list(waiting):
+            if len(running) >= max_workers:
+                return
+            board = visa_interface(address)
+            if n_running.get(board, 0) < _interface_limit(board):
+                waiting.remove(address)
+                running[address] = time.time()
+                n_running[board] = n_running.get(board, 0) + 1
+                thread = threading.Thread(target=worker, args=(address,),
+                                          name='visa-probe-{}'.format(address))
+                thread.daemon = True
+                thread.start()
+
+    def finish(address):
+        del running[address]
+        n_running[visa_interface(address)] -= 1
+        start_probes()
+
+    start_probes()
+    while running:
+        timeout = min(min(running.values()) + deadline, scan_start + total_deadline) - time.time()
+        try:
+            address, result = results.get(timeout=max(timeout, 0.))
+        except queue.Empty:
+            now = time.time()
+            if now - scan_start >= total_deadline:
+                log.info("Giving up on VISA addresses %s after %s s", waiting + list(running),
+                         total_deadline)
+                return
+            for address in [a for a, t in running.items() if now - t >= deadline]:
+                log.info("Giving up on VISA address '%s' after %s s", address, deadline)
+                finish(address)
+            continue
+
+        if address in running:
+            finish(address)
+            yield address, result
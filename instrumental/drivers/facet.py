@@ -4,12 +4,13 @@
 from __future__ import division
 from past.builtins import basestring
 
+import time
 import numbers
 from collections import Mapping, namedtuple
 
+import instrumental  # `u` and `Q_` are created on first access, so don't bind them at import
 from ..log import get_logger
-from .. import u, Q_
-from .util import to_quantity
+from .util import to_quantity, magnitude_in
 
 log = get_logger(__name__)
 
@@ -32,12 +33,18 @@ class FacetGroup(object):
             raise KeyError
         return self.__dict__[key]
 
+    def invalidate_all(self):
+        """Mark all cached facet values as stale, forcing them to be re-read on next access"""
+        for name in self._names:
+            self.__dict__[name].invalidate()
+
 
 class FacetData(object):
     """Per-instance Facet data"""
     def __init__(self, parent_facet, owner):
         self.dirty = True
         self.cached_val = None
+        self.timestamp = None  # Time when cached_val was last read or set
         self.observers = []
         self.facet = parent_facet
         self.owner = owner
@@ -54,11 +61,27 @@ class FacetData(object):
         """
         self.observers.append(callback)
 
-    def get_value(self):
-        return self.facet.get_value(self.owner)
+    def invalidate(self):
+        """Mark the cached value as stale, forcing it to be re-read on next access"""
+        self.dirty = True
+        self.timestamp = None
+
+    def is_expired(self):
+        """Whether the cached value is missing or older than the facet's `max_age`"""
+        if self.timestamp is None:
+            return True
+        max_age = self.facet.max_age
+        return max_age is not None and time.time() - self.timestamp > max_age
 
-    def set_value(self, value):
-        self.facet.set_value(self.owner, value)
+    def cache_is_valid(self):
+        """Whether the cached value may be returned instead of querying the instrument"""
+        return self.facet.cacheable and not self.dirty and not self.is_expired()
+
+    def get_value(self, raw=False):
+        return self.facet.get_value(self.owner, raw=raw)
+
+    def set_value(self, value, raw=False):
+        self.facet.set_value(self.owner, value, raw=raw)
 
     def create_widget(self, parent=None):
         if self.facet.type == float:
@@ -96,6 +119,13 @@ class Facet(object):
         instrument once. Therefore, one should be careful to use caching only when it makes sense.
         Caching can be disabled on a per-get or per-set basis by using the `use_cache` parameter to
         `get_value()` or `set_value()`.
+    max_age : pint.Quantity, str, or number, optional
+        Maximum age of a cached value (numbers are taken to be in seconds), e.g. ``'500 ms'``.
+        Once a value is older than this, getting the facet re-queries the instrument. Implies
+        `cached=True`.
+    invalidates : sequence of str, optional
+        Names of other facets of the instrument whose cached values become stale whenever this
+        facet is set. For example, setting a power meter's range might invalidate its power.
     type : callable, optional
         Type of the outward-facing value of the facet. Typically an actual type like `int`, but can
         be any callable that converts a value to the proper type.
@@ -111,8 +141,13 @@ class Facet(object):
         raises a `ValueError` if a user tries to set a value that is out of range. `step`, if given,
         is used to round an in-range value before passing it to fset.
     """
+    # Query message and reply converter used by `Instrument.get_many()` to read this facet as part
+    # of a combined query. Set by `MessageFacet(batchable=True)`; None means no batching.
+    batch_msg = None
+    batch_convert = None
+
     def __init__(self, fget=None, fset=None, doc=None, cached=False, type=None, units=None,
-                 value=None, limits=None, name=None):
+                 value=None, limits=None, name=None, max_age=None, invalidates=()):
         if fget is not None:
             self.name = fget.__name__
 
@@ -123,9 +158,11 @@ class Facet(object):
             doc = fget.__doc__
         self.__doc__ = doc
 
-        self.cacheable = cached
+        self.cacheable = cached or max_age is not None
+        self.max_age = None if max_age is None else _to_seconds(max_age)
+        self.invalidates = tuple(invalidates)
         self.type = type
-        self.units = None if units is None else u.parse_units(units)
+        self.units = None if units is None else instrumental.u.parse_units(units)
         self.name = name  # This is auto-filled by InstrumentMeta.__new__ later
         self._set_limits(limits)
 
@@ -173,7 +210,7 @@ class Facet(object):
 
     def conv_set(self, value):
         """Convert nice value to representation that fset takes"""
-        if isinstance(value, Q_):
+        if isinstance(value, instrumental.Q_):
             value = value.magnitude
         #if self.type is not None:
         #    value = self.type(value)
@@ -181,17 +218,20 @@ class Facet(object):
             value = self.in_map[value]
         return value
 
-    def conv_get(self, value):
-        """Convert what fget returns to a nice output value"""
+    def conv_get(self, value, raw=False):
+        """Convert what fget returns to a nice output value
+
+        If `raw` is True, unitful values are returned as a bare magnitude in the facet's units.
+        """
         if self.out_map:
             value = self.out_map[value]
         if self.type is not None:
             value = self.type(value)
         if self.units is not None:
-            if isinstance(value, Q_):
-                value = value.to(self.units)
-            else:
-                value = Q_(value, self.units)
+            if isinstance(value, instrumental.Q_):
+                value = magnitude_in(value, self.units)
+            if not raw:
+                value = instrumental.Q_(value, self.units)
         return value
 
     def __get__(self, obj, objtype=None):
@@ -199,33 +239,55 @@ class Facet(object):
             return self
         return self.get_value(obj)
 
-    def get_value(self, obj, use_cache=True):
+    def get_value(self, obj, use_cache=True, raw=False):
+        """Get the facet's value
+
+        If `raw` is True, unitful values are returned as a bare magnitude in the facet's units,
+        skipping the creation of a Quantity. Raw reads use a valid cached value, but don't update
+        the cache.
+        """
         if self.fget is None:
             raise AttributeError
 
         instance = self.instance(obj)
 
-        if not (self.cacheable and use_cache) or instance.dirty:
+        if not (use_cache and instance.cache_is_valid()):
             log.debug('Getting value of facet %s', self.name)
-            instance.cached_val = self.conv_get(self.fget(obj))
-            instance.dirty = False
+            if raw:
+                return self.conv_get(self.fget(obj), raw=True)
+            self.store_value(obj, self.fget(obj))
         else:
             log.debug('Using cached value of facet %s', self.name)
 
         log.debug('Facet value was %s', instance.cached_val)
+        if raw and self.units is not None:
+            return instance.cached_val.magnitude
+        return instance.cached_val
+
+    def store_value(self, obj, raw_value):
+        """Convert a value as returned by fget and store it as the facet's cached value"""
+        instance = self.instance(obj)
+        instance.cached_val = self.conv_get(raw_value)
+        instance.timestamp = time.time()
+        instance.dirty = False
         return instance.cached_val
 
     def __set__(self, obj, qty):
         self.set_value(obj, qty)
 
-    def convert_user_input(self, value, obj):
-        """Validate and convert an input value to its 'external' form"""
-        if self.units is not None:
-            q = to_quantity(value).to(self.units)
-            return Q_(self.convert_raw_input(q.magnitude, obj), q.units)
-        else:
+    def convert_user_input(self, value, obj, raw=False):
+        """Validate and convert an input value to its 'external' form
+
+        If `raw` is True, `value` is taken to be a bare magnitude in the facet's units, and is
+        returned as one.
+        """
+        if self.units is None or raw:
             return self.convert_raw_input(value, obj)
 
+        Q_ = instrumental.Q_
+        q = value if isinstance(value, Q_) else to_quantity(value)
+        return Q_(self.convert_raw_input(magnitude_in(q, self.units), obj), self.units)
+
     def convert_raw_input(self, input_value, obj):
         value = input_value if self.type is None else self.type(input_value)
         return self.check_limits(value, obj)
@@ -239,10 +301,10 @@ class Facet(object):
         start, stop, step = self._load_limits(obj)
         if start is not None and value < start:
             raise ValueError("Value below lower limit of {}".format(
-                Q_(start, self.units) if self.units else start))
+                instrumental.Q_(start, self.units) if self.units else start))
         if stop is not None and value > stop:
             raise ValueError("Value above upper limit of {}".format(
-                Q_(stop, self.units) if self.units else stop))
+                instrumental.Q_(stop, self.units) if self.units else stop))
 
         if step is not None:
             offset = value - start
@@ -253,23 +315,40 @@ class Facet(object):
 
         return value
 
-    def set_value(self, obj, value, use_cache=True):
+    def set_value(self, obj, value, use_cache=True, raw=False):
+        """Set the facet's value
+
+        If `raw` is True, `value` is taken to be a bare magnitude in the facet's units. When the
+        facet is neither cached nor observed, this skips the creation of a Quantity entirely.
+        """
         if self.fset is None:
             raise AttributeError("Cannot set a read-only Facet")
 
         instance = self.instance(obj)
-        value = self.convert_user_input(value, obj)
-
-        if not (self.cacheable and use_cache) or instance.cached_val != value:
+        value = self.convert_user_input(value, obj, raw=raw)
+
+        if raw and self.units is not None:
+            if not (self.cacheable or instance.observers):
+                log.info('Setting raw value of facet %s', self.name)
+                self.fset(obj, self.conv_set(value))
+                instance.invalidate()  # We have no Quantity to cache
+                return
+            value = instrumental.Q_(value, self.units)
+
+        if (not (self.cacheable and use_cache) or instance.is_expired()
+                or instance.cached_val != value):
             log.info('Setting value of facet %s', self.name)
             self.fset(obj, self.conv_set(value))
             change = ChangeEvent(name=self.name, old=instance.cached_val, new=value)
             for callback in instance.observers:
                 callback(change)
+            for name in self.invalidates:
+                getattr(type(obj), name).instance(obj).invalidate()
         else:
             log.info('Skipping set of facet %s, cached value matches', self.name)
 
         instance.cached_val = value
+        instance.timestamp = time.time()
         log.info('Facet value is %s', value)
 
     def __call__(self, fget):
@@ -294,9 +373,10 @@ class AbstractFacet(Facet):
 
 class ManualFacet(Facet):
     def __init__(self, doc=None, cached=False, type=None, units=None, value=None, limits=None,
-                 name=None, save_on_set=True):
+                 name=None, save_on_set=True, max_age=None, invalidates=()):
         Facet.__init__(self, self._manual_fget, self._manual_fset, doc=doc, cached=cached,
-                       type=type, units=units, value=value, limits=limits, name=name)
+                       type=type, units=units, value=value, limits=limits, name=name,
+                       max_age=max_age, invalidates=invalidates)
         self.save_on_set = save_on_set
 
     def _manual_fget(self, owner):
@@ -313,11 +393,18 @@ class ManualFacet(Facet):
 
     def _default_value(self):
         if self.units:
-            return Q_(0, self.units)
+            return instrumental.Q_(0, self.units)
         return None  # FIXME
 
 
-def MessageFacet(get_msg=None, set_msg=None, convert=None, **kwds):
+def _to_seconds(value):
+    """Convert a time given as a Quantity, str, or number of seconds into a float of seconds"""
+    if isinstance(value, numbers.Number):
+        return float(value)
+    return to_quantity(value).m_as('s')
+
+
+def MessageFacet(get_msg=None, set_msg=None, convert=None, batchable=False, **kwds):
     """Convenience function for creating message-based Facets.
 
     Creates `fget` and `fset` functions that are passed to `Facet`, based on message templates.
@@ -337,6 +424,10 @@ def MessageFacet(get_msg=None, set_msg=None, convert=None, **kwds):
     convert : function or callable
         Function that converts both the string returned by querying the instrument and the set-value
         before it is passed to `str.format()`. Usually something like `int` or `float`.
+    batchable : bool, optional
+        Whether `get_msg` may be combined with other queries into a single ';'-separated message
+        whose reply is ';'-separated as well, as is the case for SCPI. Allows
+        `Instrument.get_many()` to read several facets in a single round-trip.
     **kwds :
         Any other keywords are passed along to the `Facet` constructor
     """
@@ -359,7 +450,11 @@ def MessageFacet(get_msg=None, set_msg=None, convert=None, **kwds):
         def fset(obj, value):
             obj.write(set_msg.format(value))
 
-    return Facet(fget, fset, **kwds)
+    facet = Facet(fget, fset, **kwds)
+    if batchable and get_msg is not None:
+        facet.batch_msg = get_msg
+        facet.batch_convert = convert
+    return facet
 
 
 def SCPI_Facet(msg, convert=None, readonly=False, **kwds):
@@ -381,4 +476,4 @@ def SCPI_Facet(msg, convert=None, readonly=False, **kwds):
     """
     get_msg = msg + '?'
     set_msg = None if readonly else msg + ' {}'
-    return MessageFacet(get_msg, set_msg, convert=convert, **kwds)
+    return MessageFacet(get_msg, set_msg, convert=convert, batchable=True, **kwds)
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Nate Bogdanowicz
+"""
+Background polling of facets.
+
+A `Poller` reads subscribed facets periodically and notifies the facets' observers whenever a
+value changes, so that hardware-side changes reach the same callbacks as changes made via
+`Facet.set_value()`. All subscriptions to a given instrument share one polling thread and schedule,
+so any number of consumers watching a facet cost only one read per period. Facets that come due
+together are read with `Instrument.get_many()`, which batches their queries where possible.
+
+If reads start taking a large fraction of the polling period (or fail), the instrument's schedule
+is stretched by up to `max_backoff` times, and then relaxed again once reads are quick.
+"""
+import time
+import threading
+
+from ..log import get_logger
+from .facet import ChangeEvent, _to_seconds
+
+log = get_logger(__name__)
+
+__all__ = ['Poller', 'Subscription', 'poll']
+
+# Reads taking more than this fraction of the period count as a saturated bus
+SATURATION_FRACTION = 0.5
+
+
+class Subscription(object):
+    """A request to poll one facet of an instrument at a given period"""
+    def __init__(self, poller, inst, facet_name, period, callback):
+        self.poller = poller
+        self.inst = inst
+        self.facet_name = facet_name
+        self.period = period
+        self.callback = callback
+
+    def __repr__(self):
+        return "<Subscription '{}' every {} s>".format(self.facet_name, self.period)
+
+    def cancel(self):
+        """Stop polling for this subscription"""
+        self.poller.unsubscribe(self)
+
+
+class _InstrumentPoller(object):
+    """Polls the subscribed facets of a single instrument from a background thread"""
+    def __init__(self, inst, max_backoff):
+        self.inst = inst
+        self.max_backoff = max_backoff
+        self.backoff = 1.
+        self.subscriptions = []
+        self.next_due = {}
+        self.stopped = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name='poller-' + type(inst).__name__)
+        self.thread.daemon = True
+
+    def add(self, subscription):
+        with self.cond:
+            self.subscriptions.append(subscription)
+            self.cond.notify()
+
+    def remove(self, subscription):
+        with self.cond:
+            self.subscriptions.remove(subscription)
+            if not self.subscriptions:
+                self.stopped = True
+            self.cond.notify()
+        return self.stopped
+
+    def _periods(self):
+        periods = {}
+        for sub in self.subscriptions:
+            periods[sub.facet_name] = min(sub.period, periods.get(sub.facet_name, sub.period))
+        return periods
+
+    def _due_facets(self, periods):
+        """Get the facets that are due now, or else the time until the next one is"""
+        now = time.time()
+        for name in list(self.next_due):
+            if name not in periods:
+                del self.next_due[name]
+
+        due = [name for name in periods if self.next_due.setdefault(name, now) <= now]
+        if due or not periods:
+            return due, None
+        return due, min(self.next_due.values()) - now
+
+    def _run(self):
+        while True:
+            with self.cond:
+                periods = self._periods()
+                due, timeout = self._due_facets(periods)
+                while not (self.stopped or due):
+                    self.cond.wait(timeout)
+                    periods = self._periods()
+                    due, timeout = self._due_facets(periods)
+                if self.stopped:
+                    return
+            self._poll(due, periods)
+
+    def _poll(self, names, periods):
+        facet_data = [self.inst.facets[name] for name in names]
+        old_values = [fd.cached_val for fd in facet_data]
+
+        start = time.time()
+        try:
+            new_values = self.inst.get_many(names)
+        except Exception:
+            log.exception("Polling %s of %s failed", names, self.inst)
+            new_values = None
+        elapsed = time.time() - start
+
+        with self.cond:
+            min_period = min(periods[name] for name in names)
+            if new_values is None or elapsed > SATURATION_FRACTION * min_period:
+                self.backoff = min(2 * self.backoff, self.max_backoff)
+                log.info("Polling of %s is saturated, backing off to %gx", self.inst, self.backoff)
+            else:
+                self.backoff = max(self.backoff / 2, 1.)
+
+            for name in names:
+                self.next_due[name] = start + periods[name] * self.backoff
+
+        if new_values is None:
+            return
+
+        for fd, old, new in zip(facet_data, old_values, new_values):
+            if _changed(old, new):
+                change = ChangeEvent(name=fd.facet.name, old=old, new=new)
+                for callback in list(fd.observers):
+                    try:
+                        callback(change)
+                    except Exception:
+                        log.exception("Observer of facet %s raised an exception", fd.facet.name)
+
+
+def _changed(old, new):
+    try:
+        return bool(old != new)
+    except (TypeError, ValueError):  # e.g. comparing arrays or incompatible units
+        return True
+
+
+class Poller(object):
+    """Service that polls facets in the background and notifies their observers of changes
+
+    Parameters
+    ----------
+    max_backoff : float, optional
+        Maximum factor by which an instrument's polling periods are stretched when its reads are
+        slow or failing.
+    """
+    def __init__(self, max_backoff=16.):
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._inst_pollers = {}
+
+    def subscribe(self, inst, facet_name, period, callback=None):
+        """Poll `inst`'s facet `facet_name` every `period`
+
+        Parameters
+        ----------
+        inst : Instrument
+            The instrument to poll
+        facet_name : str
+            Name of the facet to poll
+        period : pint.Quantity, str, or number
+            Polling period (numbers are taken to be in seconds), e.g. ``'200 ms'``
+        callback : callable, optional
+            Observer to add to the facet, which is called with a `ChangeEvent` whenever the
+            facet's value changes. It is removed again when the subscription is cancelled.
+
+        Returns
+        -------
+        subscription : Subscription
+            Handle that can be used to cancel the subscription
+        """
+        inst._get_facet(facet_name)  # Validate the name
+        subscription = Subscription(self, inst, facet_name, _to_seconds(period), callback)
+        if callback is not None:
+            inst.facets[facet_name].observe(callback)
+
+        with self._lock:
+            try:
+                inst_poller = self._inst_pollers[id(inst)]
+            except KeyError:
+                inst_poller = _InstrumentPoller(inst, self.max_backoff)
+                self._inst_pollers[id(inst)] = inst_poller
+                inst_poller.thread.start()
+            inst_poller.add(subscription)
+
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Cancel a subscription made with `subscribe()`"""
+        inst = subscription.inst
+        with self._lock:
+            inst_poller = self._inst_pollers.get(id(inst))
+            if inst_poller is None or subscription not in inst_poller.subscriptions:
+                return
+            if inst_poller.remove(subscription):
+                del self._inst_pollers[id(inst)]
+
+        if subscription.callback is not None:
+            observers = inst.facets[subscription.facet_name].observers
+            if subscription.callback in observers:
+                observers.remove(subscription.callback)
+
+    def stop(self):
+        """Cancel all subscriptions and stop all polling threads"""
+        with self._lock:
+            subscriptions = [sub for inst_poller in self._inst_pollers.values()
+                             for sub in inst_poller.subscriptions]
+        for subscription in subscriptions:
+            self.unsubscribe(subscription)
+
+
+_default_poller = None
+
+
+def poll(inst, facet_name, period, callback=None):
+    """Subscribe to a facet using the shared default `Poller`. See `Poller.subscribe()`."""
+    global _default_poller
+    if _default_poller is None:
+        _default_poller = Poller()
+    return _default_poller.subscribe(inst, facet_name, period, callback)
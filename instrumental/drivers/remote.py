@@ -5,30 +5,102 @@ Support for instruments on remote servers.
 """
 
 from __future__ import absolute_import, unicode_literals, print_function
+import os
 import atexit
+import inspect
 import socket
 import struct
 import threading
-import pickle
+import time
+import uuid
+import weakref
+from numbers import Number
+from contextlib import contextmanager
 
-from . import instrument, list_instruments, Instrument
+from past.builtins import basestring
+
+from . import instrument, list_instruments, Instrument, ParamSet
 from .. import conf
 from ..log import get_logger
+from .util import to_quantity
+from .facet import Facet, _to_seconds
+from .remote_codec import OUT_OF_BAND, get_codec, decode, can_encode
 
 # Python 2 and 3 support
+try:
+    import reprlib
+except ImportError:
+    import repr as reprlib
 try:
     import socketserver
 except ImportError:
     import SocketServer as socketserver
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+try:
+    from . import remote_shm
+except ImportError:  # Shared memory needs Python 3.8+
+    remote_shm = None
 
 log = get_logger(__name__)
 
 DEFAULT_PORT = 28265
 
 # Header format is:
-# 1 unsigned byte - message id
-# 8 unsigned bytes - message length in bytes (not including header)
-STRUCT = struct.Struct('!BQ')
+# 1 unsigned byte - message kind (request, response, push, credit, or release)
+# 4 unsigned bytes - message id, which a response shares with its request. For pushes and credits,
+#                    this is the id of the stream
+# 2 unsigned bytes - number of out-of-band buffers
+# 8 unsigned bytes - message length in bytes (not including header or buffers)
+#
+# The header is followed by the 8-byte length of each out-of-band buffer, then the message, then
+# the raw contents of each buffer
+STRUCT = struct.Struct('!BIHQ')
+BUFFER_LEN_STRUCT = struct.Struct('!Q')
+KIND_REQUEST = 0
+KIND_RESPONSE = 1
+KIND_PUSH = 2  # A value from a stream, sent by the server
+KIND_CREDIT = 3  # Permission for the server to push more values to a stream, sent by the client
+KIND_RELEASE = 4  # Shared-memory regions the client no longer views (see `remote_shm`)
+MAX_ID = 2**32
+CREDIT_STRUCT = struct.Struct('!I')
+
+# Policies for a stream whose client isn't keeping up
+STREAM_POLICIES = ('latest', 'block')
+
+# Defaults for the client, which may be overridden by the `remote_timeout`, `remote_pool_size`,
+# `remote_heartbeat`, and `remote_codec` prefs
+REQUEST_TIMEOUT = 2.0  # Time to wait for a response, in seconds
+POOL_SIZE = 1  # Maximum number of connections to each server
+HEARTBEAT_INTERVAL = 5.0  # Time between pings of each connection, in seconds
+DEFAULT_CODEC = 'compact'  # Name of the codec used to encode messages (see `remote_codec`)
+
+# Maximum number of requests a server handles concurrently for each client connection
+WORKERS_PER_CONNECTION = 8
+
+# Time a server keeps the value of a cacheable facet for its clients, in seconds. May be
+# overridden by the `remote_cache_ttl` pref.
+CACHE_TTL = 0.1
+
+# Defaults for `list_remote_instruments()`, which may be overridden by the `remote_list_timeout`
+# and `remote_list_ttl` prefs
+LIST_TIMEOUT = 5.0  # Time to wait for each server, in seconds
+LIST_TTL = 60.0  # Time for which a server's list of instruments is reused, in seconds
+
+MAX_BUFFERS = 2**16 - 1
+
+# Sending with sendmsg() avoids joining the header and buffers into one string
+HAS_SENDMSG = hasattr(socket.socket, 'sendmsg')
+
+# Maximum number of parts that sendmsg() accepts at once
+try:
+    IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = -1
+if IOV_MAX <= 0:
+    IOV_MAX = 1024
 
 
 class FakeLock(object):
@@ -38,6 +110,62 @@ class FakeLock(object):
         pass
 FAKE_LOCK = FakeLock()  # Only need one
 
+# Lets RemoteObjects being unpickled find the client session they arrived on
+_deserializing = threading.local()
+
+# Per-thread override of the client's request timeout
+_timeouts = threading.local()
+
+# Instruments listed by each server, as (host, port) -> (time listed, list of ParamSets)
+_list_cache = {}
+_list_cache_lock = threading.Lock()
+
+
+@contextmanager
+def request_timeout(timeout):
+    """Context manager setting how long remote requests made by this thread wait for a response
+
+    Useful for long-running calls, e.g.::
+
+        with request_timeout('30 s'):
+            image = remote_cam.grab_image(exposure_time='20 s')
+
+    `timeout` is a time Quantity, string, or number of seconds.
+    """
+    old_timeout = getattr(_timeouts, 'timeout', None)
+    _timeouts.timeout = _to_seconds(timeout)
+    try:
+        yield
+    finally:
+        _timeouts.timeout = old_timeout
+
+
+class _BriefRepr(reprlib.Repr):
+    """Repr which abbreviates large containers, strings, arrays, and Quantities"""
+    def __init__(self):
+        reprlib.Repr.__init__(self)
+        self.maxstring = self.maxother = 80
+
+    def repr_ndarray(self, obj, level):
+        return '<ndarray shape={} dtype={}>'.format(obj.shape, obj.dtype)
+
+    def repr_Quantity(self, obj, level):
+        return '<Quantity {} {}>'.format(self.repr1(obj.magnitude, level), obj.units)
+
+
+_brief_repr = _BriefRepr()
+
+
+class _Brief(object):
+    """Wrapper for logging an object's abbreviated repr, which is only computed if it's emitted"""
+    __slots__ = ('obj',)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __repr__(self):
+        return _brief_repr.repr(self.obj)
+
 
 class RemoteError(Exception):
     pass
@@ -48,208 +176,981 @@ class RemoteTimeoutError(RemoteError):
 
 
 class Messenger(object):
-    """Low-level messenger used to send and receive discrete, numbered byte-level messages"""
-    def __init__(self):
-        self.leftover = None
+    """Low-level messenger used to send and receive discrete, numbered byte-level messages
+
+    Messages may be sent from several threads at once; each is written to the socket whole.
+    """
+    def __init__(self, sock):
+        self.sock = sock
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.send_lock = threading.Lock()
 
-    def _send_message(self, message, id):
-        encoded = self.encode(message, id, len(message))
+    def _send_message(self, message, id, kind, buffers=()):
+        parts = self.encode(message, id, kind, buffers)
         try:
-            self.sock.sendall(encoded)
+            with self.send_lock:
+                self._send_parts(parts)
         except socket.timeout:
             raise RemoteTimeoutError("Timed out while sending message data")
         except Exception as e:
             raise RemoteError("Socket error while sending message data: {}".format(str(e)))
 
-    def _recv_message(self):
-        if self.leftover:
-            bytes_recd = len(self.leftover)
-            chunks = [self.leftover]
-        else:
-            bytes_recd = 0
-            chunks = []
-
-        while bytes_recd < 9:
+    def _send_parts(self, parts):
+        """Send a sequence of bytes-like objects, without joining them together"""
+        if not HAS_SENDMSG:
+            for part in parts:
+                self.sock.sendall(part)
+            return
+
+        parts = [memoryview(part).cast('B') for part in parts if len(part)]
+        while parts:
+            n_sent = self.sock.sendmsg(parts[:IOV_MAX])
+            # Skip whatever was sent; sendmsg() may stop partway through a part
+            while parts and n_sent >= len(parts[0]):
+                n_sent -= len(parts.pop(0))
+            if n_sent:
+                parts[0] = parts[0][n_sent:]
+
+    def _recv_exactly(self, n_bytes):
+        """Receive exactly `n_bytes` bytes. Returns None if the connection closed first."""
+        buf = bytearray(n_bytes)
+        view = memoryview(buf)
+        bytes_recd = 0
+        while bytes_recd < n_bytes:
             try:
-                chunk = self.sock.recv(4096)
+                n = self.sock.recv_into(view[bytes_recd:])
             except socket.timeout:
                 raise RemoteTimeoutError("Timed out while waiting for message data")
             except Exception as e:
                 raise RemoteError("Socket error while waiting for message data: {}".format(str(e)))
+            if not n:
+                return None
+            bytes_recd += n
+        return buf
 
-            chunks.append(chunk)
-            bytes_recd += len(chunk)
-            if not chunk:
-                if bytes_recd == 0:
-                    return None
-                raise RuntimeError("Socket connection ended unexpectedly")
+    def _recv_message(self):
+        """Receive a message, returning (message, buffers, id, kind)
+
+        Returns None if the connection closed. Each out-of-band buffer is received directly into
+        its own bytearray, which a deserialized ndarray can then use as its memory.
+        """
+        header = self._recv_exactly(STRUCT.size)
+        if header is None:
+            return None
+        kind, id, n_buffers, length = self.read_header(header)
+
+        body = self._recv_exactly(n_buffers*BUFFER_LEN_STRUCT.size + length)
+        if body is None:
+            raise RemoteError("Socket connection ended unexpectedly")
+        offset = n_buffers*BUFFER_LEN_STRUCT.size
+        buffer_lens = struct.unpack('!{}Q'.format(n_buffers), bytes(body[:offset]))
+
+        buffers = []
+        for buffer_len in buffer_lens:
+            buf = self._recv_exactly(buffer_len)
+            if buf is None:
+                raise RemoteError("Socket connection ended unexpectedly")
+            buffers.append(buf)
+
+        message = memoryview(body)[offset:] if offset else body
+        return message, buffers, id, kind
 
-        id, length = self.read_header(b''.join(chunks))
+    @staticmethod
+    def encode(message, id, kind, buffers=()):
+        """Encode a message as a list of parts to be sent in order"""
+        if len(buffers) > MAX_BUFFERS:
+            raise RemoteError("Too many out-of-band buffers ({})".format(len(buffers)))
+        buffer_lens = [memoryview(buf).nbytes for buf in buffers]
+        header = (STRUCT.pack(kind, id, len(buffers), len(message)) +
+                  struct.pack('!{}Q'.format(len(buffers)), *buffer_lens))
+        return [header, message] + list(buffers)
 
-        while bytes_recd < length+9:
-            try:
-                chunk = self.sock.recv(4096)
-            except socket.timeout:
-                raise RemoteTimeoutError("Timed out while waiting for message data")
-            except Exception as e:
-                raise RemoteError("Socket error while waiting for message data: {}".format(str(e)))
+    @staticmethod
+    def read_header(message):
+        return STRUCT.unpack(bytes(message[:STRUCT.size]))
 
-            chunks.append(chunk)
-            bytes_recd += len(chunk)
-            if not chunk:
-                raise RuntimeError("Socket connection ended unexpectedly")
 
-        full_msg = b''.join(chunks)
-        chunks = [full_msg[9+length:]]
-        return full_msg[9:], id
+class Session(object):
+    """High-level session
 
-    @staticmethod
-    def encode(message, id, length):
-        return STRUCT.pack(id, length) + message
+    Objects are serialized by a codec (see `remote_codec`) to a message and a list of out-of-band
+    buffers, which hold the contents of any ndarrays so that they are sent without extra copies.
+    Each message is deserialized by whichever codec serialized it.
+    """
+    codec = get_codec(DEFAULT_CODEC)
 
-    @staticmethod
-    def decode(message):
-        id, length = STRUCT.unpack(message[:9])
-        return message[9:], id, length
+    def serialize(self, obj):
+        return self.codec.encode(obj)
 
-    @staticmethod
-    def read_header(message):
-        id, length = STRUCT.unpack(message[:9])
-        return id, length
+    def deserialize(self, message, buffers=()):
+        return decode(message, buffers)
 
 
-class Session(object):
-    """High-level session"""
-    @staticmethod
-    def serialize(obj):
-        return pickle.dumps(obj)
+class PendingRequest(object):
+    """A request that has been sent, whose response may not have arrived yet"""
+    def __init__(self, id):
+        self.id = id
+        self.event = threading.Event()
+        self.response = None
+        self.error = None
 
-    @staticmethod
-    def deserialize(data):
-        return pickle.loads(data)
+    def _set_response(self, response):
+        self.response = response
+        self.event.set()
+
+    def _set_error(self, error):
+        self.error = error
+        self.event.set()
 
 
 class ClientMessenger(Messenger):
-    def __init__(self, host, port):
-        super(ClientMessenger, self).__init__()
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.settimeout(2.0)
-        self.sock.connect((host, port))
+    """Client end of a connection, which may have many requests in flight at once
+
+    Requests are tagged with a 32-bit id and sent immediately. A background thread reads responses
+    as they arrive, in whatever order the server finishes them, and hands each one to the thread
+    waiting on the matching request.
+    """
+    def __init__(self, host, port, timeout=REQUEST_TIMEOUT):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect((host, port))
+        sock.settimeout(None)  # Timeouts are handled per-request
+        super(ClientMessenger, self).__init__(sock)
+
         self.host = host
+        self.timeout = timeout
         self.curr_id = 0
+        self.pending = {}  # id -> PendingRequest
+        self.streams = {}  # id -> Stream
+        self.pending_lock = threading.Lock()
+        self.closed_error = None
+        self.discard = None  # Called with the (message, buffers) of messages nobody waits for
+
+        self.dispatch_thread = threading.Thread(target=self._dispatch_responses,
+                                                name='remote-dispatch-{}:{}'.format(host, port))
+        self.dispatch_thread.daemon = True
+        self.dispatch_thread.start()
+
+    def is_local(self):
+        """Whether the server is on this machine"""
+        try:
+            return self.sock.getpeername()[0] == self.sock.getsockname()[0]
+        except socket.error:
+            return False
 
-    def make_request(self, request_bytes):
-        """Send request bytes to the server, and return its response bytes"""
+    def _next_id(self):
         id = self.curr_id
-        self.curr_id = (self.curr_id + 1) % 256
-        self._send_message(request_bytes, id)
-        response_bytes, resp_id = self._recv_message()
+        self.curr_id = (self.curr_id + 1) % MAX_ID
+        return id
 
-        if resp_id != id:
-            raise RuntimeError("Message IDs do not match")
+    def send_request(self, request_bytes, buffers=()):
+        """Send a request to the server without waiting for its response
 
-        return response_bytes
+        Returns a `PendingRequest` to pass to `wait_response()`.
+        """
+        with self.pending_lock:
+            if self.closed_error:
+                raise self.closed_error
+            id = self._next_id()
+            pending = self.pending[id] = PendingRequest(id)
+
+        try:
+            self._send_message(request_bytes, id, KIND_REQUEST, buffers)
+        except Exception:
+            with self.pending_lock:
+                self.pending.pop(id, None)
+            raise
+        return pending
+
+    def wait_response(self, pending, timeout=None):
+        """Wait for the response to a request sent via `send_request()`
+
+        Returns the response's (message, buffers).
+        """
+        timeout = self.timeout if timeout is None else timeout
+        if not pending.event.wait(timeout):
+            with self.pending_lock:
+                self.pending.pop(pending.id, None)
+            if not pending.event.is_set():
+                raise RemoteTimeoutError("Timed out while waiting for response from server")
+
+        if pending.error:
+            raise pending.error
+        return pending.response
+
+    def make_request(self, request_bytes, buffers=(), timeout=None):
+        """Send a request to the server, and return its response's (message, buffers)"""
+        return self.wait_response(self.send_request(request_bytes, buffers), timeout)
+
+    def add_stream(self, stream):
+        """Register a stream to receive pushed values, returning its id"""
+        with self.pending_lock:
+            if self.closed_error:
+                raise self.closed_error
+            id = self._next_id()
+            self.streams[id] = stream
+        return id
+
+    def remove_stream(self, id):
+        with self.pending_lock:
+            self.streams.pop(id, None)
+
+    def send_credit(self, id, n_values):
+        """Allow the server to push `n_values` more values to stream `id`"""
+        self._send_message(CREDIT_STRUCT.pack(n_values), id, KIND_CREDIT)
+
+    def send_release(self, message, buffers=()):
+        """Tell the server which of its shared-memory regions are no longer viewed"""
+        self._send_message(message, 0, KIND_RELEASE, buffers)
+
+    def _discard(self, message, buffers):
+        if self.discard is not None:
+            self.discard(message, buffers)
+
+    def _dispatch_responses(self):
+        error = RemoteError("Connection to server {} was closed".format(self.host))
+        try:
+            while True:
+                full_msg = self._recv_message()
+                if full_msg is None:
+                    break
+                response_bytes, buffers, id, kind = full_msg
+
+                if kind == KIND_PUSH:
+                    stream = self.streams.get(id)
+                    if stream is None:
+                        log.info("Discarding value pushed to closed stream %d", id)
+                        self._discard(response_bytes, buffers)
+                    else:
+                        stream._push(response_bytes, buffers)
+                    continue
+
+                with self.pending_lock:
+                    pending = self.pending.pop(id, None)
+                if pending is None:
+                    log.info("Discarding response to request %d, which timed out", id)
+                    self._discard(response_bytes, buffers)
+                else:
+                    pending._set_response((response_bytes, buffers))
+        except Exception as e:
+            error = e if isinstance(e, RemoteError) else RemoteError(str(e))
+
+        # Fail any requests and streams still waiting on this connection
+        with self.pending_lock:
+            self.closed_error = error
+            pending_list = list(self.pending.values()) + list(self.streams.values())
+            self.pending.clear()
+            self.streams.clear()
+        for pending in pending_list:
+            pending._set_error(error)
 
     def close(self):
+        with self.pending_lock:
+            if not self.closed_error:
+                self.closed_error = RemoteError("Connection to server {} was closed".format(
+                    self.host))
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except Exception:
+            pass  # Already disconnected
         self.sock.close()
 
 
 class ClientSession(Session):
-    def __init__(self, host, port, server):
+    """Client-side session, which may be used from several threads at once
+
+    Requests are spread over a pool of connections, which are opened as needed. All of them share
+    the same objects on the server. A dropped connection is reopened the next time one is needed,
+    and if the server has lost this session's objects (e.g. because it was restarted), the
+    instruments opened through this session are opened again from their ParamSets. A background
+    thread pings each connection periodically, so that dropped connections are noticed (and
+    reopened) promptly.
+
+    Parameters
+    ----------
+    host : str
+        Hostname or IP address of the server
+    port : int
+        Port the server is listening on
+    server : str
+        Name of the server, as given to `client_session()`
+    pool_size : int, optional
+        Maximum number of connections to open. Defaults to the `remote_pool_size` pref, or 1.
+    timeout : float, optional
+        Time to wait for a response, in seconds. Defaults to the `remote_timeout` pref, or 2. May
+        be overridden for particular requests using `request_timeout()`.
+    heartbeat : float, optional
+        Time between pings, in seconds. Defaults to the `remote_heartbeat` pref, or 5. A value of
+        0 disables the pings.
+    codec : str, optional
+        Name of the codec used to encode messages, which the server also uses for its responses.
+        Defaults to the `remote_codec` pref, or 'compact'.
+    shared_memory : bool, optional
+        Whether to receive large arrays through shared memory, rather than the socket, when the
+        server is on this machine (see `remote_shm`). Defaults to True where supported (Python
+        3.8+), unless the `remote_shm_size` pref is 0.
+    """
+    def __init__(self, host, port, server, pool_size=None, timeout=None, heartbeat=None,
+                 codec=None, shared_memory=None):
         self.host = host
         self.port = port
         self.server = server
+        if pool_size is None:
+            pool_size = conf.get_float_pref('remote_pool_size', POOL_SIZE)
+        if timeout is None:
+            timeout = conf.get_float_pref('remote_timeout', REQUEST_TIMEOUT)
+        if heartbeat is None:
+            heartbeat = conf.get_float_pref('remote_heartbeat', HEARTBEAT_INTERVAL)
+        self.pool_size = max(int(pool_size), 1)
+        self.timeout = timeout
+        self.heartbeat = heartbeat
+        self.codec = get_codec(codec or conf.prefs.get('remote_codec', DEFAULT_CODEC))
+        if remote_shm is None:
+            shared_memory = False
+        elif shared_memory is None:
+            shared_memory = conf.get_float_pref('remote_shm_size', remote_shm.RING_SIZE) > 0
+        self.shared_views = remote_shm.SharedViews() if shared_memory else None
+
+        self.client_id = uuid.uuid4().hex
+        self.messengers = []
+        self.pool_lock = threading.RLock()
+        self.instruments = weakref.WeakSet()  # RemoteInstruments to reopen after reconnecting
+        self.closed = False
+        self._add_connection()
+
+        self.heartbeat_stopped = threading.Event()
+        if heartbeat > 0:
+            thread = threading.Thread(target=self._run_heartbeat,
+                                      name='remote-heartbeat-{}:{}'.format(host, port))
+            thread.daemon = True
+            thread.start()
+
+    def close(self):
+        with self.pool_lock:
+            self.closed = True
+            self.heartbeat_stopped.set()
+            for messenger in self.messengers:
+                messenger.close()
+            self.messengers = []
+            if self.shared_views is not None:
+                self.shared_views.close()
+
+    def _add_connection(self):
+        """Open a new connection, reopening this session's instruments if the server lost them"""
         try:
-            self.messenger = ClientMessenger(host, port)
+            messenger = ClientMessenger(self.host, self.port, self.timeout)
         except socket.timeout:
-            raise RemoteTimeoutError("Could not connect to host at {}:{}; timed out".format(host, port))
+            raise RemoteTimeoutError("Could not connect to host at {}:{}; timed out".format(
+                self.host, self.port))
         except Exception as e:
             raise RemoteError("Socket error while connecting to host: {}".format(str(e)))
 
-    def close(self):
-        self.messenger.close()
+        try:
+            use_shm = self.shared_views is not None and messenger.is_local()
+            if use_shm:
+                messenger.discard = self._discard
+            is_new = self._request_on(messenger, dict(command='hello', client_id=self.client_id,
+                                                      codec=self.codec.name,
+                                                      shared_memory=use_shm))
+            if is_new:
+                self._reopen_instruments(messenger)
+        except Exception:
+            messenger.close()
+            raise
+
+        self.messengers.append(messenger)
+        return messenger
+
+    def _reopen_instruments(self, messenger):
+        for inst in list(self.instruments):
+            log.info("Reopening %r on %s", inst, self.server)
+            try:
+                new_inst = self._request_on(messenger, dict(command='create',
+                                                             params=inst._paramset))
+            except Exception as e:
+                log.warning("Could not reopen %r after reconnecting: %s", inst, e)
+            else:
+                inst._remap(new_inst)
+
+    def get_messenger(self):
+        """Get the least busy connection, opening (or reopening) one if needed"""
+        with self.pool_lock:
+            if self.closed:
+                raise RemoteError("Session is closed")
+
+            for messenger in [m for m in self.messengers if m.closed_error]:
+                log.info("Connection to %s was lost, reconnecting", self.server)
+                self.messengers.remove(messenger)
+                messenger.close()
+
+            if not self.messengers:
+                return self._add_connection()
+
+            messenger = min(self.messengers, key=lambda m: len(m.pending))
+            if messenger.pending and len(self.messengers) < self.pool_size:
+                messenger = self._add_connection()
+            return messenger
+
+    def _run_heartbeat(self):
+        while not self.heartbeat_stopped.wait(self.heartbeat):
+            with self.pool_lock:
+                messengers = list(self.messengers)
+
+            for messenger in messengers:
+                if messenger.closed_error:
+                    continue
+                try:
+                    self._request_on(messenger, dict(command='ping'),
+                                     timeout=max(self.heartbeat, self.timeout))
+                except RemoteError as e:
+                    log.info("Ping of %s failed: %s", self.server, e)
+                    messenger.close()
+
+            if any(messenger.closed_error for messenger in messengers):
+                try:
+                    self.get_messenger()
+                except RemoteError as e:
+                    log.info("Could not reconnect to %s: %s", self.server, e)
 
     def request(self, **message_dict):
-        log.debug('Sending request %r', message_dict)
-        message = self.serialize(message_dict)
-        response = self.messenger.make_request(message)
-        response_obj = self.deserialize(response)
-        log.debug('Got response %r', response_obj)
+        return self._request_on(self.get_messenger(), message_dict)
+
+    def _request_on(self, messenger, message_dict, timeout=None):
+        if timeout is None:
+            timeout = getattr(_timeouts, 'timeout', None) or self.timeout
+        log.debug('Sending request %r', _Brief(message_dict))
+        self._send_released(messenger)
+        message, buffers = self.serialize(message_dict)
+        response, response_buffers = messenger.make_request(message, buffers, timeout)
+        response_obj = self.deserialize(response, response_buffers)
+        log.debug('Got response %r', _Brief(response_obj))
         if isinstance(response_obj, Exception):
             raise response_obj
         return response_obj
 
+    def deserialize(self, message, buffers=()):
+        _deserializing.session = self
+        try:
+            return super(ClientSession, self).deserialize(message, buffers)
+        finally:
+            _deserializing.session = None
+
+    def _send_released(self, messenger):
+        """Tell the server which shared-memory regions are no longer viewed, so it can reuse them"""
+        if self.shared_views is None:
+            return
+        released = self.shared_views.take_released()
+        if released:
+            messenger.send_release(*self.serialize(released))
+
+    def _discard(self, message, buffers):
+        """Drop a message that nobody is waiting for, releasing any shared-memory arrays in it"""
+        try:
+            self.deserialize(message, buffers)
+        except Exception as e:
+            log.info("Could not deserialize discarded message: %s", e)
+
     def list_instruments(self):
-        instr_list = self.request(command='list')
+        # Allow for a directory server waiting on its upstream servers
+        timeout = getattr(_timeouts, 'timeout', None) or (
+            self.timeout + conf.get_float_pref('remote_list_timeout', LIST_TIMEOUT))
+        instr_list = self._request_on(self.get_messenger(), dict(command='list'), timeout)
         for instr in instr_list:
             instr['server'] = self.server
         return instr_list
 
     def instrument(self, params):
-        response = self.request(command='create', params=params)
-        response._session = self
-        return response
+        inst = self.request(command='create', params=params)
+        self.instruments.add(inst)
+        return inst
 
     def get_obj_attr(self, obj_id, attr):
-        obj = self.request(command='attr', obj_id=obj_id, attr=attr)
-        if isinstance(obj, RemoteObject):
-            obj._session = self
-        return obj
+        return self.request(command='attr', obj_id=obj_id, attr=attr)
 
     def set_obj_attr(self, obj_id, attr, value):
         self.request(command='setattr', obj_id=obj_id, attr=attr, value=value)
 
     def get_obj_item(self, obj_id, key):
-        obj = self.request(command='item', obj_id=obj_id, key=key)
-        if isinstance(obj, RemoteObject):
-            obj._session = self
-        return obj
+        return self.request(command='item', obj_id=obj_id, key=key)
 
     def set_obj_item(self, obj_id, key, value):
         self.request(command='setitem', obj_id=obj_id, key=key, value=value)
 
     def get_obj_call(self, obj_id, *args, **kwargs):
-        obj = self.request(command='call', obj_id=obj_id, args=args, kwargs=kwargs)
-        if isinstance(obj, RemoteObject):
-            obj._session = self
-        return obj
+        return self.request(command='call', obj_id=obj_id, args=args, kwargs=kwargs)
+
+    def call_method(self, obj_id, name, args=(), kwargs=None):
+        """Call the method `name` of a remote object in a single request
+
+        `name` may be a dotted path, e.g. ``'facets.power.get_value'``.
+        """
+        return self.request(command='call_method', obj_id=obj_id, name=name, args=args,
+                            kwargs=kwargs or {})
+
+    def subscribe(self, obj, name, args=(), kwargs=None, rate=None, policy='latest', window=2):
+        """Have the server call a method repeatedly and push its results to this client
+
+        Parameters
+        ----------
+        obj : RemoteObject
+            The remote object whose method to call
+        name : str
+            Name (or dotted path) of the method, e.g. ``'grab_image'``
+        args, kwargs : optional
+            Arguments to pass to the method on each call
+        rate : pint.Quantity, str, or number, optional
+            Maximum rate at which to call the method (numbers are taken to be in Hz). By default,
+            it is called as fast as possible.
+        policy : {'latest', 'block'}, optional
+            What the server does when this client falls behind. With 'latest', it keeps calling
+            the method but holds on to only the most recent value, dropping older ones. With
+            'block', it stops calling the method until the client catches up, so nothing is
+            dropped.
+        window : int, optional
+            Maximum number of values that may be in flight or waiting to be read by the client
+
+        Returns
+        -------
+        stream : Stream
+            Stream from which to read the pushed values
+        """
+        if policy not in STREAM_POLICIES:
+            raise ValueError("policy must be one of {}".format(STREAM_POLICIES))
+        if rate is not None and not isinstance(rate, Number):
+            rate = to_quantity(rate).m_as('Hz')
+        period = 1. / rate if rate else 0.
+
+        messenger = self.get_messenger()
+        stream = Stream(self, messenger)
+        stream.id = messenger.add_stream(stream)
+        try:
+            self._request_on(messenger, dict(command='subscribe', obj_id=obj._obj_id,
+                                             stream_id=stream.id, name=name, args=args,
+                                             kwargs=kwargs or {}, period=period, policy=policy,
+                                             credits=window))
+        except Exception:
+            messenger.remove_stream(stream.id)
+            raise
+        return stream
+
+    def metrics(self):
+        """Get the server's metrics
+
+        Includes 'reads', a list with the read statistics of each instrument this session has
+        open: its number of facet reads, how many were served from the server's cache ('hits') or
+        by waiting on an identical read ('coalesced'), and the fraction of reads served either
+        way ('hit_ratio'). Servers running in asyncio mode (see `remote_async.AsyncServer`) also
+        report the number of connections, and the number of requests queued for each instrument.
+        """
+        return self.request(command='metrics')
+
+    def batch(self):
+        """Create a `Batch` for sending several requests in a single message
+
+        Use it as a context manager; the requests are sent when the block exits::
+
+            with session.batch() as batch:
+                power = batch.getattr(meter, 'power')
+                batch.call(meter, 'set_wavelength', '780 nm')
+            print(power.value)
+        """
+        return Batch(self)
+
+
+class Stream(object):
+    """Values pushed by the server from a subscription made with `ClientSession.subscribe()`
+
+    Read values with `get()` or by iterating over the stream. Each value read lets the server push
+    another. `seq` is the sequence number of the last value read, and `dropped` is the number of
+    values the server has dropped because this client was falling behind.
+    """
+    def __init__(self, session, messenger):
+        self.session = session
+        self.messenger = messenger  # Streams are tied to the connection they were opened on
+        self.id = None
+        self.seq = None
+        self.dropped = 0
+        self.closed = False
+        self.queue = queue.Queue()
 
+    def __repr__(self):
+        return "<Stream {} from {}>".format(self.id, self.session.server)
 
-class ServerMessenger(Messenger):
-    """Server-side session representing a connection to a client"""
-    def __init__(self, socket):
-        super(ServerMessenger, self).__init__()
-        self.sock = socket
-        self.curr_id = None
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.get()
+            except RemoteError:
+                if self.closed:
+                    return
+                raise
+
+    def _push(self, message, buffers):
+        self.queue.put((message, buffers))
+
+    def _set_error(self, error):
+        self.queue.put(error)
 
+    def get(self, timeout=None):
+        """Get the next value, waiting up to `timeout` seconds (forever by default)"""
+        try:
+            item = self.queue.get(True, timeout)
+        except queue.Empty:
+            raise RemoteTimeoutError("Timed out while waiting for streamed value")
+
+        if isinstance(item, Exception):
+            self.queue.put(item)  # So later calls fail too
+            raise item
+
+        self.session._send_released(self.messenger)
+        self.messenger.send_credit(self.id, 1)
+        self.seq, self.dropped, value = self.session.deserialize(*item)
+        if isinstance(value, Exception):
+            self._set_error(value)  # The server ends a stream whose method raises
+            raise value
+        return value
+
+    def close(self):
+        """Stop the server from pushing values to this stream"""
+        if self.closed:
+            return
+        self.closed = True
+        self.messenger.remove_stream(self.id)
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if not isinstance(item, Exception):
+                self.messenger._discard(*item)
+        self._set_error(RemoteError("Stream is closed"))
+        try:
+            self.session._request_on(self.messenger, dict(command='unsubscribe',
+                                                          stream_id=self.id))
+        except RemoteError:
+            pass  # Connection is gone, so the server has stopped the stream already
+
+
+class BatchResult(object):
+    """The eventual result of a request made within a `Batch`"""
+    def __init__(self):
+        self.done = False
+        self._value = None
+
+    def _set(self, value):
+        self._value = value
+        self.done = True
+
+    @property
+    def value(self):
+        """The result of the request. Raises the request's exception if it failed."""
+        if not self.done:
+            raise RemoteError("Batch has not been sent yet")
+        if isinstance(self._value, Exception):
+            raise self._value
+        return self._value
+
+
+class Batch(object):
+    """Collects requests to be sent to a server together, in one message
+
+    Each method queues a request and returns a `BatchResult`. The requests are run in order by the
+    server when the batch is sent, and a failing request does not stop the ones after it. Attribute
+    and method names may be dotted paths, e.g. ``'facets.power'``.
+    """
+    def __init__(self, session):
+        self.session = session
+        self.requests = []
+        self.results = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.send()
+
+    def _add(self, **request):
+        result = BatchResult()
+        self.requests.append(request)
+        self.results.append(result)
+        return result
+
+    def getattr(self, obj, name):
+        return self._add(command='attr', obj_id=obj._obj_id, attr=name)
+
+    def setattr(self, obj, name, value):
+        return self._add(command='setattr', obj_id=obj._obj_id, attr=name, value=value)
+
+    def getitem(self, obj, key):
+        return self._add(command='item', obj_id=obj._obj_id, key=key)
+
+    def setitem(self, obj, key, value):
+        return self._add(command='setitem', obj_id=obj._obj_id, key=key, value=value)
+
+    def call(self, obj, name, *args, **kwargs):
+        return self._add(command='call_method', obj_id=obj._obj_id, name=name, args=args,
+                         kwargs=kwargs)
+
+    def send(self):
+        """Send the queued requests and fill in their results"""
+        requests, results = self.requests, self.results
+        self.requests, self.results = [], []
+        if not requests:
+            return
+
+        values = self.session.request(command='batch', requests=requests)
+        for result, value in zip(results, values):
+            result._set(value)
+
+
+class ServerMessenger(Messenger):
+    """Server end of a connection to a client"""
     def listen(self):
-        """Listen for an incoming byte message. Returns None if connection was closed"""
+        """Listen for an incoming request, credit, or release message
+
+        Returns (message, buffers, id, kind), or None if connection was closed.
+        """
         full_msg = self._recv_message()
-        if full_msg:
-            msg, id = full_msg
-            self.curr_id = id
-            return msg
-        return None
+        if full_msg is None:
+            return None
+        kind = full_msg[3]
+        if kind not in (KIND_REQUEST, KIND_CREDIT, KIND_RELEASE):
+            raise RemoteError("Expected a request message, got message of kind {}".format(kind))
+        return full_msg
 
-    def respond(self, response_bytes):
-        """Respond (in bytes) to a message received via listen()"""
-        if self.curr_id is None:
-            raise Exception("Invalid message id. respond() must be used to respond to a "
-                            "message received via listen()")
-        self._send_message(response_bytes, self.curr_id)
+    def respond(self, response_bytes, buffers, id):
+        """Respond to the request with the given id, received via listen()"""
+        self._send_message(response_bytes, id, KIND_RESPONSE, buffers)
+
+    def push(self, value_bytes, buffers, stream_id):
+        """Push a value to the client's stream with the given id"""
+        self._send_message(value_bytes, stream_id, KIND_PUSH, buffers)
 
 
 class ObjectEntry(object):
-    def __init__(self, obj, remote_obj, lock, share):
+    def __init__(self, obj, remote_obj, lock, share, reads=None):
         self.id = id(obj)
         self.obj = obj
         self.remote_obj = remote_obj
         self.lock = lock
         self.share = share
+        self.reads = reads  # ReadCache of the instrument this object belongs to
+
+
+class ReadCache(object):
+    """Coalesces and caches reads of an instrument's facets
+
+    A read that arrives while an identical one is in flight waits for that read's result instead
+    of going to the instrument itself. The values of cacheable facets are also kept for `ttl`
+    seconds (or the facet's `max_age`, if shorter), and served without waiting for the
+    instrument's lock. Any other request to the instrument clears the cache, since it may have
+    changed the instrument's state.
+
+    A shared instrument has a single ReadCache, so these apply across all of its clients.
+    """
+    def __init__(self, name, ttl):
+        self.name = name
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.in_flight = {}  # key -> PendingRequest
+        self.cache = {}  # key -> (expiration time, value)
+        self.n_reads = 0
+        self.n_hits = 0  # Reads served from the cache
+        self.n_coalesced = 0  # Reads which waited on an identical read in flight
+
+    def read(self, key, facet, func):
+        """Get the value of `facet`, calling `func` to read it if needed
+
+        Returns (value, called), where `called` is whether this call to `read()` called `func`.
+        """
+        with self.lock:
+            self.n_reads += 1
+            cached = self.cache.get(key)
+            if cached is not None and cached[0] > time.time():
+                self.n_hits += 1
+                return cached[1], False
+
+            pending = self.in_flight.get(key)
+            is_reader = pending is None  # Only the first of identical reads calls `func`
+            if is_reader:
+                pending = self.in_flight[key] = PendingRequest(key)
+            else:
+                self.n_coalesced += 1
+
+        if not is_reader:
+            pending.event.wait()
+            if pending.error:
+                raise pending.error
+            return pending.response, False
+
+        try:
+            value = func()
+        except Exception as e:
+            with self.lock:
+                self._finish(key, pending)
+            pending._set_error(e)
+            raise
+
+        ttl = self.ttl if facet.cacheable else 0
+        if facet.max_age is not None:
+            ttl = min(ttl, facet.max_age)
+        with self.lock:
+            if self._finish(key, pending) and ttl > 0:
+                self.cache[key] = (time.time() + ttl, value)
+        pending._set_response(value)
+        return value, True
+
+    def has_result(self, key):
+        """Whether a read of `key` would be answered without calling the instrument"""
+        with self.lock:
+            cached = self.cache.get(key)
+            return key in self.in_flight or (cached is not None and cached[0] > time.time())
+
+    def _finish(self, key, pending):
+        """Remove a finished read, returning False if it was invalidated while in flight"""
+        if self.in_flight.get(key) is not pending:
+            return False
+        del self.in_flight[key]
+        return True
+
+    def invalidate(self):
+        """Forget cached values, and have new reads ignore any reads already in flight"""
+        with self.lock:
+            self.cache.clear()
+            self.in_flight.clear()
+
+    def stats(self):
+        n_served = self.n_hits + self.n_coalesced
+        return {'name': self.name, 'reads': self.n_reads, 'hits': self.n_hits,
+                'coalesced': self.n_coalesced,
+                'hit_ratio': float(n_served) / self.n_reads if self.n_reads else 0.}
+
+
+_NOTHING = object()  # Placeholder for a stream with no held-back value
+
+
+class ClientState(object):
+    """Server-side record of a client's objects, which are shared by all its connections"""
+    def __init__(self, obj_table, lock):
+        self.obj_table = obj_table
+        self.lock = lock
+        self.n_connections = 0
+
+
+class ServerStream(object):
+    """Server end of a stream, which calls a method repeatedly and pushes the results
+
+    A value is pushed only if the client has given credit for it. Otherwise, with the 'latest'
+    policy the newest value is held back until credit arrives, replacing (and dropping) any value
+    already held; with the 'block' policy the method isn't called until credit arrives.
+    """
+    def __init__(self, session, stream_id, entry, name, args, kwargs, period, policy, credits):
+        self.session = session
+        self.stream_id = stream_id
+        self.entry = entry
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+        self.period = period
+        self.policy = policy
+        self.credits = credits
+        self.held = _NOTHING
+        self.seq = 0
+        self.dropped = 0
+        self.stopped = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name='stream-{}'.format(name))
+        self.thread.daemon = True
+
+    def add_credit(self, n_values):
+        with self.cond:
+            self.credits += n_values
+            self.cond.notify()
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+        if threading.current_thread() is not self.thread:
+            self.thread.join()
+
+    def _next_action(self, next_time):
+        """Wait until there's a held value to send or it's time to call the method again
+
+        Returns the held value to send, or _NOTHING if the method should be called.
+        """
+        with self.cond:
+            while not self.stopped:
+                if self.credits and self.held is not _NOTHING:
+                    self.credits -= 1
+                    value, self.held = self.held, _NOTHING
+                    return value
+                if self.policy == 'block' and not self.credits:
+                    self.cond.wait()
+                    continue
+                delay = next_time - time.time()
+                if delay <= 0:
+                    return _NOTHING
+                self.cond.wait(delay)
+        return None
+
+    def _run(self):
+        next_time = time.time()
+        while True:
+            value = self._next_action(next_time)
+            if self.stopped:
+                return
+
+            if value is _NOTHING:
+                next_time = max(next_time + self.period, time.time())
+                try:
+                    with self.entry.lock:
+                        method = _getattr_path(self.entry.obj, self.name)
+                        value = method(*self.args, **self.kwargs)
+                except Exception as e:
+                    log.exception(e)
+                    self.stopped = True
+                    self._push(e)
+                    return
+
+                with self.cond:
+                    if not self.credits:
+                        if self.held is not _NOTHING:
+                            self.dropped += 1
+                        self.held = value
+                        continue
+                    self.credits -= 1
+            self._push(value)
+
+    def _push(self, value):
+        self.seq += 1
+        lock = self.entry.lock
+        try:
+            with lock:
+                value = self.session.substitute(value, lock)
+                value_bytes, buffers = self.session.serialize((self.seq, self.dropped, value), lock)
+                self.session.messenger.push(value_bytes, buffers, self.stream_id)
+        except RemoteError as e:
+            log.info("Could not push to stream %d: %s", self.stream_id, e)
+            self.stopped = True
 
 
 class ServerSession(Session):
-    def __init__(self, socket, shared_obj_table, table_lock):
+    """Server-side session representing a connection to a client
+
+    Requests are read as they arrive and handled by a pool of worker threads, so a slow request
+    doesn't hold up requests for other objects. Each instrument has a lock, shared by any objects
+    gotten from it, which serializes the requests made to it.
+    """
+    def __init__(self, messenger, shared_obj_table, table_lock, client_tables=None,
+                 directory=None):
         self.command_handler = {
             'create': self.handle_create,
             'list': self.handle_list,
@@ -257,13 +1158,28 @@ class ServerSession(Session):
             'setattr': self.handle_setattr,
             'item': self.handle_item,
             'setitem': self.handle_setitem,
-            'call': self.handle_call
+            'call': self.handle_call,
+            'call_method': self.handle_call_method,
+            'batch': self.handle_batch,
+            'subscribe': self.handle_subscribe,
+            'unsubscribe': self.handle_unsubscribe,
+            'hello': self.handle_hello,
+            'ping': self.handle_ping,
+            'metrics': self.handle_metrics,
         }
         self.shared_obj_table = shared_obj_table
         self.shared_table_lock = table_lock
-
-        self.messenger = ServerMessenger(socket)
+        self.client_tables = {} if client_tables is None else client_tables  # id -> ClientState
+        self.client_id = None
+        self.directory = directory  # Upstream servers, when acting as a directory
+        self.use_shared_memory = False  # Whether to send large arrays through shared memory
+        self.shared_ring = None  # Created when first needed
+        self.shared_ring_lock = threading.Lock()
+
+        self.messenger = messenger
         self.obj_table = {}  # id -> ObjectEntry
+        self.obj_table_lock = threading.Lock()
+        self.streams = {}  # id -> ServerStream
 
     def _get_shared_inst(self, params):
         """Get shared instrument if it exists, otherwise create it and add it to the table"""
@@ -275,16 +1191,15 @@ class ServerSession(Session):
             except KeyError:
                 inst = self.shared_obj_table[key] = instrument(params)
                 inst._server_refcount = 0
+                inst._server_lock = threading.RLock()
+                inst._server_reads = self.new_read_cache(inst)
             inst._server_refcount += 1
 
-            # Get or create module-level lock
-            module_name = inst.__class__.__module__
-            try:
-                lock = self.shared_obj_table[module_name]
-            except KeyError:
-                lock = self.shared_obj_table[module_name] = threading.RLock()
+        return inst, inst._server_lock, inst._server_reads
 
-        return inst, lock
+    @staticmethod
+    def new_read_cache(inst):
+        return ReadCache(repr(inst), conf.get_float_pref('remote_cache_ttl', CACHE_TTL))
 
     def _close_shared_inst(self, entry):
         with entry.lock:
@@ -303,39 +1218,106 @@ class ServerSession(Session):
             for key in keys_to_remove:
                 del self.shared_obj_table[key]
 
+    def handle_hello(self, request):
+        """Attach this connection to the client's objects, returning True if it has none yet
+
+        Also switches to encoding messages with the client's codec, and to sending large arrays
+        through shared memory if the client is on this machine and asks for it.
+        """
+        self.codec = get_codec(request['codec'])
+        self.use_shared_memory = bool(request.get('shared_memory')) and remote_shm is not None
+        with self.shared_table_lock:
+            state = self.client_tables.get(request['client_id'])
+            is_new = state is None
+            if is_new:
+                state = ClientState(self.obj_table, self.obj_table_lock)
+                self.client_tables[request['client_id']] = state
+            state.n_connections += 1
+            self.client_id = request['client_id']
+            self.obj_table, self.obj_table_lock = state.obj_table, state.lock
+        return is_new, FAKE_LOCK
+
+    def handle_ping(self, request):
+        return None, FAKE_LOCK
+
+    def handle_metrics(self, request):
+        return {'reads': self.read_stats()}, FAKE_LOCK
+
+    def read_stats(self):
+        """Get the `ReadCache` stats of each instrument this client has open"""
+        with self.obj_table_lock:
+            caches = {id(entry.reads): entry.reads for entry in self.obj_table.values()
+                      if entry.reads is not None}
+        return [cache.stats() for cache in caches.values()]
+
     def handle_create(self, request):
         params = request['params']._dict.copy()
         params.pop('server')  # Needed to force instrument() to look locally
         share = params.pop('share', False)
 
+        upstream = params.pop('upstream', None)
+        if upstream is not None:
+            # Open a proxy for the instrument on its server, which handles any sharing itself
+            params['server'] = upstream
+            params['share'] = share
+            share = False
+
         if share:
-            inst, lock = self._get_shared_inst(params)
+            inst, lock, reads = self._get_shared_inst(params)
         else:
             # TODO: Add warning or error if instrument is already shared
             inst = instrument(params)
-            lock = FAKE_LOCK
+            lock = threading.RLock()
+            reads = self.new_read_cache(inst)
 
         obj_id = id(inst)
         remote_obj = RemoteInstrument._create_remote(request['params'], obj_id, None, dir(inst),
-                                                     repr(inst))
-        self.obj_table[obj_id] = ObjectEntry(inst, remote_obj, lock, share)
+                                                     repr(inst), _method_names(inst))
+        with self.obj_table_lock:
+            self.obj_table[obj_id] = ObjectEntry(inst, remote_obj, lock, share, reads)
         return remote_obj, lock
 
     def handle_list(self, request):
         # TODO: Handle locking of listed instruments
-        return list_instruments(), FAKE_LOCK
+        inst_list = list_instruments()
+        if self.directory is not None:
+            for params in list_remote_instruments(self.directory):
+                params['upstream'] = params['server']  # The client replaces 'server' with us
+                inst_list.append(params)
+        return inst_list, FAKE_LOCK
 
     def handle_attr(self, request):
         obj_id = request['obj_id']
         entry = self.obj_table[obj_id]
-        with entry.lock:
-            return getattr(entry.obj, request['attr']), entry.lock
+        attr = request['attr']
+
+        # Reads of an instrument's facets go through its ReadCache
+        facet = getattr(type(entry.obj), attr, None) if '.' not in attr else None
+        if entry.reads is None or not isinstance(facet, Facet):
+            with entry.lock:
+                return _getattr_path(entry.obj, attr), entry.lock
+
+        def read():
+            with entry.lock:
+                return getattr(entry.obj, attr)
+        value, called = entry.reads.read((obj_id, attr), facet, read)
+        # Facet values are snapshots, so one we didn't read ourselves is sent without the lock
+        return value, entry.lock if called else FAKE_LOCK
+
+    def _modified(self, entry):
+        """Note that a request may have changed the state of `entry`'s instrument"""
+        if entry.reads is not None:
+            entry.reads.invalidate()
 
     def handle_setattr(self, request):
         obj_id = request['obj_id']
         entry = self.obj_table[obj_id]
+        parent_path, _, name = request['attr'].rpartition('.')
         with entry.lock:
-            setattr(entry.obj, request['attr'], request['value'])
+            try:
+                setattr(_getattr_path(entry.obj, parent_path), name, request['value'])
+            finally:
+                self._modified(entry)
         return None, FAKE_LOCK
 
     def handle_item(self, request):
@@ -348,68 +1330,267 @@ class ServerSession(Session):
         obj_id = request['obj_id']
         entry = self.obj_table[obj_id]
         with entry.lock:
-            entry.obj[request['key']] = request['value']
+            try:
+                entry.obj[request['key']] = request['value']
+            finally:
+                self._modified(entry)
         return None, FAKE_LOCK
 
     def handle_call(self, request):
         obj_id = request['obj_id']
         entry = self.obj_table[obj_id]
         with entry.lock:
-            return entry.obj(*request['args'], **request['kwargs']), entry.lock
+            try:
+                return entry.obj(*request['args'], **request['kwargs']), entry.lock
+            finally:
+                self._modified(entry)
+
+    def handle_call_method(self, request):
+        obj_id = request['obj_id']
+        entry = self.obj_table[obj_id]
+        with entry.lock:
+            try:
+                method = _getattr_path(entry.obj, request['name'])
+                return method(*request['args'], **request['kwargs']), entry.lock
+            finally:
+                self._modified(entry)
+
+    def handle_batch(self, request):
+        results = []
+        for sub_request in request['requests']:
+            sub_request = dict(sub_request)
+            command = sub_request.pop('command')
+            try:
+                handler = self.command_handler.get(command, self.handle_none)
+                response, lock = handler(sub_request)
+                response = self.substitute(response, lock)
+            except Exception as e:
+                log.exception(e)
+                response = e
+            results.append(response)
+        return results, FAKE_LOCK
+
+    def handle_subscribe(self, request):
+        entry = self.obj_table[request['obj_id']]
+        with entry.lock:
+            _getattr_path(entry.obj, request['name'])  # Fail now if there's no such method
+
+        if request['policy'] not in STREAM_POLICIES:
+            raise ValueError("policy must be one of {}".format(STREAM_POLICIES))
+        stream = ServerStream(self, request['stream_id'], entry, request['name'], request['args'],
+                              request['kwargs'], request['period'], request['policy'],
+                              request['credits'])
+        self.streams[stream.stream_id] = stream
+        stream.thread.start()
+        return None, FAKE_LOCK
+
+    def handle_unsubscribe(self, request):
+        stream = self.streams.pop(request['stream_id'], None)
+        if stream is not None:
+            stream.stop()
+        return None, FAKE_LOCK
+
+    def handle_credit(self, message_bytes, stream_id):
+        n_values, = CREDIT_STRUCT.unpack(bytes(message_bytes))
+        stream = self.streams.get(stream_id)
+        if stream is not None:
+            stream.add_credit(n_values)
+
+    def handle_release(self, message_bytes, buffers):
+        released = self.deserialize(message_bytes, buffers)
+        with self.shared_ring_lock:
+            ring = self.shared_ring
+        if ring is None:
+            return
+
+        # Only our own ring's arrays, which it releases at most once each
+        for name, number in released:
+            if name == ring.name:
+                ring.release(number)
 
     def handle_none(self, request):
         return Exception("Unknown command"), FAKE_LOCK
 
+    def substitute(self, obj, lock):
+        """Get what to send in place of `obj`, which is a RemoteObject if it can't be pickled"""
+        try:
+            return self.obj_table[id(obj)].remote_obj
+        except KeyError:
+            pass
+
+        if _is_proxy(obj):
+            return self.new_remote_obj(obj, lock)  # From an upstream server, in directory mode
+
+        with lock:
+            if not can_encode(obj):
+                return self.new_remote_obj(obj, lock)
+        return obj
+
     def serialize(self, obj, lock):
         parent_serialize = super(ServerSession, self).serialize
+        if self.use_shared_memory:
+            obj = self.share_arrays(obj, lock)
 
         # Use RemoteObject if obj has one
         try:
             obj = self.obj_table[id(obj)].remote_obj
         except KeyError:
-            pass
+            if _is_proxy(obj):
+                # From an upstream server (in directory mode), so we serve it as our own
+                return parent_serialize(self.new_remote_obj(obj, lock))
 
         with lock:
             try:
-                bytes = parent_serialize(obj)
+                return parent_serialize(obj)
             except TypeError:
-                bytes = parent_serialize(self.new_remote_obj(obj, lock))
-        return bytes
+                return parent_serialize(self.new_remote_obj(obj, lock))
+
+    def share_arrays(self, obj, lock):
+        """Replace large arrays in `obj`, or directly within a tuple or list, with SharedArrays"""
+        can_share = remote_shm.can_share
+        if can_share(obj):
+            return self._put_shared(obj, lock)
+        elif type(obj) in (tuple, list) and any(can_share(item) for item in obj):
+            return type(obj)(self._put_shared(item, lock) if can_share(item) else item
+                             for item in obj)
+        return obj
+
+    def _put_shared(self, array, lock):
+        with self.shared_ring_lock:
+            if self.shared_ring is None:
+                size = conf.get_float_pref('remote_shm_size', remote_shm.RING_SIZE)
+                if size <= 0:
+                    self.use_shared_memory = False
+                    return array
+                self.shared_ring = remote_shm.SharedRing(int(size * 2**20))
+        with lock:
+            shared = self.shared_ring.put(array)
+        return array if shared is None else shared
 
     def new_remote_obj(self, obj, lock):
         with lock:
             obj_id = id(obj)
-            remote_obj = RemoteObject(obj_id, dir(obj), repr(obj))
-            shared = (lock is not FAKE_LOCK)
-            self.obj_table[obj_id] = ObjectEntry(obj, remote_obj, lock, shared)
+            remote_obj = RemoteObject(obj_id, dir(obj), repr(obj), methods=_method_names(obj))
+            if lock is FAKE_LOCK:
+                lock = threading.RLock()  # Objects need their own lock, as requests are concurrent
+            with self.obj_table_lock:
+                owners = [entry for entry in self.obj_table.values() if entry.lock is lock]
+                shared = any(entry.share for entry in owners)
+                reads = owners[0].reads if owners else None
+                self.obj_table[obj_id] = ObjectEntry(obj, remote_obj, lock, shared, reads)
             return remote_obj
 
-    def handle_requests(self):
-        while True:
-            message_bytes = self.messenger.listen()
-            if message_bytes is None:
-                log.info("Received EOF, closing connection.")
-                break
+    def handle_request(self, message_bytes, buffers=()):
+        """Handle a single serialized request
+
+        Returns the serialized response as (message, buffers, lock). The buffers may share memory
+        with the object the response came from, so the response should be sent while holding
+        `lock`.
+        """
+        return self.run_request(self.deserialize(message_bytes, buffers))
+
+    def run_request(self, request):
+        """Handle a deserialized request. Returns the same as `handle_request()`."""
+        log.debug('Received request %r', _Brief(request))
+        command = request.pop('command')
+
+        try:
+            handler = self.command_handler.get(command, self.handle_none)
+            response, lock = handler(request)
+        except Exception as e:
+            log.exception(e)
+            response = e
+            lock = FAKE_LOCK
 
-            request = self.deserialize(message_bytes)
-            log.debug('Received request %r', request)
-            command = request.pop('command')
+        log.debug('Sending response %r', _Brief(response))
+        try:
+            response_bytes, response_buffers = self.serialize(response, lock)
+        except Exception as e:
+            log.exception(e)
+            error = RemoteError("Could not serialize response: {}".format(e))
+            response_bytes, response_buffers = self.serialize(error, FAKE_LOCK)
+            lock = FAKE_LOCK
+        return response_bytes, response_buffers, lock
 
+    def respond(self, response_bytes, response_buffers, lock, id):
+        """Send the response to request `id`, or an error if it can't be sent"""
+        try:
+            with lock:
+                self.messenger.respond(response_bytes, response_buffers, id)
+        except RemoteError as e:
+            log.info("Could not send response to request %d: %s", id, e)
+            # Let the client know, rather than leaving it to time out, if the connection still works
             try:
-                handler = self.command_handler.get(command, self.handle_none)
-                response, lock = handler(request)
-            except Exception as e:
-                log.exception(e)
-                response = e
-                lock = FAKE_LOCK
+                error = RemoteError("Could not send response: {}".format(e))
+                error_bytes, error_buffers = self.serialize(error, FAKE_LOCK)
+                self.messenger.respond(error_bytes, error_buffers, id)
+            except RemoteError:
+                pass
+
+    def _work(self, request_queue):
+        while True:
+            item = request_queue.get()
+            if item is None:
+                return
+            message_bytes, buffers, id, kind = item
+            response_bytes, response_buffers, lock = self.handle_request(message_bytes, buffers)
+            self.respond(response_bytes, response_buffers, lock, id)
 
-            log.info('Sending response %r', response)
-            self.messenger.respond(self.serialize(response, lock))
+    def handle_requests(self):
+        request_queue = queue.Queue()
+        workers = [threading.Thread(target=self._work, args=(request_queue,))
+                   for _ in range(WORKERS_PER_CONNECTION)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+
+        try:
+            while True:
+                full_msg = self.messenger.listen()
+                if full_msg is None:
+                    log.info("Received EOF, closing connection.")
+                    break
+                message_bytes, buffers, id, kind = full_msg
+                if kind == KIND_CREDIT:
+                    self.handle_credit(message_bytes, id)
+                elif kind == KIND_RELEASE:
+                    self.handle_release(message_bytes, buffers)
+                else:
+                    request_queue.put(full_msg)
+        except RemoteError as e:
+            log.info("Connection to client failed: %s", e)
+
+        for worker in workers:
+            request_queue.put(None)
+        for worker in workers:
+            worker.join()
+
+        self.close_objects()
+
+    def close_objects(self):
+        """Stop this session's streams and close the instruments it opened"""
+        for stream in list(self.streams.values()):
+            stream.stop()
+        self.streams.clear()
+
+        with self.shared_ring_lock:
+            if self.shared_ring is not None:
+                self.shared_ring.close()
+                self.shared_ring = None
+
+        if self.client_id is not None:
+            with self.shared_table_lock:
+                state = self.client_tables[self.client_id]
+                state.n_connections -= 1
+                if state.n_connections > 0:
+                    return  # Other connections from this client are still using the objects
+                del self.client_tables[self.client_id]
 
-        # Clean up before we exit
         log.info('Cleaning up open objects')
         for entry in self.obj_table.values():
-            if isinstance(entry.obj, Instrument):
+            # Includes proxies for instruments on upstream servers, in directory mode
+            is_proxy = _is_proxy(entry.obj) and '_paramset' in entry.obj._local_attrs
+            if isinstance(entry.obj, Instrument) or is_proxy:
                 if entry.share:
                     self._close_shared_inst(entry)
                 else:
@@ -424,25 +1605,101 @@ class ServerSession(Session):
 class ThreadedTCPRequestHandler(socketserver.BaseRequestHandler):
     def handle(self):
         log.info("Opening connection to client...")
-        session = ServerSession(self.request, self.server.shared_obj_table, self.server.table_lock)
-        session.handle_requests()
+        session = ServerSession(ServerMessenger(self.request), self.server.shared_obj_table,
+                                self.server.table_lock, self.server.client_tables,
+                                self.server.directory)
+        with self.server.connections_lock:
+            self.server.connections.add(self.request)
+        try:
+            session.handle_requests()
+        finally:
+            with self.server.connections_lock:
+                self.server.connections.discard(self.request)
 
 
 class ThreadedTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
-    def __init__(self, server_address):
+    """Instrument server, which handles each connection on its own thread
+
+    Parameters
+    ----------
+    server_address : (str, int)
+        Host and port to listen on. Use a port of 0 to pick any free port.
+    directory : list of str, or str, optional
+        If given, the server also acts as a directory for these servers (see
+        `list_remote_instruments()`). Listing its instruments includes theirs, which clients can
+        then open through this server, as it relays their requests.
+    """
+    allow_reuse_address = True  # Allow restarting on the same port that clients reconnect to
+
+    def __init__(self, server_address, directory=None):
         socketserver.TCPServer.__init__(self, server_address, ThreadedTCPRequestHandler)
+        self.directory = directory
         self.shared_obj_table = {}
+        self.client_tables = {}
         self.table_lock = threading.RLock()
+        self.connections = set()
+        self.connections_lock = threading.Lock()
         log.info("Server started...")
 
+    def server_close(self):
+        """Close the listening socket and all connections, closing the instruments they opened"""
+        with self.connections_lock:
+            connections = list(self.connections)
+        for sock in connections:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+        if hasattr(socketserver.ThreadingMixIn, 'server_close'):
+            socketserver.ThreadingMixIn.server_close(self)  # Also joins the handler threads
+        else:
+            socketserver.TCPServer.server_close(self)
+
+
+def _getattr_path(obj, path):
+    """Get an attribute given a dotted path like 'facets.power'. An empty path gives `obj`."""
+    for name in path.split('.') if path else ():
+        obj = getattr(obj, name)
+    return obj
+
+
+def _is_proxy(obj):
+    """Whether `obj` is a proxy for an object on another server, rather than one of our own"""
+    return isinstance(obj, RemoteObject) and obj._session is not None
+
+
+def _method_names(obj):
+    """Get the names of `obj`'s methods, as defined by its class"""
+    if isinstance(obj, RemoteObject):
+        return obj._methods
+    cls = type(obj)
+    return frozenset(name for name in dir(obj)
+                     if inspect.isroutine(getattr(cls, name, None)))
+
+
+class RemoteMethod(object):
+    """Proxy for a method of a RemoteObject. Calling it takes a single request."""
+    def __init__(self, obj, name):
+        self._obj = obj
+        self._name = name
+
+    def __repr__(self):
+        return "<Remote method {} of {!r}>".format(self._name, self._obj)
+
+    def __call__(self, *args, **kwargs):
+        return self._obj._session.call_method(self._obj._obj_id, self._name, args, kwargs)
+
 
 class RemoteObject(object):
-    def __init__(self, id, dirlist, reprname, session=None):
+    def __init__(self, id, dirlist, reprname, session=None, methods=()):
         self.__dict__['_local_attrs'] = set(('_local_attrs',))
         self._local_setattr('_obj_id', id)
         self._local_setattr('_reprname', "<Remote {}>".format(reprname))
         self._local_setattr('_session', session)
         self._local_setattr('_dirlist', dirlist)
+        self._local_setattr('_methods', methods)
+        self.__dict__['_method_cache'] = {}  # Not sent along when pickled
 
     def _local_setattr(self, name, value):
         self.__dict__[name] = value
@@ -462,6 +1719,12 @@ class RemoteObject(object):
         return self._reprname
 
     def __getattr__(self, name):
+        if name in self._methods:
+            try:
+                return self._method_cache[name]
+            except KeyError:
+                method = self._method_cache[name] = RemoteMethod(self, name)
+                return method
         return self._session.get_obj_attr(self._obj_id, name)
 
     def __setattr__(self, name, value):
@@ -482,8 +1745,17 @@ class RemoteObject(object):
     def __getstate__(self):
         return {name: self.__dict__[name] for name in self._local_attrs}
 
+    def _remap(self, other):
+        """Make this object refer to the same remote object as `other`"""
+        for name in ('_obj_id', '_dirlist', '_methods'):
+            self._local_setattr(name, getattr(other, name))
+        self.__dict__['_method_cache'] = {}
+
     def __setstate__(self, state_dict):
         self.__dict__.update(state_dict)
+        self.__dict__['_method_cache'] = {}
+        if self._session is None:
+            self._session = getattr(_deserializing, 'session', None)
 
 
 class RemoteInstrument(RemoteObject, Instrument):
@@ -492,15 +1764,15 @@ class RemoteInstrument(RemoteObject, Instrument):
         return RemoteObject.__new__(RemoteInstrument)
 
     @classmethod
-    def _create_remote(cls, params, id, session, dirlist, reprname):
+    def _create_remote(cls, params, id, session, dirlist, reprname, methods=()):
         log.info('Creating RemoteInstrument, session=%s', session)
-        obj = RemoteObject(id, dirlist, reprname, session)
+        obj = RemoteObject(id, dirlist, reprname, session, methods)
         obj._local_setattr('_paramset', params)
         return obj
 
 
-def client_session(server):
-    """Get the session connected to `server`. Creates one if it doesn't exist yet."""
+def server_address(server):
+    """Get the (host, port) of `server`, which is an alias or a str of the form 'host[:port]'"""
     if server in conf.servers:
         host = conf.servers[server]
     else:
@@ -513,11 +1785,95 @@ def client_session(server):
     else:
         host = host
         port = DEFAULT_PORT
+    return host, port
 
-    if (host, port) not in client_session.sessions:
-        client_session.sessions[(host, port)] = ClientSession(host, port, server)
-    return client_session.sessions[(host, port)]
+
+def client_session(server):
+    """Get the session connected to `server`. Creates one if it doesn't exist yet."""
+    address = server_address(server)
+    with client_session.lock:
+        session = client_session.sessions.get(address)
+    if session is not None:
+        return session
+
+    # Connect without holding the lock, so sessions to several servers may be opened at once
+    session = ClientSession(address[0], address[1], server)
+    with client_session.lock:
+        existing = client_session.sessions.setdefault(address, session)
+    if existing is not session:
+        session.close()  # Another thread connected first
+    return existing
 client_session.sessions = {}
+client_session.lock = threading.Lock()
+
+
+def list_remote_instruments(servers='all', timeout=None, refresh=False):
+    """List the instruments on several servers, querying all of them at once
+
+    Each server's list is cached, and reused for `remote_list_ttl` seconds (60 by default).
+
+    Parameters
+    ----------
+    servers : list of str, or str
+        The servers to query, given as aliases from your instrumental.conf or as strs of the form
+        `(hostname|ip-address)[:port]`. The default, 'all', queries every server in the
+        ``[servers]`` section of your instrumental.conf.
+    timeout : Quantity, str, or float, optional
+        Time to wait for each server, in seconds if a number. Servers that can't be reached or don't answer
+        in time are skipped, with a warning. Defaults to the `remote_list_timeout` pref, or 5.
+    refresh : bool, optional
+        If True, query every server, rather than using any cached lists.
+
+    Returns
+    -------
+    A list of ParamSets, grouped by server in the order given in `servers`. The 'server' entry of
+    each gives the server it's on.
+    """
+    if servers == 'all':
+        servers = list(conf.servers)
+    elif isinstance(servers, basestring):
+        servers = [servers]
+    timeout = (conf.get_float_pref('remote_list_timeout', LIST_TIMEOUT) if timeout is None
+               else _to_seconds(timeout))
+    ttl = conf.get_float_pref('remote_list_ttl', LIST_TTL)
+
+    results = {}  # server -> list of ParamSets
+
+    def list_server(server):
+        address = server_address(server)
+        with _list_cache_lock:
+            cached = _list_cache.get(address)
+        if cached is not None and not refresh and time.time() - cached[0] < ttl:
+            results[server] = cached[1]
+            return
+
+        try:
+            with request_timeout(timeout):
+                inst_list = client_session(server).list_instruments()
+        except Exception as e:
+            log.warning("Could not list instruments on server '%s': %s", server, e)
+            return
+        with _list_cache_lock:
+            _list_cache[address] = (time.time(), inst_list)
+        results[server] = inst_list
+
+    threads = []
+    for server in servers:
+        thread = threading.Thread(target=list_server, args=(server,),
+                                  name='list-instruments-{}'.format(server))
+        thread.daemon = True  # Don't keep the process alive for an unresponsive server
+        thread.start()
+        threads.append(thread)
+
+    deadline = time.time() + timeout
+    for server, thread in zip(servers, threads):
+        thread.join(max(deadline - time.time(), 0))
+        if thread.is_alive():
+            log.warning("Timed out while listing instruments on server '%s'", server)
+
+    # Copy the cached ParamSets, so callers are free to modify them
+    return [ParamSet(**params._dict) for server in servers
+            for params in results.get(server, ())]
 
 
 @atexit.register
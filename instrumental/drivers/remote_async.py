@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Nate Bogdanowicz
+"""
+Asyncio-based instrument server (Python 3.5+).
+
+`AsyncServer` is a drop-in replacement for `remote.ThreadedTCPServer` which serves all of its
+connections from a single event loop. The blocking driver calls are run on executors instead: each
+instrument gets its own single-thread executor, so the requests for a device are run one at a
+time, while requests for different devices (even ones using the same driver module) run in
+parallel. Requests that don't target an instrument, like creating or listing instruments, run on a
+shared pool, as do reads of facets that are cached or already being read (see `remote.ReadCache`).
+
+The server's answer to the 'metrics' command (see `remote.ClientSession.metrics()`) also
+reports the number of queued requests for each instrument.
+"""
+import asyncio
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ..log import get_logger
+from .remote import (Messenger, ServerSession, RemoteError, FAKE_LOCK, STRUCT, BUFFER_LEN_STRUCT,
+                     KIND_REQUEST, KIND_RESPONSE, KIND_PUSH, KIND_CREDIT, KIND_RELEASE)
+
+log = get_logger(__name__)
+
+__all__ = ['AsyncServer']
+
+# Number of threads for requests that don't target a particular instrument
+DEFAULT_WORKERS = 4
+
+
+class InstrumentExecutor(object):
+    """Runs the requests for a single instrument, one at a time, on a dedicated thread"""
+    def __init__(self, name):
+        self.name = name
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.lock = threading.Lock()
+        self.queue_depth = 0  # Requests submitted but not yet finished
+        self.n_calls = 0
+        self.refcount = 0  # Number of sessions using this executor
+
+    def submit(self, func, *args):
+        with self.lock:
+            self.queue_depth += 1
+        return self.executor.submit(self._run, func, args)
+
+    def _run(self, func, args):
+        try:
+            return func(*args)
+        finally:
+            with self.lock:
+                self.queue_depth -= 1
+                self.n_calls += 1
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+class AsyncMessenger(object):
+    """Server end of a connection, using asyncio streams
+
+    `listen()` is a coroutine run by the event loop, while the `respond()` and `push()` methods are
+    meant to be called from executor threads; they block until the message has been handed to the
+    transport.
+    """
+    def __init__(self, loop, reader, writer):
+        self.loop = loop
+        self.reader = reader
+        self.writer = writer
+
+    async def listen(self):
+        """Listen for an incoming request or credit message
+
+        Returns (message, buffers, id, kind), or None if connection was closed.
+        """
+        try:
+            header = await self.reader.readexactly(STRUCT.size)
+        except asyncio.IncompleteReadError as e:
+            if e.partial:
+                raise RemoteError("Socket connection ended unexpectedly")
+            return None
+
+        kind, id, n_buffers, length = Messenger.read_header(header)
+        if kind not in (KIND_REQUEST, KIND_CREDIT, KIND_RELEASE):
+            raise RemoteError("Expected a request message, got message of kind {}".format(kind))
+
+        try:
+            offset = n_buffers*BUFFER_LEN_STRUCT.size
+            body = await self.reader.readexactly(offset + length)
+            buffer_lens = struct.unpack('!{}Q'.format(n_buffers), body[:offset])
+            buffers = []
+            for buffer_len in buffer_lens:
+                buffers.append(await self.reader.readexactly(buffer_len))
+        except asyncio.IncompleteReadError:
+            raise RemoteError("Socket connection ended unexpectedly")
+
+        return memoryview(body)[offset:], buffers, id, kind
+
+    async def _write(self, parts):
+        self.writer.writelines(parts)
+        await self.writer.drain()
+
+    def _send_message(self, message, id, kind, buffers=()):
+        parts = Messenger.encode(message, id, kind, buffers)
+        future = asyncio.run_coroutine_threadsafe(self._write(parts), self.loop)
+        try:
+            future.result()
+        except Exception as e:
+            raise RemoteError("Socket error while sending message data: {}".format(str(e)))
+
+    def respond(self, response_bytes, buffers, id):
+        """Respond to the request with the given id, received via listen()"""
+        self._send_message(response_bytes, id, KIND_RESPONSE, buffers)
+
+    def push(self, value_bytes, buffers, stream_id):
+        """Push a value to the client's stream with the given id"""
+        self._send_message(value_bytes, stream_id, KIND_PUSH, buffers)
+
+
+class AsyncServerSession(ServerSession):
+    """Server-side session for a connection to an `AsyncServer`"""
+    def __init__(self, server, messenger):
+        super(AsyncServerSession, self).__init__(messenger, server.shared_obj_table,
+                                                 server.table_lock, server.client_tables,
+                                                 server.directory)
+        self.server = server
+        self.executors = set()  # Instrument executors used by this session
+
+    def handle_metrics(self, request):
+        metrics = self.server.metrics()
+        metrics['reads'] = self.read_stats()
+        return metrics, FAKE_LOCK
+
+    def executor_for(self, request):
+        """Get the executor to run `request` on, based on the object it targets"""
+        entry = self.obj_table.get(request.get('obj_id'))
+        if entry is None:
+            return self.server.default_executor
+
+        # Reads that the instrument's ReadCache can answer needn't wait in the instrument's queue
+        if (request.get('command') == 'attr' and entry.reads is not None and
+                entry.reads.has_result((request['obj_id'], request['attr']))):
+            return self.server.default_executor
+
+        return self.server.get_executor(entry, self.executors)
+
+    def _run_and_respond(self, request, id):
+        response_bytes, response_buffers, lock = self.run_request(request)
+        self.respond(response_bytes, response_buffers, lock, id)
+
+    async def handle_requests_async(self):
+        loop = self.messenger.loop
+        in_flight = set()
+        try:
+            while True:
+                full_msg = await self.messenger.listen()
+                if full_msg is None:
+                    log.info("Received EOF, closing connection.")
+                    break
+
+                message_bytes, buffers, id, kind = full_msg
+                if kind == KIND_CREDIT:
+                    self.handle_credit(message_bytes, id)
+                    continue
+                elif kind == KIND_RELEASE:
+                    self.handle_release(message_bytes, buffers)
+                    continue
+
+                request = self.deserialize(message_bytes, buffers)
+                future = asyncio.wrap_future(
+                    self.executor_for(request).submit(self._run_and_respond, request, id))
+                in_flight.add(future)
+                future.add_done_callback(in_flight.discard)
+        except (RemoteError, ConnectionError) as e:
+            log.info("Connection to client failed: %s", e)
+
+        if in_flight:
+            await asyncio.wait(list(in_flight))
+        await loop.run_in_executor(self.server.default_executor, self.close_objects)
+        for executor in self.executors:
+            self.server.release_executor(executor)
+        self.messenger.writer.close()
+
+
+class AsyncServer(object):
+    """Instrument server running on an asyncio event loop
+
+    Has the same interface as `remote.ThreadedTCPServer`: create it, then call `serve_forever()`
+    (usually on its own thread), and stop it with `shutdown()` and `server_close()`.
+
+    Parameters
+    ----------
+    server_address : (str, int)
+        Host and port to listen on. Use a port of 0 to pick any free port.
+    directory : list of str, or str, optional
+        Servers to act as a directory for, as with `remote.ThreadedTCPServer`.
+    """
+    def __init__(self, server_address, directory=None):
+        self.loop = asyncio.new_event_loop()
+        self.directory = directory
+        self.shared_obj_table = {}
+        self.client_tables = {}
+        self.table_lock = threading.RLock()
+        self.default_executor = ThreadPoolExecutor(max_workers=DEFAULT_WORKERS)
+        self.executors = {}  # Instrument lock -> InstrumentExecutor
+        self.executors_lock = threading.Lock()
+        self.sessions = {}  # AsyncServerSession -> Future that's done when it finishes
+        self.stopped = threading.Event()
+        self.stopped.set()
+
+        host, port = server_address
+        self.server = self.loop.run_until_complete(self._start_server(host, port))
+        self.server_address = self.server.sockets[0].getsockname()[:2]
+        log.info("Server started...")
+
+    async def _start_server(self, host, port):
+        return await asyncio.start_server(self._handle_client, host or None, port)
+
+    async def _handle_client(self, reader, writer):
+        log.info("Opening connection to client...")
+        session = AsyncServerSession(self, AsyncMessenger(self.loop, reader, writer))
+        finished = self.sessions[session] = self.loop.create_future()
+        try:
+            await session.handle_requests_async()
+        finally:
+            del self.sessions[session]
+            finished.set_result(None)
+
+    def get_executor(self, entry, session_executors):
+        """Get the executor for the instrument that `entry`'s object belongs to
+
+        The executor is added to `session_executors`, the set of executors used by the calling
+        session, which must release them with `release_executor()` when it's done.
+        """
+        with self.executors_lock:
+            try:
+                executor = self.executors[entry.lock]
+            except KeyError:
+                executor = self.executors[entry.lock] = InstrumentExecutor(repr(entry.obj))
+            if executor not in session_executors:
+                executor.refcount += 1
+                session_executors.add(executor)
+            return executor
+
+    def release_executor(self, executor):
+        with self.executors_lock:
+            executor.refcount -= 1
+            if executor.refcount > 0:
+                return
+            for lock, other in list(self.executors.items()):
+                if other is executor:
+                    del self.executors[lock]
+        executor.shutdown()
+
+    def metrics(self):
+        """Get the number of connections, and the queue depth and call count of each instrument"""
+        with self.executors_lock:
+            executors = list(self.executors.values())
+        return {
+            'connections': len(self.sessions),
+            'instruments': [{'name': executor.name,
+                             'queue_depth': executor.queue_depth,
+                             'calls': executor.n_calls} for executor in executors],
+        }
+
+    def serve_forever(self, poll_interval=None):
+        """Run the server until `shutdown()` is called. `poll_interval` is ignored."""
+        asyncio.set_event_loop(self.loop)
+        self.stopped.clear()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.stopped.set()
+
+    def shutdown(self):
+        """Stop `serve_forever()`, waiting until it has returned"""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.stopped.wait()
+
+    async def _close(self):
+        self.server.close()
+        for session in list(self.sessions):
+            session.messenger.writer.close()
+        if self.sessions:
+            await asyncio.wait(list(self.sessions.values()))
+        await self.server.wait_closed()
+
+    def server_close(self):
+        """Close the listening socket and all connections, closing the instruments they opened"""
+        self.loop.run_until_complete(self._close())
+        self.loop.close()
+        self.default_executor.shutdown(wait=False)
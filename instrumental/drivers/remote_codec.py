@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Nate Bogdanowicz
+"""
+Codecs for the messages sent between remote instrument servers and clients.
+
+A codec turns an object into a message (a bytes object) plus a list of out-of-band buffers, which
+are sent after the message without being copied into it. The first byte of each message is the id
+of the codec that encoded it, so a message can always be decoded, no matter which codec a session
+is using to send.
+
+`CompactCodec` is the default. It encodes the small dicts making up most remote traffic with a
+tagged binary format: the command names and keys used by the protocol take two bytes each,
+Quantities are sent as a magnitude and a unit string, and ndarrays are always sent as out-of-band
+buffers. Anything else, like exceptions or ParamSets, is embedded as a pickle. `PickleCodec`
+pickles everything, as the protocol did originally.
+
+Other codecs may be added with `register_codec()`, and selected by name, either with the
+`remote_codec` pref or the `codec` argument of `remote.ClientSession`.
+"""
+from __future__ import absolute_import, unicode_literals
+import struct
+import pickle
+
+import numpy as np
+
+import instrumental
+
+__all__ = ['Codec', 'PickleCodec', 'CompactCodec', 'register_codec', 'get_codec', 'decode',
+           'can_encode']
+
+# Python 2 and 3 support
+try:
+    text_type, int_types = unicode, (int, long)
+except NameError:
+    text_type, int_types = str, (int,)
+
+# Whether pickle can hand ndarrays' memory to us to send out-of-band (Python 3.8+)
+OUT_OF_BAND = pickle.HIGHEST_PROTOCOL >= 5
+
+CODEC_ID_STRUCT = struct.Struct('!B')
+_codecs = {}  # name -> Codec
+_codecs_by_id = {}  # id -> Codec
+
+
+def register_codec(codec):
+    """Register a `Codec` instance, so that messages it encodes can be decoded"""
+    other = _codecs_by_id.get(codec.id)
+    if other is not None and other.name != codec.name:
+        raise ValueError("Codec id {} is already used by codec '{}'".format(codec.id, other.name))
+    _codecs[codec.name] = codec
+    _codecs_by_id[codec.id] = codec
+
+
+def get_codec(name):
+    """Get a registered codec by name"""
+    try:
+        return _codecs[name]
+    except KeyError:
+        raise ValueError("Unknown codec '{}'. Registered codecs are: {}".format(
+            name, ', '.join(sorted(_codecs))))
+
+
+def decode(message, buffers=()):
+    """Decode a message, using the codec whose id it starts with"""
+    codec_id, = CODEC_ID_STRUCT.unpack_from(message)
+    try:
+        codec = _codecs_by_id[codec_id]
+    except KeyError:
+        raise ValueError("Message was encoded with unknown codec id {}".format(codec_id))
+    return codec.decode(memoryview(message)[1:], buffers)
+
+
+def can_encode(obj):
+    """Whether `obj` can be encoded by any codec, i.e. whether it can be pickled
+
+    The contents of lists, tuples, and dicts are checked item by item, and ndarrays and Quantities
+    by their dtype, so that large arrays are never encoded just to find this out.
+    """
+    cls = type(obj)
+    if obj is None or cls in (bool, float, text_type, bytes) or cls in int_types:
+        return True
+    elif cls in (list, tuple):
+        return all(can_encode(item) for item in obj)
+    elif cls is dict:
+        return all(can_encode(key) and can_encode(value) for key, value in obj.items())
+    elif isinstance(obj, instrumental.u.Quantity):
+        return can_encode(obj.magnitude)
+    elif isinstance(obj, np.ndarray) and not obj.dtype.hasobject:
+        return True
+
+    try:
+        pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    except (TypeError, pickle.PicklingError):
+        return False
+    return True
+
+
+class Codec(object):
+    """Base class for codecs
+
+    Subclasses must set `name` and `id` (a unique integer from 0-255), and implement `encode()`
+    and `decode()`.
+    """
+    name = None
+    id = None
+
+    @property
+    def prefix(self):
+        try:
+            return self._prefix
+        except AttributeError:
+            self._prefix = CODEC_ID_STRUCT.pack(self.id)
+            return self._prefix
+
+    def encode(self, obj):
+        """Encode `obj`, returning (message, buffers). The message must begin with `prefix`."""
+        raise NotImplementedError
+
+    def decode(self, message, buffers):
+        """Decode a message (without its prefix) and its out-of-band buffers"""
+        raise NotImplementedError
+
+
+class PickleCodec(Codec):
+    """Pickles everything, sending ndarrays out-of-band where pickle protocol 5 is available
+
+    Raises TypeError (or a subclass of PicklingError) if an object can't be pickled.
+    """
+    name = 'pickle'
+    id = 0
+
+    def __init__(self, out_of_band=OUT_OF_BAND):
+        self.out_of_band = out_of_band
+
+    def encode(self, obj):
+        data, buffers = self.dumps(obj)
+        return self.prefix + data, buffers
+
+    def dumps(self, obj):
+        """Pickle `obj`, returning (data, buffers)"""
+        if not self.out_of_band:
+            return pickle.dumps(obj), []
+
+        buffers = []
+        data = pickle.dumps(obj, protocol=5, buffer_callback=lambda buf: buffers.append(buf.raw()))
+        return data, buffers
+
+    def decode(self, message, buffers):
+        if not self.out_of_band:
+            return pickle.loads(bytes(message))
+        return pickle.loads(message, buffers=buffers)
+
+
+# Strings sent as a single byte by CompactCodec. Only append to this, since both ends of a
+# connection must agree on it.
+VOCABULARY = (
+    # Commands
+    'create', 'list', 'attr', 'setattr', 'item', 'setitem', 'call', 'call_method', 'batch',
+    'subscribe', 'unsubscribe', 'hello', 'ping', 'metrics',
+    # Request keys
+    'command', 'obj_id', 'value', 'key', 'args', 'kwargs', 'name', 'params', 'requests',
+    'client_id', 'codec', 'stream_id', 'period', 'policy', 'credits',
+    # Other values
+    'latest', 'block', 'compact', 'pickle', 'connections', 'instruments', 'queue_depth', 'calls',
+)
+
+# Tags which begin each encoded value
+TAG_NONE = b'N'
+TAG_TRUE = b'T'
+TAG_FALSE = b'F'
+TAG_INT = b'i'  # 8-byte signed int
+TAG_FLOAT = b'f'  # 8-byte double
+TAG_STR = b's'  # 4-byte length, then UTF-8 data
+TAG_BYTES = b'b'  # 4-byte length, then data
+TAG_WORD = b'w'  # 1-byte index into VOCABULARY
+TAG_LIST = b'l'  # 4-byte item count, then the items
+TAG_TUPLE = b't'  # 4-byte item count, then the items
+TAG_DICT = b'd'  # 4-byte item count, then alternating keys and values
+TAG_QUANTITY = b'q'  # Magnitude, then the units as a string
+TAG_ARRAY = b'a'  # dtype string, 1-byte ndim, 8-byte dims; the data is the next buffer
+TAG_PICKLE = b'p'  # 2-byte number of buffers, 4-byte length, then the pickle data
+
+INT_STRUCT = struct.Struct('!q')
+FLOAT_STRUCT = struct.Struct('!d')
+LEN_STRUCT = struct.Struct('!I')
+TAGGED_INT_STRUCT = struct.Struct('!cq')
+TAGGED_FLOAT_STRUCT = struct.Struct('!cd')
+TAGGED_LEN_STRUCT = struct.Struct('!cI')
+BYTE_STRUCT = struct.Struct('!B')
+PICKLE_STRUCT = struct.Struct('!HI')
+MIN_INT, MAX_INT = -2**63, 2**63 - 1
+
+
+class CompactCodec(Codec):
+    """Compact tagged binary encoding, falling back to pickle for unsupported types
+
+    Only objects of exactly the supported types (None, bools, ints, floats, strings, bytes,
+    lists, tuples, dicts, Quantities, and ndarrays of plain dtypes) are encoded directly, so
+    subclasses like numpy scalars come through unchanged. Unpicklable objects raise TypeError, as
+    with `PickleCodec`.
+    """
+    name = 'compact'
+    id = 1
+
+    def __init__(self):
+        self._pickler = PickleCodec()
+        self._words = {word: TAG_WORD + BYTE_STRUCT.pack(i) for i, word in enumerate(VOCABULARY)}
+        self._unit_cache = {}  # Unit string -> UnitsContainer
+        self._encoders = {
+            type(None): self._encode_none,
+            bool: self._encode_bool,
+            float: self._encode_float,
+            text_type: self._encode_str,
+            bytes: self._encode_bytes,
+            list: self._encode_list,
+            tuple: self._encode_tuple,
+            dict: self._encode_dict,
+            np.ndarray: self._encode_array,
+        }
+        for int_type in int_types:
+            self._encoders[int_type] = self._encode_int
+        self._decoders = [self._decode_invalid]*256  # Indexed by tag
+        for tag, decoder in {
+            ord(TAG_NONE): self._decode_none,
+            ord(TAG_TRUE): self._decode_true,
+            ord(TAG_FALSE): self._decode_false,
+            ord(TAG_INT): self._decode_int,
+            ord(TAG_FLOAT): self._decode_float,
+            ord(TAG_STR): self._decode_str,
+            ord(TAG_BYTES): self._decode_bytes,
+            ord(TAG_WORD): self._decode_word,
+            ord(TAG_LIST): self._decode_list,
+            ord(TAG_TUPLE): self._decode_tuple,
+            ord(TAG_DICT): self._decode_dict,
+            ord(TAG_QUANTITY): self._decode_quantity,
+            ord(TAG_ARRAY): self._decode_array,
+            ord(TAG_PICKLE): self._decode_pickle,
+        }.items():
+            self._decoders[tag] = decoder
+
+    def encode(self, obj):
+        parts = [self.prefix]
+        buffers = []
+        self._encode(obj, parts, buffers)
+        return b''.join(parts), buffers
+
+    def _encode(self, obj, parts, buffers):
+        encoder = self._encoders.get(type(obj))
+        if encoder is None:
+            encoder = self._encoders[type(obj)] = self._find_encoder(type(obj))
+        encoder(obj, parts, buffers)
+
+    def _find_encoder(self, cls):
+        if issubclass(cls, instrumental.u.Quantity):
+            return self._encode_quantity
+        if issubclass(cls, np.ndarray):
+            return self._encode_array  # e.g. camera Frames, which arrive as plain arrays
+        return self._encode_pickle
+
+    def _encode_none(self, obj, parts, buffers):
+        parts.append(TAG_NONE)
+
+    def _encode_bool(self, obj, parts, buffers):
+        parts.append(TAG_TRUE if obj else TAG_FALSE)
+
+    def _encode_int(self, obj, parts, buffers):
+        if MIN_INT <= obj <= MAX_INT:
+            parts.append(TAGGED_INT_STRUCT.pack(TAG_INT, obj))
+        else:
+            self._encode_pickle(obj, parts, buffers)
+
+    def _encode_float(self, obj, parts, buffers):
+        parts.append(TAGGED_FLOAT_STRUCT.pack(TAG_FLOAT, obj))
+
+    def _encode_str(self, obj, parts, buffers):
+        word = self._words.get(obj)
+        if word is not None:
+            parts.append(word)
+            return
+        data = obj.encode('utf-8')
+        parts.append(TAGGED_LEN_STRUCT.pack(TAG_STR, len(data)))
+        parts.append(data)
+
+    def _encode_bytes(self, obj, parts, buffers):
+        parts.append(TAGGED_LEN_STRUCT.pack(TAG_BYTES, len(obj)))
+        parts.append(obj)
+
+    def _encode_items(self, tag, items, parts, buffers):
+        parts.append(TAGGED_LEN_STRUCT.pack(tag, len(items)))
+        encode = self._encode
+        for item in items:
+            encode(item, parts, buffers)
+
+    def _encode_list(self, obj, parts, buffers):
+        self._encode_items(TAG_LIST, obj, parts, buffers)
+
+    def _encode_tuple(self, obj, parts, buffers):
+        self._encode_items(TAG_TUPLE, obj, parts, buffers)
+
+    def _encode_dict(self, obj, parts, buffers):
+        parts.append(TAGGED_LEN_STRUCT.pack(TAG_DICT, len(obj)))
+        encode = self._encode
+        for key, value in obj.items():
+            encode(key, parts, buffers)
+            encode(value, parts, buffers)
+
+    def _encode_quantity(self, obj, parts, buffers):
+        units = ' * '.join('{} ** {}'.format(name, exp) for name, exp in obj._units.items())
+        parts.append(TAG_QUANTITY)
+        self._encode(obj.magnitude, parts, buffers)
+        self._encode_str(units, parts, buffers)
+
+    def _encode_array(self, obj, parts, buffers):
+        if obj.dtype.hasobject or obj.dtype.fields is not None or obj.ndim > 255:
+            self._encode_pickle(obj, parts, buffers)
+            return
+        parts.append(TAG_ARRAY)
+        self._encode_str(obj.dtype.str, parts, buffers)
+        parts.append(BYTE_STRUCT.pack(obj.ndim))
+        parts.append(struct.pack('!{}q'.format(obj.ndim), *obj.shape))
+        # Flat view of the raw bytes, which shares memory with `obj` when it's contiguous
+        buffers.append(memoryview(np.ascontiguousarray(obj).reshape(-1).view(np.uint8)))
+
+    def _encode_pickle(self, obj, parts, buffers):
+        data, pickle_buffers = self._pickler.dumps(obj)
+        parts.append(TAG_PICKLE + PICKLE_STRUCT.pack(len(pickle_buffers), len(data)))
+        parts.append(data)
+        buffers.extend(pickle_buffers)
+
+    def decode(self, message, buffers):
+        data = bytearray(message)
+        value, pos = self._decode(data, 0, iter(buffers))
+        if pos != len(data):
+            raise ValueError("Message has {} bytes of trailing data".format(len(data) - pos))
+        return value
+
+    def _decode(self, data, pos, buffers):
+        return self._decoders[data[pos]](data, pos + 1, buffers)
+
+    def _decode_invalid(self, data, pos, buffers):
+        raise ValueError("Invalid tag {!r} at position {}".format(data[pos-1], pos - 1))
+
+    def _decode_none(self, data, pos, buffers):
+        return None, pos
+
+    def _decode_true(self, data, pos, buffers):
+        return True, pos
+
+    def _decode_false(self, data, pos, buffers):
+        return False, pos
+
+    def _decode_int(self, data, pos, buffers):
+        return INT_STRUCT.unpack_from(data, pos)[0], pos + INT_STRUCT.size
+
+    def _decode_float(self, data, pos, buffers):
+        return FLOAT_STRUCT.unpack_from(data, pos)[0], pos + FLOAT_STRUCT.size
+
+    def _decode_str(self, data, pos, buffers):
+        length, = LEN_STRUCT.unpack_from(data, pos)
+        pos += LEN_STRUCT.size
+        return data[pos:pos+length].decode('utf-8'), pos + length
+
+    def _decode_bytes(self, data, pos, buffers):
+        length, = LEN_STRUCT.unpack_from(data, pos)
+        pos += LEN_STRUCT.size
+        return bytes(data[pos:pos+length]), pos + length
+
+    def _decode_word(self, data, pos, buffers):
+        return VOCABULARY[data[pos]], pos + 1
+
+    def _decode_items(self, data, pos, buffers):
+        n_items, = LEN_STRUCT.unpack_from(data, pos)
+        pos += LEN_STRUCT.size
+        items = []
+        decode = self._decode
+        for _ in range(n_items):
+            item, pos = decode(data, pos, buffers)
+            items.append(item)
+        return items, pos
+
+    def _decode_list(self, data, pos, buffers):
+        return self._decode_items(data, pos, buffers)
+
+    def _decode_tuple(self, data, pos, buffers):
+        items, pos = self._decode_items(data, pos, buffers)
+        return tuple(items), pos
+
+    def _decode_dict(self, data, pos, buffers):
+        n_items, = LEN_STRUCT.unpack_from(data, pos)
+        pos += LEN_STRUCT.size
+        obj = {}
+        decode = self._decode
+        for _ in range(n_items):
+            key, pos = decode(data, pos, buffers)
+            obj[key], pos = decode(data, pos, buffers)
+        return obj, pos
+
+    def _decode_quantity(self, data, pos, buffers):
+        magnitude, pos = self._decode(data, pos, buffers)
+        units, pos = self._decode(data, pos, buffers)
+        try:
+            units_container = self._unit_cache[units]
+        except KeyError:
+            units_container = self._unit_cache[units] = instrumental.Q_(1, units)._units
+        return instrumental.Q_(magnitude, units_container), pos
+
+    def _decode_array(self, data, pos, buffers):
+        dtype, pos = self._decode(data, pos, buffers)
+        ndim, = BYTE_STRUCT.unpack_from(data, pos)
+        pos += BYTE_STRUCT.size
+        shape = struct.unpack_from('!{}q'.format(ndim), data, pos)
+        pos += ndim*INT_STRUCT.size
+        return np.frombuffer(next(buffers), dtype=np.dtype(dtype)).reshape(shape), pos
+
+    def _decode_pickle(self, data, pos, buffers):
+        n_buffers, length = PICKLE_STRUCT.unpack_from(data, pos)
+        pos += PICKLE_STRUCT.size
+        pickle_buffers = [next(buffers) for _ in range(n_buffers)]
+        return self._pickler.decode(memoryview(data)[pos:pos+length], pickle_buffers), pos + length
+
+
+register_codec(PickleCodec())
+register_codec(CompactCodec())
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Nate Bogdanowicz
+"""
+Shared-memory transport for remote clients on the same host as their server (Python 3.8+).
+
+When a client connects to a server running on its own machine, the server copies the large arrays
+it sends into a `SharedRing`, a ring buffer in shared memory, and sends a small `SharedArray`
+descriptor in their place. The client maps each descriptor to a read-only ndarray that views the
+ring buffer directly, so the array's data never passes through the socket.
+
+The server doesn't reuse an array's part of the ring until the client releases it, which the client
+does once no arrays view that part any longer. Arrays that don't fit in the ring's free space,
+e.g. because the client is holding on to many earlier ones, are sent through the socket instead.
+"""
+import os
+import weakref
+import threading
+from collections import OrderedDict, deque
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from ..log import get_logger
+
+log = get_logger(__name__)
+
+__all__ = ['SharedRing', 'SharedArray', 'SharedViews']
+
+# Size of each ring buffer in MiB, which may be overridden by the `remote_shm_size` pref
+RING_SIZE = 64
+
+# Arrays smaller than this (in bytes) are sent through the socket as usual
+MIN_NBYTES = 2**16
+
+ALIGNMENT = 64  # Arrays are placed at multiples of this many bytes
+
+# Rings created by this process, by the name of their shared memory segment
+_rings = {}
+
+
+def can_share(array):
+    """Whether `array` is worth sending through shared memory, and can be"""
+    return (isinstance(array, np.ndarray) and array.nbytes >= MIN_NBYTES and
+            not array.dtype.hasobject and array.dtype.fields is None)
+
+
+class SharedRing(object):
+    """Ring buffer in shared memory, into which a server copies arrays for one connection
+
+    Each array's region of the ring stays in use until the client releases it via `release()`, and
+    `put()` only places arrays in the space that's free. Regions are released by the number `put()`
+    gave their array, so a stale or repeated release can't free a region that's been reused.
+
+    Parameters
+    ----------
+    size : int
+        Size of the buffer, in bytes
+    """
+    def __init__(self, size):
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.name = self.shm.name
+        _rings[self.name] = self
+        self.size = size
+        self.head = 0  # Offset at which the next array will be written
+        self.regions = OrderedDict()  # offset -> end of each region in use, oldest first
+        self.released = set()  # Offsets of regions released while an older one is still in use
+        self.handed_out = {}  # Number -> offset of each array not yet released
+        self.lock = threading.Lock()
+        self.n_arrays = 0
+
+    def _allocate(self, nbytes):
+        """Find the offset of a free region of `nbytes` bytes, or None if there isn't one"""
+        if not self.regions:
+            self.head = 0
+            return 0 if nbytes <= self.size else None
+
+        tail = next(iter(self.regions))  # Start of the oldest region in use
+        if self.head > tail:
+            # [tail, head) is in use
+            if self.head + nbytes <= self.size:
+                return self.head
+            return 0 if nbytes <= tail else None  # Wrap around, so the array is contiguous
+        else:
+            # [tail, size) and [0, head) are in use
+            return self.head if self.head + nbytes <= tail else None
+
+    def put(self, array):
+        """Copy `array` into the ring, returning its `SharedArray` descriptor
+
+        Returns None if the array is too large for the ring's free space, in which case it should
+        be sent the usual way.
+        """
+        nbytes = array.nbytes
+        if nbytes > self.size // 2:
+            return None
+
+        with self.lock:
+            offset = self._allocate(nbytes)
+            if offset is None:
+                return None
+            self.head = offset + -(-nbytes // ALIGNMENT) * ALIGNMENT
+            self.regions[offset] = self.head
+            self.n_arrays += 1
+            number = self.n_arrays
+            self.handed_out[number] = offset
+
+        dest = np.ndarray(array.shape, array.dtype, buffer=self.shm.buf, offset=offset)
+        dest[...] = array
+        return SharedArray(self.name, offset, array.shape, array.dtype.str, number)
+
+    def release(self, number):
+        """Free the region of array `number`, once the client no longer views it
+
+        Numbers that weren't handed out, or were already released, are ignored.
+        """
+        with self.lock:
+            offset = self.handed_out.pop(number, None)
+            if offset is None:
+                return
+            self.released.add(offset)
+
+            # Space is reclaimed in order, from the oldest region in use
+            while self.regions:
+                oldest = next(iter(self.regions))
+                if oldest not in self.released:
+                    break
+                del self.regions[oldest]
+                self.released.discard(oldest)
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+        _rings.pop(self.name, None)
+
+
+class SharedArray(object):
+    """Descriptor of an array in a `SharedRing`
+
+    Unpickling it gives the array itself, as a view of the client session's mapping of the ring.
+    """
+    def __init__(self, name, offset, shape, dtype, number):
+        self.name = name
+        self.offset = offset
+        self.shape = shape
+        self.dtype = dtype
+        self.number = number
+
+    def __reduce__(self):
+        return _map_shared_array, (self.name, self.offset, self.shape, self.dtype, self.number)
+
+
+def _map_shared_array(name, offset, shape, dtype, number):
+    from .remote import _deserializing  # Avoid circular import
+    session = getattr(_deserializing, 'session', None)
+    if session is None or session.shared_views is None:
+        raise RuntimeError("Received a shared-memory array outside of a session that uses them")
+    return session.shared_views.view(name, offset, shape, dtype, number)
+
+
+class SharedViews(object):
+    """A client session's mappings of the ring buffers of its server's connections
+
+    Keeps track of which regions of the rings are still viewed by arrays. Once every array viewing
+    a region is gone, the region is added to `released`, for the session to pass on to the server.
+    """
+    def __init__(self):
+        self.segments = {}  # name -> SharedMemory
+        self.lock = threading.Lock()
+        self.refs = {}  # id(region) -> weakref to the region's array
+        self.released = deque()  # (name, number) of arrays whose regions are no longer viewed
+
+    def view(self, name, offset, shape, dtype, number):
+        with self.lock:
+            shm = self.segments.get(name)
+            if shm is None:
+                shm = self.segments[name] = _attach(name)
+
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        region = np.ndarray(nbytes, np.uint8, buffer=shm.buf, offset=offset)
+        key = id(region)
+
+        def on_release(ref):
+            # May run on any thread, so we stick to atomic operations
+            self.refs.pop(key, None)
+            self.released.append((name, number))
+        self.refs[key] = weakref.ref(region, on_release)
+
+        # Every view of the region has it as its base, so it lives as long as they do
+        array = region.view(dtype).reshape(shape)
+        array.flags.writeable = False
+        return array
+
+    def take_released(self):
+        """Get the (name, number) of each array released since the last call"""
+        released = []
+        while True:
+            try:
+                released.append(self.released.popleft())
+            except IndexError:
+                return released
+
+    def close(self):
+        with self.lock:
+            segments = list(self.segments.values())
+            self.segments.clear()
+        for shm in segments:
+            try:
+                shm.close()
+            except BufferError:
+                pass  # Arrays still view it, so it's unmapped once they're gone
+
+
+def _attach(name):
+    """Map an existing shared memory segment without taking ownership of it"""
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # Before Python 3.13, attaching registers the segment with our resource tracker, which
+        # would unlink it when we exit, even though the server still owns it
+        shm = shared_memory.SharedMemory(name)
+        if os.name == 'posix' and name not in _rings:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
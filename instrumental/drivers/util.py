@@ -3,40 +3,45 @@
 """
 Helpful utilities for writing drivers.
 """
-import copy
 import contextlib
+from functools import update_wrapper
 from inspect import getargspec
-import pint
 
 from past.builtins import basestring
 
-from . import decorator
-from .. import Q_, u
+import instrumental  # `u` and `Q_` are created on first access, so don't bind them at import
 from ..log import get_logger
+from ..util import LRUCache
 
 log = get_logger(__name__)
 
-__all__ = ['check_units', 'unit_mag', 'check_enums', 'as_enum', 'visa_timeout_context']
+__all__ = ['check_units', 'unit_mag', 'check_enums', 'as_enum', 'visa_timeout_context',
+           'magnitude_in']
+
+
+# Maximum number of parsed strings remembered by `to_quantity()`
+TO_QUANTITY_CACHE_SIZE = 1024
 
 
 def to_quantity(value):
     """Convert to a pint.Quantity
 
-    This function handles offset units in strings slightly better than Q_ does. It uses caching to
-    avoid reparsing strings.
+    This function handles offset units in strings slightly better than Q_ does. It uses a bounded
+    LRU cache, `to_quantity.cache`, to avoid reparsing strings. The cache holds parsed
+    ``(magnitude, units)`` pairs, so each call still returns a new Quantity.
     """
-    try:
-        quantity = copy.copy(to_quantity.cache[value])
-    except (KeyError, TypeError):  # key is missing or unhashable
-        quantity = _to_quantity(value)
+    if not isinstance(value, basestring):
+        return _to_quantity(value)
 
-    if isinstance(value, basestring):
-        to_quantity.cache[value] = copy.copy(quantity)  # Guard against mutation
-
-    return quantity
+    parsed = to_quantity.cache.get(value)
+    if parsed is None:
+        quantity = _to_quantity(value)
+        to_quantity.cache.put(value, (quantity.magnitude, quantity._units))
+        return quantity
+    return instrumental.Q_(*parsed)
 
 
-to_quantity.cache = {}
+to_quantity.cache = LRUCache(TO_QUANTITY_CACHE_SIZE)
 
 
 def _to_quantity(value):
@@ -44,6 +49,7 @@ def _to_quantity(value):
 
     This function handles offset units in strings slightly better than Q_ does.
     """
+    Q_ = instrumental.Q_
     try:
         return Q_(value)
     except Exception as e:
@@ -61,6 +67,67 @@ def _to_quantity(value):
         raise ValueError('Could not construct Quantity from {}'.format(value))
 
 
+def magnitude_in(quantity, units):
+    """Get the magnitude of `quantity` when expressed in `units`
+
+    Equivalent to ``quantity.to(units).magnitude``, but much faster for repeated conversions. The
+    scale factor between each pair of units is computed once and cached, so converting is just a
+    multiplication. Non-multiplicative conversions (e.g. between offset temperature units) fall
+    back to pint.
+    """
+    src, dst = quantity._units, units._units
+    if src == dst:
+        return quantity.magnitude
+
+    try:
+        factor = _conversion_factors[src, dst]
+    except KeyError:
+        factor = _conversion_factors[src, dst] = _conversion_factor(src, dst)
+
+    if factor is None:
+        return quantity.to(units).magnitude
+    return quantity.magnitude * factor
+
+
+_conversion_factors = {}
+
+
+def _conversion_factor(src, dst):
+    """Get the factor that converts magnitudes from `src` to `dst` units, or None if the conversion
+    isn't a pure scaling"""
+    Q_ = instrumental.Q_
+    zero = Q_(0., src).to(dst).magnitude
+    if zero != 0:
+        return None
+    return Q_(1., src).to(dst).magnitude
+
+
+class UnitSpec(object):
+    """Precomputed unit info for an argument or return value of `check_units` or `unit_mag`
+
+    Created from specs like ``'V'``, or ``'?V'`` for an optional value that may be None.
+    """
+    __slots__ = ('optional', 'units', 'dimensionality', 'zero_ok')
+
+    def __init__(self, spec):
+        if not isinstance(spec, basestring):
+            raise TypeError("Each arg spec must be a string or None")
+        self.optional = spec.startswith('?')
+        q = to_quantity(spec[1:] if self.optional else spec)
+        self.units = q.units
+        self.dimensionality = q.dimensionality
+        # Allow naked zeroes only for absolute units (e.g. not degF)
+        # It's a bit dicey using this private method; works in 0.6 at least
+        self.zero_ok = q._ok_for_muldiv()
+
+    def __repr__(self):
+        return "<UnitSpec '{}{}'>".format('?' if self.optional else '', self.units)
+
+
+def _unit_spec(spec):
+    return None if spec is None else UnitSpec(spec)
+
+
 def as_enum(enum_type, arg):
     """Check if arg is an instance or key of enum_type, and return that enum"""
     if isinstance(arg, enum_type):
@@ -80,43 +147,58 @@ def check_units(*pos, **named):
         def set_voltage(value):
             pass  # `value` will be a pint.Quantity with Volt-like units
     """
-    def inout_map(arg, unit_info, name=None):
-        if unit_info is None:
+    import pint
+    u, Q_ = instrumental.u, instrumental.Q_
+
+    def inout_map(arg, spec, name=None):
+        if spec is None:
             return arg
 
         use_units_msg = (" Make sure you're passing in a unitful value, either as a string or by "
                          "using `instrumental.u` or `instrumental.Q_()`")
 
-        optional, units = unit_info
-        if optional and arg is None:
+        units = spec.units
+        if spec.optional and arg is None:
             return None
         elif arg == 0:
-            # Allow naked zeroes as long as we're using absolute units (e.g. not degF)
-            # It's a bit dicey using this private method; works in 0.6 at least
-            if units._ok_for_muldiv():
+            if spec.zero_ok:
                 return Q_(arg, units)
             else:
                 if name is not None:
                     extra_msg = " for argument '{}'.".format(name) + use_units_msg
-                    raise pint.DimensionalityError(u.dimensionless.units, units.units,
+                    raise pint.DimensionalityError(u.dimensionless.units, units,
                                                    extra_msg=extra_msg)
                 else:
                     extra_msg = " for return value." + use_units_msg
-                    raise pint.DimensionalityError(u.dimensionless.units, units.units,
+                    raise pint.DimensionalityError(u.dimensionless.units, units,
                                                    extra_msg=extra_msg)
         else:
-            q = to_quantity(arg)
-            if q.dimensionality != units.dimensionality:
+            q = arg if isinstance(arg, Q_) else to_quantity(arg)
+            if q.dimensionality != spec.dimensionality:
                 extra_info = '' if isinstance(arg, Q_) else use_units_msg
                 if name is not None:
                     extra_msg = " for argument '{}'.".format(name) + extra_info
-                    raise pint.DimensionalityError(q.units, units.units, extra_msg=extra_msg)
+                    raise pint.DimensionalityError(q.units, units, extra_msg=extra_msg)
                 else:
                     extra_msg = " for return value." + extra_info
-                    raise pint.DimensionalityError(q.units, units.units, extra_msg=extra_msg)
+                    raise pint.DimensionalityError(q.units, units, extra_msg=extra_msg)
             return q
 
-    return _unit_decorator(inout_map, inout_map, pos, named)
+    def make_in_mapper(spec, name):
+        units = spec.units._units
+
+        def checker(arg):
+            if isinstance(arg, Q_) and arg._units == units:
+                return arg  # Fast path: already in the expected units
+            return inout_map(arg, spec, name)
+        return checker
+
+    def make_out_mapper(spec):
+        def checker(res):
+            return inout_map(res, spec)
+        return checker
+
+    return _unit_decorator(make_in_mapper, make_out_mapper, pos, named)
 
 
 def unit_mag(*pos, **named):
@@ -129,51 +211,70 @@ def unit_mag(*pos, **named):
             pass  # The input must be in Volt-like units and `value` will be a raw number
                   # expressing the magnitude in Volts
     """
-    def in_map(arg, unit_info, name):
-        if unit_info is None:
+    import pint
+    u, Q_ = instrumental.u, instrumental.Q_
+
+    def in_map(arg, spec, name):
+        if spec is None:
             return arg
 
-        optional, units = unit_info
-        if optional and arg is None:
+        units = spec.units
+        if spec.optional and arg is None:
             return None
         elif arg == 0:
-            # Allow naked zeroes as long as we're using absolute units (e.g. not degF)
-            # It's a bit dicey using this private method; works in 0.6 at least
-            if units._ok_for_muldiv():
+            if spec.zero_ok:
                 return arg
             else:
                 if name is not None:
-                    raise pint.DimensionalityError(u.dimensionless.units, units.units,
+                    raise pint.DimensionalityError(u.dimensionless.units, units,
                                                    extra_msg=" for argument '{}'".format(name))
                 else:
-                    raise pint.DimensionalityError(u.dimensionless.units, units.units,
+                    raise pint.DimensionalityError(u.dimensionless.units, units,
                                                    extra_msg=" for return value")
         else:
-            q = to_quantity(arg)
+            q = arg if isinstance(arg, Q_) else to_quantity(arg)
             try:
-                if q.units == units:
-                    return q.magnitude  # Speed up the common case
-                else:
-                    return q.to(units).magnitude
+                return magnitude_in(q, units)
             except pint.DimensionalityError:
-                raise pint.DimensionalityError(q.units, units.units,
+                raise pint.DimensionalityError(q.units, units,
                                                extra_msg=" for argument '{}'".format(name))
 
-    def out_map(res, unit_info):
-        if unit_info is None:
+    def out_map(res, spec):
+        if spec is None:
             return res
 
-        optional, units = unit_info
-        if optional and res is None:
+        if spec.optional and res is None:
             return None
         else:
             q = to_quantity(res)
             try:
                 return q
             except pint.DimensionalityError:
-                raise pint.DimensionalityError(q.units, units.units, extra_msg=" for return value")
+                raise pint.DimensionalityError(q.units, spec.units, extra_msg=" for return value")
+
+    def make_in_mapper(spec, name):
+        units = spec.units._units
+        # Bare numbers pass straight through only if they need no scaling, unlike e.g. 'deg'
+        accepts_numbers = (not spec.dimensionality and
+                           magnitude_in(Q_(1, 'dimensionless'), spec.units) == 1)
 
-    return _unit_decorator(in_map, out_map, pos, named)
+        def mapper(arg):
+            # Fast paths: a Quantity already in the expected units, or a bare number that's allowed
+            if isinstance(arg, Q_):
+                if arg._units == units:
+                    return arg.magnitude
+            elif type(arg) in (float, int):
+                if accepts_numbers or (arg == 0 and spec.zero_ok):
+                    return arg
+            return in_map(arg, spec, name)
+        return mapper
+
+    def make_out_mapper(spec):
+        def mapper(res):
+            return out_map(res, spec)
+        return mapper
+
+    return _unit_decorator(make_in_mapper, make_out_mapper, pos, named)
 
 
 def check_enums(**kw_args):
@@ -211,142 +312,110 @@ def arg_decorator(checker_factory, dec_pos_args, dec_kw_args):
     """
     def wrap(func):
         """Function that actually wraps the function to be decorated"""
-        arg_names, vargs, kwds, default_vals = getargspec(func)
-        default_vals = default_vals or ()
-        pos_arg_names = {i: name for i, name in enumerate(arg_names)}
+        arg_names = getargspec(func)[0]
 
         # Put everything in one dict
+        dec_args = dict(dec_kw_args)
         for dec_arg_val, arg_name in zip(dec_pos_args, arg_names):
-            if arg_name in dec_kw_args:
+            if arg_name in dec_args:
                 raise TypeError("Argument specified twice, by both position and name")
-            dec_kw_args[arg_name] = dec_arg_val
-
-        checkers = {}
-        new_defaults = {}
-        num_nondefs = len(arg_names) - len(default_vals)
-        for default_val, arg_name in zip(default_vals, arg_names[num_nondefs:]):
-            if arg_name in dec_kw_args:
-                checker = checker_factory(dec_kw_args[arg_name], arg_name)
-                checkers[arg_name] = checker
-                new_defaults[arg_name] = checker(default_val)
-
-        for arg_name in arg_names[:num_nondefs]:
-            if arg_name in dec_kw_args:
-                checkers[arg_name] = checker_factory(dec_kw_args[arg_name], arg_name)
-
-        def wrapper(func, *args, **kwds):
-            checked = new_defaults.copy()
-            checked.update({name: (checkers[name](arg) if name in checkers else arg) for name, arg
-                            in kwds.items()})
-            for i, arg in enumerate(args):
-                name = pos_arg_names[i]
-                checked[name] = checkers[name](arg) if name in checkers else arg
-
-            result = func(**checked)
-            return result
-        return decorator.decorate(func, wrapper)
+            dec_args[arg_name] = dec_arg_val
+
+        checkers = {name: checker_factory(dec_arg_val, name)
+                    for name, dec_arg_val in dec_args.items()}
+        return _wrap_function(func, checkers)
     return wrap
 
 
-def _unit_decorator(in_map, out_map, pos_args, named_args):
+def _unit_decorator(make_in_mapper, make_out_mapper, pos_args, named_args):
+    """Produces a decorator that maps unitful args and return values
+
+    `make_in_mapper(spec, arg_name)` and `make_out_mapper(spec)` are called once per decorated
+    argument or return value, with its `UnitSpec`, and return the single-argument function that
+    does the mapping.
+    """
+    named_args = dict(named_args)
+    ret = named_args.pop('ret', None)
+
     def wrap(func):
-        ret = named_args.pop('ret', None)
-
-        if ret is None:
-            ret_units = None
-        elif isinstance(ret, tuple):
-            ret_units = []
-            for arg in ret:
-                if arg is None:
-                    unit = None
-                elif isinstance(arg, basestring):
-                    optional = arg.startswith('?')
-                    if optional:
-                        arg = arg[1:]
-                    unit = (optional, to_quantity(arg))
-                ret_units.append(unit)
-            ret_units = tuple(ret_units)
-        else:
-            optional = ret.startswith('?')
-            if optional:
-                arg = ret[1:]
-            ret_units = to_quantity(arg)
-
-        arg_names, vargs, kwds, defaults = getargspec(func)
-
-        pos_units = []
-        for arg in pos_args:
-            if arg is None:
-                unit = None
-            elif isinstance(arg, basestring):
-                optional = arg.startswith('?')
-                if optional:
-                    arg = arg[1:]
-                unit = (optional, to_quantity(arg))
-            else:
-                raise TypeError("Each arg spec must be a string or None")
-            pos_units.append(unit)
-
-        named_units = {}
-        for name, arg in named_args.items():
-            if arg is None:
-                unit = None
-            elif isinstance(arg, basestring):
-                optional = arg.startswith('?')
-                if optional:
-                    arg = arg[1:]
-                unit = (optional, to_quantity(arg))
-            else:
-                raise TypeError("Each arg spec must be a string or None")
-            named_units[name] = unit
+        arg_names = getargspec(func)[0]
 
-        # Add positional units to named units
-        for i, units in enumerate(pos_units):
-            name = arg_names[i]
-            if name in named_units:
+        specs = {name: _unit_spec(arg) for name, arg in named_args.items()}
+        for name, arg in zip(arg_names, pos_args):
+            if name in specs:
                 raise Exception("Units of {} specified by position and by name".format(name))
-            named_units[name] = units
+            specs[name] = _unit_spec(arg)
 
-        # Pad out the rest of the positional units with None
-        pos_units.extend([None] * (len(arg_names) - len(pos_args)))
+        mappers = {name: make_in_mapper(spec, name) for name, spec in specs.items()
+                   if spec is not None}
 
-        # Add named units to positional units
-        for name, units in named_units.items():
-            try:
-                i = arg_names.index(name)
-                pos_units[i] = units
-            except ValueError:
-                pass
-
-        defaults = tuple() if defaults is None else defaults
-
-        # Convert the defaults
-        new_defaults = {}
-        ndefs = len(defaults)
-        for d, unit, n in zip(defaults, pos_units[-ndefs:], arg_names[-ndefs:]):
-            new_defaults[n] = d if unit is None else in_map(d, unit, n)
-
-        def wrapper(func, *args, **kwargs):
-            # Convert the input arguments
-            new_args = [in_map(a, u, n) for a, u, n in zip(args, pos_units, arg_names)]
-            new_kwargs = {n: in_map(a, named_units.get(n, None), n) for n, a in kwargs.items()}
-
-            # Fill in converted defaults
-            for name in arg_names[max(len(args), len(arg_names)-len(defaults)):]:
-                if name not in new_kwargs:
-                    new_kwargs[name] = new_defaults[name]
-
-            result = func(*new_args, **new_kwargs)
-
-            # Allow for unit checking of multiple return values
-            if isinstance(ret_units, tuple):
-                return tuple(map(out_map, result, ret_units))
-            else:
-                return out_map(result, ret_units)
-        return decorator.decorate(func, wrapper)
+        # Allow for unit checking of multiple return values
+        if isinstance(ret, tuple):
+            ret_mappers = tuple(None if spec is None else make_out_mapper(spec)
+                                for spec in map(_unit_spec, ret))
+
+            def ret_mapper(result):
+                return tuple(res if mapper is None else mapper(res)
+                             for mapper, res in zip(ret_mappers, result))
+        elif ret is not None:
+            ret_mapper = make_out_mapper(_unit_spec(ret))
+        else:
+            ret_mapper = None
+
+        return _wrap_function(func, mappers, ret_mapper)
     return wrap
 
 
+def _wrap_function(func, mappers, ret_mapper=None):
+    """Wrap `func` so its args are passed through `mappers` and its result through `ret_mapper`
+
+    `mappers` is a dict mapping arg names to single-argument functions. Rather than repacking
+    ``*args`` and ``**kwargs`` on every call, this generates a wrapper with the same signature as
+    `func` that calls each arg's mapper directly. Mapped defaults are converted up front.
+    """
+    arg_names, varargs, varkw, defaults = getargspec(func)
+    defaults = defaults or ()
+    n_required = len(arg_names) - len(defaults)
+
+    namespace = {'_func_': func, '_ret_': ret_mapper}
+    params, lines = [], []
+    for i, name in enumerate(arg_names):
+        has_default = i >= n_required
+        if has_default:
+            default = namespace['_o_' + name] = defaults[i - n_required]
+            params.append('{0}=_o_{0}'.format(name))
+        else:
+            params.append(name)
+
+        if name in mappers:
+            mapper = namespace['_m_' + name] = mappers[name]
+            if has_default:
+                namespace['_d_' + name] = mapper(default)
+                lines.append('{0} = _d_{0} if {0} is _o_{0} else _m_{0}({0})'.format(name))
+            else:
+                lines.append('{0} = _m_{0}({0})'.format(name))
+
+    call_args = list(arg_names)
+    if varargs:
+        params.append('*' + varargs)
+        call_args.append('*' + varargs)
+    if varkw:
+        params.append('**' + varkw)
+        call_args.append('**' + varkw)
+        for name in mappers:
+            if name not in arg_names:
+                namespace['_m_' + name] = mappers[name]
+                lines.append('if {1!r} in {0}: {0}[{1!r}] = _m_{1}({0}[{1!r}])'.format(varkw,
+                                                                                        name))
+
+    call = '_func_({})'.format(', '.join(call_args))
+    lines.append('return ' + (call if ret_mapper is None else '_ret_({})'.format(call)))
+    source = 'def wrapper({}):\n    {}\n'.format(', '.join(params), '\n    '.join(lines))
+
+    exec(compile(source, '<{} wrapper>'.format(func.__name__), 'exec'), namespace)
+    return update_wrapper(namespace['wrapper'], func)
+
+
 @contextlib.contextmanager
 def visa_timeout_context(resource, timeout):
     """Context manager for temporarily setting a visa resource's timeout.
@@ -2,7 +2,7 @@
 # Copyright 2014-2016 Nate Bogdanowicz
 import numpy as np
 import scipy.misc
-from qtpy.QtCore import Qt, QTimer, Signal, QRect, QRectF, QPoint
+from qtpy.QtCore import Qt, Signal, QRect, QRectF, QPoint
 from qtpy.QtGui import QPixmap, QImage, QColor, QPen, QMouseEvent, QPainter
 from qtpy.QtWidgets import (QGraphicsView, QGraphicsScene, QMainWindow, QLabel, QStyle,
                             QDoubleSpinBox)
@@ -48,27 +48,28 @@ def create_figure_window(title=''):
 
 
 class CameraView(QLabel):
+    _frameQueued = Signal()  # Emitted by the capture thread of the video stream
+
     def __init__(self, camera=None, autoresize=True):
         super(CameraView, self).__init__()
         self.camera = camera
         self._cmin = 0
         self._cmax = None
         self.autoresize = autoresize
+        self.stream = None
+        self._frameQueued.connect(self._show_latest_frame)
 
     def grab_image(self):
         arr = self.camera.grab_image()
         self._set_pixmap_from_array(arr)
 
     def start_video(self):
-        timer = QTimer()
-        self.timer = timer
-        timer.timeout.connect(self._wait_for_frame)
-        self.camera.start_live_video()
-        timer.start(0)  # Run full throttle
+        # Frames are captured on a background thread, which signals us as each one arrives
+        self.stream = self.camera.stream(timeout=None, background=True, queue_size=1,
+                                         callback=self._frameQueued.emit)
 
     def stop_video(self):
-        self.timer.stop()
-        self.camera.stop_live_video()
+        self.stream.close()
 
     def _set_pixmap_from_array(self, arr):
         bpl = arr.strides[0]
@@ -100,10 +101,9 @@ class CameraView(QLabel):
             if pixmap_size != self.size():
                 self.setMinimumSize(pixmap_size)
 
-    def _wait_for_frame(self):
-        frame_ready = self.camera.wait_for_frame(timeout='0 ms')
-        if frame_ready:
-            arr = self.camera.latest_frame(copy=False)
+    def _show_latest_frame(self):
+        arr = self.stream.poll()
+        if arr is not None:
             self._set_pixmap_from_array(arr)
 
     def set_height(self, h):
@@ -123,6 +123,7 @@ class CroppableCameraView(QGraphicsView):
     rectChanged = Signal(QRect)
     imageDisplayed = Signal(np.ndarray)
     videoStarted = Signal()
+    _frameQueued = Signal()  # Emitted by the capture thread of the video stream
     mouseMoved = Signal(QMouseEvent)
     mousePressed = Signal(QMouseEvent)
     mouseReleased = Signal(QMouseEvent)
@@ -132,6 +133,8 @@ class CroppableCameraView(QGraphicsView):
         self.setRenderHint(QPainter.Antialiasing)
         self.cam = camera
         self.is_live = False
+        self.stream = None
+        self._frameQueued.connect(self._show_latest_frame)
         self._cmin = 0
         self._cmax = None
         self.settings = settings
@@ -317,24 +320,20 @@ class CroppableCameraView(QGraphicsView):
         self.imageDisplayed.emit(arr)
 
     def start_video(self):
-        timer = QTimer()
-        self.timer = timer
-        timer.timeout.connect(self._wait_for_frame)
-        self.cam.start_live_video(**self.settings)
-        timer.start(0)  # Run full throttle
+        # Frames are captured on a background thread, which signals us as each one arrives
+        self.stream = self.cam.stream(timeout=None, copy=True, background=True, queue_size=1,
+                                      callback=self._frameQueued.emit, **self.settings)
         self.is_live = True
         self.needs_resize = True
         self.videoStarted.emit()
 
     def stop_video(self):
-        self.timer.stop()
-        self.cam.stop_live_video()
+        self.stream.close()
         self.is_live = False
 
-    def _wait_for_frame(self):
-        frame_ready = self.cam.wait_for_frame(timeout='0 ms')
-        if frame_ready:
-            arr = self.cam.latest_frame(copy=True)
+    def _show_latest_frame(self):
+        arr = self.stream.poll()
+        if arr is not None:
             self.set_image(arr)
             self.latest_array = arr
             self.imageDisplayed.emit(arr)
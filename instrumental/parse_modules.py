@@ -61,6 +61,7 @@ def analyze_file(fpath):
     root = ast.parse(source)
     has_special_vars, values = get_module_level_special_vars(fpath, root)
     requirements = get_imports(source, root)
+    values['has_visa_check'] = has_module_function(root, '_check_visa_support')
 
     # TODO: Make per-class priority, params, etc. (maybe)
     caf = ClassAttrFinder(root, fpath)
@@ -273,6 +274,11 @@ def get_module_level_special_vars(module_name, root):
     return has_special_vars, values
 
 
+def has_module_function(root, name):
+    """Whether the module given by AST `root` defines a module-level function called `name`"""
+    return any(isinstance(node, ast.FunctionDef) and node.name == name for node in root.body)
+
+
 def get_imports(source, root):
     imported_modules = []
     linenos = []
@@ -392,8 +398,10 @@ def generate_info_file():
             f.write("        'params': {!r},\n".format(params))
             f.write("        'classes': {!r},\n".format(classes))
             f.write("        'imports': {!r},\n".format(nonstd_imports))
+            f.write("        'priority': {!r},\n".format(values['_INST_PRIORITY']))
 
             if params and 'visa_address' in params:
+                f.write("        'visa_check': {!r},\n".format(values.get('has_visa_check', True)))
                 visa_info = values.get('_INST_VISA_INFO')
                 if not visa_info:
                     f.write("        'visa_info': {},\n")
@@ -2,11 +2,17 @@ from past.builtins import unicode
 from future.builtins import bytes
 from future.utils import PY2
 
+import sys
 import time
+import threading
+import subprocess
 from functools import wraps
+from collections import namedtuple, OrderedDict
 import pickle
 
-from .errors import TimeoutError
+from .errors import TimeoutError, UnsupportedFeatureError
+
+ImportTime = namedtuple('ImportTime', ['module', 'self_time', 'cumulative_time'])
 
 
 def save_result(filename):
@@ -97,3 +103,104 @@ def cached_property(fun):
         ret = self._cache[fun] = fun(self)
         return ret
     return property(get)
+
+
+class LRUCache(object):
+    """A bounded, thread-safe mapping that evicts its least-recently-used entries
+
+    Keeps counts of cache `hits` and `misses`, which can be checked via `stats()`.
+
+    Parameters
+    ----------
+    maxsize : int
+        Maximum number of entries to hold
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """Get the value for `key`, marking it as recently used, or `default` if it's missing"""
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = value  # Reinsert as most recent
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Store `value` under `key`, evicting the least-recently-used entry if necessary"""
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries and reset the counters"""
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        """Get a dict of the cache's `hits`, `misses`, `size`, and `maxsize`"""
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data),
+                'maxsize': self.maxsize}
+
+
+def startup_profile(module='instrumental.drivers', limit=20):
+    """Profile the cost of a cold import of `module`
+
+    Imports `module` in a fresh interpreter using ``python -X importtime`` and collects the time
+    spent importing each module along the way. Useful for finding out what makes ``import
+    instrumental`` slow on a given machine.
+
+    Parameters
+    ----------
+    module : str, optional
+        Name of the module to import
+    limit : int or None, optional
+        Maximum number of entries to return. If None, all modules are returned.
+
+    Returns
+    -------
+    timings : list of ImportTime
+        ``(module, self_time, cumulative_time)`` namedtuples, with times in seconds, sorted by
+        cumulative time. The first entry is `module` itself, whose cumulative time is the total
+        cost of importing it.
+    """
+    if sys.version_info < (3, 7):
+        raise UnsupportedFeatureError("startup_profile() requires Python 3.7 or newer")
+
+    proc = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    _, err = proc.communicate()
+    if proc.returncode != 0:
+        raise ImportError("Failed to import '{}':\n{}".format(module, err))
+
+    timings = []
+    for line in err.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            timings.append(ImportTime(name.strip(), int(self_us) * 1e-6,
+                                      int(cumulative_us) * 1e-6))
+        except ValueError:
+            pass  # Header line
+
+    timings.sort(key=lambda t: t.cumulative_time, reverse=True)
+    return timings if limit is None else timings[:limit]
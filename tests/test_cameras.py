@@ -0,0 +1,367 @@
+import gc
+import time
+import numpy as np
+import pytest
+from instrumental.drivers import cameras, ParamSet
+from instrumental import Q_
+from instrumental.drivers.cameras import (Camera, FramePool, HotPixelPlan, PixelStats,
+                                          load_recording)
+from instrumental.errors import TimeoutError
+
+
+class FakeCamera(Camera):
+    width = height = max_width = max_height = 64
+
+    def start_capture(self, **kwds):
+        pass
+
+    def get_captured_image(self, timeout='1s', copy=True):
+        pass
+
+    def grab_image(self, timeouts='1s', copy=True, **kwds):
+        return next(self.frames)
+
+    def start_live_video(self, **kwds):
+        pass
+
+    def stop_live_video(self):
+        pass
+
+    def wait_for_frame(self, timeout=None):
+        pass
+
+    def latest_frame(self, copy=True):
+        pass
+
+
+def correct_reference(img, hot_pixels):
+    """Straightforward per-pixel version of the hot pixel correction"""
+    hot = set(map(tuple, hot_pixels))
+    fixed = img.copy()
+    for y, x in hot:
+        neighbors = [img[j, i] for j in range(y-1, y+2) for i in range(x-1, x+2)
+                     if 0 <= j < img.shape[0] and 0 <= i < img.shape[1] and (j, i) not in hot]
+        if neighbors:
+            fixed[y, x] = np.rint(np.mean(neighbors))
+    return fixed
+
+
+def test_hot_pixel_correction():
+    cam = FakeCamera(reopen_policy='new')
+    rng = np.random.RandomState(0)
+    img = rng.randint(0, 1000, size=(40, 50)).astype(np.uint16)
+    # Corners, edges, an adjacent pair, and a 3x3 block whose center has no usable neighbors
+    cam._hot_pixels = [[0, 0], [39, 49], [0, 20], [20, 0], [10, 10], [10, 11],
+                       [30, 30], [30, 31], [30, 32], [31, 30], [31, 31], [31, 32],
+                       [32, 30], [32, 31], [32, 32], [100, 5]]
+    for y, x in cam._hot_pixels[:-1]:
+        img[y, x] = 60000
+
+    fixed = cam._correct_hot_pixels(img)
+    assert np.array_equal(fixed, correct_reference(img, cam._hot_pixels[:-1]))
+    assert fixed[31, 31] == 60000
+    assert img[0, 0] == 60000  # Not modified
+
+    plan = cam._hot_pixel_plan
+    cam._correct_hot_pixels(img)
+    assert cam._hot_pixel_plan is plan
+    cam._correct_hot_pixels(img[:20])  # New shape, e.g. from a new ROI
+    assert cam._hot_pixel_plan is not plan
+
+    out = cam._correct_hot_pixels(img, in_place=True)
+    assert out is img and np.array_equal(img, fixed)
+
+
+def test_hot_pixel_correction_copies_readonly_images():
+    cam = FakeCamera(reopen_policy='new')
+    cam._hot_pixels = [[1, 1]]
+    img = np.arange(9, dtype=np.uint16).reshape(3, 3)
+    img.flags.writeable = False
+    fixed = cam._correct_hot_pixels(img, in_place=True)
+    assert fixed is not img and fixed[1, 1] == 4
+
+
+def test_hot_pixel_plan_ignores_outside_pixels():
+    plan = HotPixelPlan([[5, 5], [-1, 2]], (4, 4))
+    assert plan.ys.size == 0
+    img = np.ones((4, 4))
+    plan.apply(img)
+    assert np.all(img == 1)
+
+
+def dark_frames(n_frames, shape=(48, 64), seed=1):
+    rng = np.random.RandomState(seed)
+    for _ in range(n_frames):
+        frame = rng.normal(100, 3, size=shape)
+        frame[5, 7] += 500  # Hot
+        frame[20, 30] += 5  # Warm
+        frame[40, 2] = 90  # Stuck
+        frame[0, 63] = 0  # Dead
+        yield np.rint(frame).astype(np.uint16)
+
+
+def test_pixel_stats():
+    frames = list(dark_frames(12))
+    stats = PixelStats()
+    for frame in frames:
+        stats.add(frame)
+    assert stats.n == 12
+    assert np.allclose(stats.mean, np.mean(frames, axis=0), atol=1e-3)
+    assert np.allclose(stats.variance, np.var(frames, axis=0), rtol=1e-4, atol=1e-3)
+    with pytest.raises(ValueError):
+        stats.add(frames[0][:10])
+
+
+def test_calibrate_pixels(tmpdir):
+    cam = FakeCamera(reopen_policy='new')
+    cam.frames = dark_frames(20)
+    pixel_map = cam.calibrate_pixels(n_frames=20)
+
+    assert set(zip(*np.nonzero(pixel_map))) == {(5, 7), (20, 30), (40, 2), (0, 63)}
+    assert pixel_map[5, 7] == cameras.HOT_PIXEL
+    assert pixel_map[20, 30] == cameras.WARM_PIXEL
+    assert pixel_map[40, 2] == pixel_map[0, 63] == cameras.DEAD_PIXEL
+    # Warm pixels are only flagged, not corrected
+    assert sorted(map(tuple, cam._get_hot_pixels())) == [(0, 63), (5, 7), (40, 2)]
+
+    path = str(tmpdir.join('pixels.npy'))
+    cam.save_hot_pixels(path)
+    frame = next(dark_frames(1, seed=2))
+    fixed = cam._correct_hot_pixels(frame)
+
+    loaded = FakeCamera(reopen_policy='new')
+    cameras._init_instrument(loaded, {'hotpixel_file': path})
+    assert isinstance(loaded._pixel_map, np.memmap)
+    assert np.array_equal(loaded._pixel_map, pixel_map)
+    assert np.array_equal(loaded._correct_hot_pixels(frame), fixed)
+
+
+def test_hot_pixel_files(tmpdir):
+    cam = FakeCamera(reopen_policy='new')
+    cam._hot_pixels = [[1, 2], [3, 4]]
+    for name in ('pixels.json', 'pixels.npy'):
+        path = str(tmpdir.join(name))
+        cam.save_hot_pixels(path)
+        loaded = FakeCamera(reopen_policy='new')
+        cameras._init_instrument(loaded, {'hotpixel_file': path})
+        assert np.array_equal(loaded._get_hot_pixels(), [[1, 2], [3, 4]])
+
+
+def make_pool(n_buffers=3):
+    requeued, freed = [], []
+    pool = FramePool(requeue=requeued.append, free=freed.append)
+    arrays = [np.full((4, 6), i, np.uint16) for i in range(n_buffers)]
+    return pool, arrays, requeued, freed
+
+
+def test_frame_pool_leases():
+    pool, arrays, requeued, freed = make_pool()
+    pool.push(0, arrays[0])
+    frame = pool.latest(copy=False)
+    assert np.shares_memory(frame, arrays[0])
+    assert frame.seq == 1 and frame.dropped == 0
+    assert (frame + 1)._lease is None
+
+    # A leased buffer isn't given back until it's released, even once it's been replaced
+    pool.push(1, arrays[1])
+    assert requeued == [] and pool.leased_buffers() == [0]
+    with frame:
+        pass
+    assert requeued == [0]
+    frame.release()
+    assert requeued == [0]
+
+    # Views of a frame keep its lease until they're collected
+    view = pool.latest(copy=False)[1:, ::2]
+    pool.push(2, arrays[2])
+    assert requeued == [0]
+    del view
+    gc.collect()
+    assert requeued == [0, 1] and pool.leased_buffers() == []
+
+
+def test_frame_pool_copies_and_drops():
+    pool, arrays, requeued, freed = make_pool()
+    pool.push(0, arrays[0])
+    frame = pool.latest(copy=True)
+    assert not np.shares_memory(frame, arrays[0])
+    assert pool.leased_buffers() == []
+
+    pool.push(1, arrays[1])
+    pool.push(2, arrays[2])  # Frame 2 is never handed out
+    assert requeued == [0, 1]
+    frame = pool.latest()
+    assert (frame.seq, frame.dropped) == (3, 1)
+    assert (frame == 2).all()
+
+    # Gaps in the camera's frame numbers are counted as dropped frames
+    pool, arrays, requeued, freed = make_pool()
+    pool.push(0, arrays[0], frame_number=10)
+    pool.push(1, arrays[1], frame_number=13)
+    frame = pool.latest()
+    assert (frame.seq, frame.dropped) == (4, 3)
+
+
+def test_frame_pool_close():
+    pool, arrays, requeued, freed = make_pool()
+    pool.push(0, arrays[0])
+    frame = pool.latest(copy=False)
+    pool.push(1, arrays[1])
+
+    assert pool.close() == [1]
+    assert pool.leased_buffers() == [0]
+    frame.release()
+    assert requeued == [] and freed == [0]
+
+
+class LiveCamera(FakeCamera):
+    """Gives a frame for each of `frame_numbers` in live mode, then times out"""
+    _leases_frames = True
+    frame_interval = 0
+
+    def start_live_video(self, **kwds):
+        self.live = True
+        self.pool = FramePool(requeue=lambda buf: None)
+        self.numbers = iter(self.frame_numbers)
+
+    def stop_live_video(self):
+        self.live = False
+        self.pool.close()
+
+    def wait_for_frame(self, timeout=None):
+        try:
+            number = next(self.numbers)
+        except StopIteration:
+            time.sleep(Q_(timeout).m_as('s'))
+            return False
+        time.sleep(self.frame_interval)
+        self.pool.push(number, np.full((4, 6), number, np.uint16), frame_number=number)
+        return True
+
+    def latest_frame(self, copy=True):
+        return self.pool.latest(copy)
+
+
+def make_live_camera(frame_numbers):
+    # instrument() would open a FakeCamera, the first class in this module that fits the params
+    return LiveCamera._create(ParamSet(LiveCamera), frame_numbers=frame_numbers)
+
+
+def test_stream():
+    cam = make_live_camera([0, 1, 2, 4, 5])
+    with cam.stream(n=4, timeout='20ms') as stream:
+        assert [frame.seq for frame in stream] == [1, 2, 3, 5]
+        assert not cam.live
+    assert stream.dropped == 1
+    stats = stream.stats()
+    assert stats['frames'] == 4 and stats['dropped'] == 1
+    assert stats['latency'].m_as('s') >= 0
+
+    cam = make_live_camera([0])
+    with cam.stream(timeout='20ms') as stream:
+        assert stream.get().seq == 1
+        with pytest.raises(TimeoutError):
+            stream.get()
+    assert not cam.live
+
+
+def test_background_stream():
+    cam = make_live_camera(range(20))
+    queued = []
+    with cam.stream(timeout='1s', background=True, queue_size=2,
+                    callback=lambda: queued.append(True)) as stream:
+        while len(queued) < 20:
+            time.sleep(0.01)
+        frame = stream.poll()
+        assert (frame.seq, stream.dropped) == (20, 19)
+        assert stream.poll() is None
+        with pytest.raises(TimeoutError):
+            stream.timeout = 0.05
+            stream.get()
+    assert not cam.live
+    assert cam.pool.leased_buffers() == [19]
+
+    # Iterating, synchronously or asynchronously, waits for each frame
+    asyncio = pytest.importorskip('asyncio')
+    cam = make_live_camera(range(3))
+    stream = cam.stream(n=3, background=True, queue_size=3)
+    assert stream.get().seq == 1
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        assert loop.run_until_complete(stream.get_async()).seq == 2
+        assert loop.run_until_complete(stream.__anext__()).seq == 3
+        with pytest.raises(StopAsyncIteration):
+            loop.run_until_complete(stream.__anext__())
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+    assert not cam.live
+
+
+class OneBufferCamera(LiveCamera):
+    """Fills the same buffer with each frame, like drivers without a FramePool"""
+    _leases_frames = False
+
+    def start_live_video(self, **kwds):
+        self.live = True
+        self.buffer = np.zeros((4, 6), np.uint16)
+        self.numbers = iter(self.frame_numbers)
+
+    def stop_live_video(self):
+        self.live = False
+
+    def wait_for_frame(self, timeout=None):
+        try:
+            self.buffer[:] = next(self.numbers)
+        except StopIteration:
+            time.sleep(Q_(timeout).m_as('s'))
+            return False
+        return True
+
+    def latest_frame(self, copy=True):
+        return self.buffer.copy() if copy else self.buffer
+
+
+def test_background_stream_copies_unleased_frames():
+    for copy in (None, False):
+        cam = OneBufferCamera._create(ParamSet(OneBufferCamera), frame_numbers=range(5))
+        with cam.stream(timeout='50ms', copy=copy, background=True, queue_size=5) as stream:
+            frames = [stream.get() for _ in range(5)]
+        assert [frame[0, 0] for frame in frames] == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.parametrize('format', ['raw', 'npy-mmap', 'hdf5'])
+def test_record(tmpdir, format):
+    if format == 'hdf5':
+        pytest.importorskip('h5py')
+    path = str(tmpdir.join('video'))
+    cam = make_live_camera([0, 1, 2, 4] + list(range(5, 100)))
+    cam.frame_interval = 0.002
+    recording = cam.record(path, n_frames=10, format=format)
+    assert recording.done and recording.n_frames == 10
+    assert not cam.live and cam.pool.leased_buffers() == []
+
+    frames, index = load_recording(path)
+    assert frames.shape == (10, 4, 6) and frames.dtype == np.uint16
+    assert (np.diff(index['seq']) > 0).all()
+    assert (frames[:, 0, 0] == index['seq'] - 1).all()  # Frame numbers start at 0
+    assert index['dropped'][-1] == recording.dropped >= 1
+    assert (index['timestamp'] > 0).all()
+
+
+def test_record_until_stopped(tmpdir):
+    # More frames than are preallocated, so the file has to grow
+    path = str(tmpdir.join('video.npy'))
+    cam = make_live_camera(range(200))
+    cam.frame_interval = 0.001
+    recording = cam.record(path, timeout=None, wait=False)
+    while recording.n_frames + recording.dropped < 200:
+        time.sleep(0.01)
+    recording.stop()
+
+    frames, index = load_recording(path)
+    assert len(frames) == len(index) == recording.n_frames
+    assert (frames[:, 0, 0] == index['seq'] - 1).all()
+    assert frames[-1, 0, 0] == 199
+    assert np.load(path).shape == frames.shape
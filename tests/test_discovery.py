@@ -0,0 +1,74 @@
+import time
+from instrumental.drivers import ParamSet, discovery, _extract_params
+from instrumental.drivers.discovery import DiscoveryIndex
+
+
+def make_index(tmpdir, **kwds):
+    return DiscoveryIndex(str(tmpdir.join('index.json')), **kwds)
+
+
+def test_roundtrip(tmpdir):
+    index = make_index(tmpdir)
+    index.set_module_entries('cameras.tsi', [ParamSet(module='cameras.tsi', serial='05478')])
+    index.set_visa_entry('GPIB0::1::INSTR', ParamSet(module='lockins.sr850',
+                                                     visa_address='GPIB0::1::INSTR'))
+    index.set_visa_entry('ASRL1::INSTR', None)
+    index.save()
+
+    index = make_index(tmpdir)
+    paramsets = index.module_entries('cameras.tsi')
+    assert [dict(p.items()) for p in paramsets] == [{'module': 'cameras.tsi', 'serial': '05478'}]
+    assert index.visa_entry('GPIB0::1::INSTR')[1]['module'] == 'lockins.sr850'
+    assert index.visa_entry('ASRL1::INSTR') == (True, None)
+    assert index.visa_entry('GPIB0::2::INSTR') == (False, None)
+    assert index.module_entries('daq.ni') is None
+
+
+def test_expiry(tmpdir):
+    index = make_index(tmpdir, ttl=0.05, miss_ttl=0.)
+    index.set_module_entries('daq.ni', [])
+    index.set_visa_entry('ASRL1::INSTR', None)
+    assert index.module_entries('daq.ni') == []
+    assert index.visa_entry('ASRL1::INSTR') == (False, None)
+
+    time.sleep(0.1)
+    assert index.module_entries('daq.ni') is None
+
+
+def test_lookup_and_invalidate(tmpdir):
+    index = make_index(tmpdir)
+    index.set_module_entries('cameras.tsi', [ParamSet(module='cameras.tsi', classname='TSI_Camera',
+                                                      serial='05478')])
+    index.set_visa_entry('GPIB0::1::INSTR', ParamSet(visa_address='GPIB0::1::INSTR'))
+    index.set_visa_entry('GPIB0::2::INSTR', ParamSet(visa_address='GPIB0::2::INSTR'))
+
+    assert index.lookup('TSI')['serial'] == '05478'
+    assert index.find_serial(5478) is None
+    assert index.find_serial('05478')['classname'] == 'TSI_Camera'
+
+    index.prune_visa(['GPIB0::1::INSTR'])
+    assert index.visa_entry('GPIB0::2::INSTR') == (False, None)
+
+    index.set_module_entries('daq.ni', [ParamSet(module='daq.ni', classname='NIDAQ', name='Dev1')])
+    index.invalidate(ParamSet(serial='05478'))
+    assert index.lookup('TSI') is None
+    assert index.module_entries('daq.ni') is not None  # No identifying key in common
+    index.invalidate(ParamSet(visa_address='GPIB0::1::INSTR'))
+    assert index.visa_entry('GPIB0::1::INSTR') == (False, None)
+
+
+def test_open_by_serial(tmpdir, monkeypatch):
+    index = make_index(tmpdir)
+    index.set_module_entries('cameras.tsi', [ParamSet(module='cameras.tsi', classname='TSI_Camera',
+                                                      serial='05478')])
+    monkeypatch.setattr(discovery.get_index, 'index', index)
+
+    params, alias, from_index = _extract_params(None, {'serial': '05478'})
+    assert from_index and params['module'] == 'cameras.tsi' and params['classname'] == 'TSI_Camera'
+
+    # The index isn't used if it disagrees with the given params, or when rescanning
+    for kwargs in ({'serial': '05478', 'classname': 'Other'}, {'serial': '5478'}):
+        params, alias, from_index = _extract_params(None, kwargs)
+        assert not from_index and 'module' not in params
+    params, alias, from_index = _extract_params(None, {'serial': '05478'}, use_index=False)
+    assert not from_index and 'module' not in params
@@ -0,0 +1,48 @@
+import time
+from instrumental import Q_
+from instrumental.drivers import Instrument, Facet
+
+
+class Meter(Instrument):
+    def _initialize(self):
+        self.n_reads = 0
+        self.range_writes = []
+
+    def _read_power(self):
+        self.n_reads += 1
+        return self.n_reads
+
+    def _set_range(self, value):
+        self.range_writes.append(value)
+
+    power = Facet(_read_power, units='mW', max_age='50 ms')
+    temperature = Facet(_read_power, cached=True)
+    range = Facet(lambda self: 3, _set_range, cached=True, invalidates=['power'])
+
+
+def test_max_age():
+    meter = Meter(reopen_policy='new')
+    assert meter.power == Q_(1, 'mW')
+    assert meter.power == Q_(1, 'mW')
+    assert meter.facets.power.timestamp is not None
+
+    time.sleep(0.1)
+    assert meter.power == Q_(2, 'mW')
+    assert meter.get('power', use_cache=False) == Q_(3, 'mW')
+
+
+def test_invalidation():
+    meter = Meter(reopen_policy='new')
+    assert meter.power == Q_(1, 'mW')
+    assert meter.temperature == 2
+    assert meter.temperature == 2
+
+    meter.range = 5
+    meter.range = 5  # Cached, so not written again
+    assert meter.range_writes == [5]
+    assert meter.power == Q_(3, 'mW')
+
+    meter.facets.invalidate_all()
+    assert meter.temperature == 4
+    meter.range = 5
+    assert meter.range_writes == [5, 5]
@@ -0,0 +1,47 @@
+from instrumental import Q_
+from instrumental.drivers import VisaMixin, ManualFacet, SCPI_Facet, ParamSet
+
+
+class FakeResource(object):
+    def __init__(self, replies):
+        self.replies = replies
+        self.queries = []
+
+    def query(self, message):
+        self.queries.append(message)
+        return ';'.join(self.replies[msg.lstrip(':')] for msg in message.split(';'))
+
+    def write(self, message):
+        pass
+
+
+class MySupply(VisaMixin):
+    voltage = SCPI_Facet('source:volt', convert=float, units='V')
+    current = SCPI_Facet('source:curr', convert=float, units='A')
+    output = SCPI_Facet('output', convert=int, value={False: 0, True: 1})
+    label = ManualFacet(type=str)
+
+
+def make_supply(replies):
+    # Opened the way instrument() opens a VISA instrument, given its resource
+    return MySupply._create(ParamSet(MySupply), _rsrc=FakeResource(replies))
+
+
+def test_get_many_batches_queries():
+    supply = make_supply({'source:volt?': '1.5', 'source:curr?': '0.25', 'output?': '1'})
+    supply.label = 'PSU'
+    values = supply.get_many(['voltage', 'current', 'output', 'label'])
+
+    assert values == [Q_(1.5, 'V'), Q_(0.25, 'A'), True, 'PSU']
+    assert supply._rsrc.queries == ['source:volt?;:source:curr?;:output?']
+    assert supply.facets.current.cached_val == Q_(0.25, 'A')
+    assert not supply.facets.voltage.dirty
+
+
+def test_get_many_falls_back_on_mismatched_reply():
+    supply = make_supply({'source:volt?': '1.5', 'source:curr?': '0.25'})
+    supply._rsrc.replies['source:volt?;:source:curr?'] = '1.5;2;0.25'
+    supply._rsrc.query = lambda msg, query=supply._rsrc.query: (
+        supply._rsrc.replies[msg] if ';' in msg else query(msg))
+
+    assert supply.get_many(['voltage', 'current']) == [Q_(1.5, 'V'), Q_(0.25, 'A')]
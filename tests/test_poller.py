@@ -0,0 +1,55 @@
+import time
+import threading
+from instrumental.drivers import Instrument, Facet
+from instrumental.drivers.poller import Poller
+
+
+class Sensor(Instrument):
+    def _initialize(self):
+        self.n_reads = 0
+        self.lock = threading.Lock()
+
+    def _read_level(self):
+        with self.lock:
+            self.n_reads += 1
+            return self.n_reads // 3
+
+    def _slow_read(self):
+        time.sleep(0.05)
+        return 0
+
+    level = Facet(_read_level)
+    slow = Facet(_slow_read)
+
+
+def test_shared_schedule_and_change_events():
+    sensor = Sensor(reopen_policy='new')
+    events_a, events_b = [], []
+    poller = Poller()
+    start = time.time()
+    sub_a = poller.subscribe(sensor, 'level', 0.02, events_a.append)
+    poller.subscribe(sensor, 'level', 0.02, events_b.append)
+    time.sleep(0.3)
+    poller.stop()
+    elapsed = time.time() - start
+    n_reads = sensor.n_reads
+
+    # Two subscribers cost one read per period, not two
+    assert 5 <= n_reads <= elapsed / 0.02 + 2
+    # Events fire only on changes, and go to every observer
+    assert [e.new for e in events_a] == list(range(len(events_a)))
+    assert events_b == events_a[len(events_a) - len(events_b):]
+    assert sub_a.callback not in sensor.facets.level.observers
+
+    time.sleep(0.05)
+    assert sensor.n_reads == n_reads
+
+
+def test_backoff():
+    sensor = Sensor(reopen_policy='new')
+    poller = Poller(max_backoff=4.)
+    poller.subscribe(sensor, 'slow', 0.02)
+    time.sleep(0.3)
+    inst_poller = poller._inst_pollers[id(sensor)]
+    assert inst_poller.backoff == 4.
+    poller.stop()
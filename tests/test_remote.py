@@ -0,0 +1,598 @@
+import time
+import socket
+import threading
+import pytest
+import numpy as np
+from instrumental import Q_
+from instrumental.drivers import Instrument, ParamSet, Facet, ManualFacet
+from instrumental import drivers
+from instrumental.drivers import remote
+from instrumental.drivers.remote import ThreadedTCPServer, ClientSession
+from instrumental.drivers.remote_codec import get_codec, decode, can_encode
+
+
+class Sensor(Instrument):
+    gain = ManualFacet(type=float)
+
+    def _initialize(self):
+        self._handle = threading.Lock()  # Unpicklable, like a real device handle
+        self.n_counts = 0
+        self.n_level_reads = 0
+
+    def close(self):
+        self._instances.discard(self)  # So a later server can open the same serial
+
+    def read(self, delay=0.):
+        time.sleep(delay)
+        return self._paramset['serial']
+
+    def fail(self):
+        raise ValueError('Sensor failure')
+
+    def count(self, delay=0.):
+        time.sleep(delay)
+        self.n_counts += 1
+        return self.n_counts
+
+    def frame(self, shape):
+        return np.arange(np.prod(shape), dtype=np.uint16).reshape(shape)
+
+    def frames(self, n, shape):
+        return tuple(np.full(shape, i, dtype=np.uint16) for i in range(n))
+
+    def trace(self, scale):
+        return Q_(np.linspace(0, 1, 1000), 'V') * scale
+
+    def _read_level(self):
+        time.sleep(0.2)
+        self.n_level_reads += 1
+        return self.n_level_reads
+
+    level = Facet(_read_level)
+    cached_level = Facet(_read_level, cached=True)
+
+
+def _instrument(params):
+    # Called by the server's instrument() to open a Sensor from this module
+    return Sensor._create(ParamSet(serial=params['serial']))
+
+
+def start_server(kind, port=0, directory=None):
+    if kind == 'threaded':
+        server = ThreadedTCPServer(('127.0.0.1', port), directory)
+    else:
+        from instrumental.drivers.remote_async import AsyncServer
+        server = AsyncServer(('127.0.0.1', port), directory)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def stop_server(server):
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(params=['threaded', 'asyncio'])
+def session(request):
+    server = start_server(request.param)
+    host, port = server.server_address
+    session = ClientSession(host, port, 'test', heartbeat=0)
+    yield session
+
+    session.close()
+    stop_server(server)
+
+
+def open_sensor(session, serial, **kwds):
+    return session.instrument(ParamSet(module=__name__, serial=serial, server='test', **kwds))
+
+
+def test_remote_calls(session):
+    sensor = open_sensor(session, 'A1')
+    assert sensor.read() == 'A1'
+    assert repr(sensor).startswith('<Remote ')
+    with pytest.raises(ValueError):
+        sensor.fail()
+
+
+def test_concurrent_requests(session):
+    sensors = [open_sensor(session, 'S{}'.format(i)) for i in range(4)]
+    results = {}
+
+    def read(sensor):
+        results[sensor._obj_id] = sensor.read(0.3)
+
+    threads = [threading.Thread(target=read, args=(sensor,)) for sensor in sensors]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Requests to different instruments are in flight at once, rather than one after another
+    assert time.time() - start < 0.9
+    assert sorted(results.values()) == ['S0', 'S1', 'S2', 'S3']
+
+
+def test_response_timeout(session):
+    sensor = open_sensor(session, 'B2')
+    session.timeout = 0.1
+    with pytest.raises(remote.RemoteTimeoutError):
+        sensor.read(0.5)
+
+    # The late response is discarded rather than mistaken for the next one
+    time.sleep(0.5)
+    assert sensor.read() == 'B2'
+    assert not session.messengers[0].pending
+
+    with remote.request_timeout('1 s'):
+        assert sensor.read(0.5) == 'B2'
+
+
+def test_disconnect_fails_pending_requests(session):
+    sensor = open_sensor(session, 'C3')
+    messenger = session.messengers[0]
+    pending = messenger.send_request(*session.serialize(
+        dict(command='call_method', obj_id=sensor._obj_id, name='read', args=(0.3,), kwargs={})))
+    messenger.sock.shutdown(2)
+
+    with pytest.raises(remote.RemoteError):
+        messenger.wait_response(pending)
+
+    # The next request reconnects, and reopens the sensor since the server has closed it
+    assert sensor.read() == 'C3'
+    assert session.messengers[0] is not messenger
+
+
+def test_connection_pool(session):
+    session.pool_size = 3
+    sensors = [open_sensor(session, 'P{}'.format(i)) for i in range(3)]
+    threads = [threading.Thread(target=sensor.read, args=(0.2,)) for sensor in sensors]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join()
+
+    # Objects are shared by all of the session's connections
+    assert len(session.messengers) == 3
+    for messenger in session.messengers:
+        assert session._request_on(messenger, dict(command='call_method', obj_id=sensors[0]._obj_id,
+                                                   name='read', args=(), kwargs={})) == 'P0'
+
+
+@pytest.mark.parametrize('kind', ['threaded', 'asyncio'])
+def test_reconnect_after_server_restart(kind):
+    server = start_server(kind)
+    host, port = server.server_address
+    session = ClientSession(host, port, 'test', heartbeat=0.1)
+    try:
+        sensor = open_sensor(session, 'R1')
+        old_id = sensor._obj_id
+        stop_server(server)
+
+        server = start_server(kind, port)
+        time.sleep(0.5)  # Heartbeat notices the dropped connection and reconnects
+        assert not session.messengers[0].closed_error
+        assert sensor._obj_id != old_id
+        assert sensor.read() == 'R1'
+    finally:
+        session.close()
+        stop_server(server)
+
+
+@pytest.mark.parametrize('codec', ['compact', 'pickle'])
+def test_arrays_sent_out_of_band(codec):
+    if codec == 'pickle' and not remote.OUT_OF_BAND:
+        pytest.skip('Requires pickle protocol 5')
+    frame = np.ones((480, 640), dtype=np.uint16)
+    message, buffers = get_codec(codec).encode({'frame': frame, 'trace': Q_(frame[0], 'V')})
+    assert len(buffers) == 2
+    assert len(message) < 1000
+
+    obj = decode(message, [bytearray(buf) for buf in buffers])
+    assert np.array_equal(obj['frame'], frame)
+    assert obj['trace'].units == Q_(1, 'V').units
+
+
+def test_compact_codec():
+    codec = get_codec('compact')
+    obj = {
+        'command': 'call_method', 'obj_id': 140234, 'name': 'read', 'args': (1.5, None, True),
+        'kwargs': {'label': u'caf\xe9', 'data': b'\x00\xff', 'big': 2**70, 'n': np.int32(3)},
+        'value': [Q_(2.5, 'mV/s'), Q_(np.arange(3.), 'nm'), np.zeros((0, 2)), np.float32(1)],
+        'params': ParamSet(Sensor, serial='X'),
+    }
+    message, buffers = codec.encode(obj)
+    decoded = decode(message, buffers)
+
+    assert decoded['command'] == 'call_method'
+    assert decoded['args'] == (1.5, None, True)
+    assert decoded['kwargs'] == obj['kwargs']
+    assert type(decoded['kwargs']['n']) is np.int32  # Unsupported types are pickled as-is
+    q, trace, empty, scalar = decoded['value']
+    assert q == Q_(2.5, 'mV/s') and q.units == Q_(1, 'mV/s').units
+    assert np.array_equal(trace.magnitude, [0, 1, 2]) and trace.units == Q_(1, 'nm').units
+    assert empty.shape == (0, 2)
+    assert type(scalar) is np.float32
+    assert decoded['params']['serial'] == 'X'
+
+    request = dict(command='attr', obj_id=140234, attr='facets.gain')
+    assert len(codec.encode(request)[0]) < len(get_codec('pickle').encode(request)[0])
+
+    with pytest.raises(TypeError):
+        codec.encode({'lock': threading.Lock()})
+
+
+def test_can_encode():
+    assert can_encode({'frames': (np.zeros((4, 4)), np.ones(3)), 'v': Q_(np.arange(3.), 'V'),
+                       'more': [1, u'caf\xe9', None, b'\x00', 2**70, ParamSet(Sensor, serial='X')]})
+    assert not can_encode([1, (2, threading.Lock())])
+    assert not can_encode({'key': np.array([threading.Lock()], dtype=object)})
+
+
+@pytest.mark.parametrize('codec', ['compact', 'pickle'])
+def test_request_rate(codec):
+    # Loopback benchmark of small requests, run with `-s` to see the rates
+    server = start_server('threaded')
+    session = ClientSession(server.server_address[0], server.server_address[1], 'test',
+                            heartbeat=0, codec=codec)
+    try:
+        sensor = open_sensor(session, 'L1')
+        sensor.gain = 1.
+        n_requests = 500
+        start = time.time()
+        for _ in range(n_requests):
+            sensor.gain
+        rate = n_requests / (time.time() - start)
+        print('{} codec: {:.0f} requests/s'.format(codec, rate))
+        assert rate > 100
+    finally:
+        session.close()
+        stop_server(server)
+
+
+def test_remote_arrays(session):
+    sensor = open_sensor(session, 'D4')
+    frame = sensor.frame((1024, 1280))
+    assert frame.shape == (1024, 1280)
+    assert frame[-1, -1] == (1024*1280 - 1) % 2**16
+
+    trace = sensor.trace(np.full(1000, 2.))  # An array in the request, too
+    assert trace.units == Q_(1, 'V').units
+    assert trace.magnitude[-1] == 2.
+
+
+def test_many_arrays(session):
+    # More out-of-band buffers than sendmsg() can take at once
+    frames = open_sensor(session, 'D5').frames(1100, (2, 2))
+    assert len(frames) == 1100
+    assert frames[-1][0, 0] == 1099
+
+
+@pytest.mark.parametrize('kind', ['threaded', 'asyncio'])
+def test_shared_memory_arrays(kind):
+    if remote.remote_shm is None:
+        pytest.skip('Requires multiprocessing.shared_memory')
+    server = start_server(kind)
+    host, port = server.server_address
+    session = ClientSession(host, port, 'test', heartbeat=0)
+    plain_session = ClientSession(host, port, 'test', heartbeat=0, shared_memory=False)
+
+    try:
+        sensor = open_sensor(session, 'M1')
+        frame = sensor.frame((1024, 1280))
+        assert np.array_equal(frame, open_sensor(plain_session, 'M2').frame((1024, 1280)))
+        assert not frame.flags.writeable  # A view of the server's ring buffer
+        assert len(session.shared_views.segments) == 1
+        assert sensor.frame((4, 4)).flags.writeable  # Small arrays go through the socket
+
+        with session.subscribe(sensor, 'frame', args=((512, 512),), policy='block') as stream:
+            frames = [stream.get(timeout=1) for _ in range(3)]
+        assert all(not frame.flags.writeable for frame in frames)
+        assert frames[-1][-1, -1] == (512*512 - 1) % 2**16
+    finally:
+        session.close()
+        plain_session.close()
+        stop_server(server)
+
+
+@pytest.mark.parametrize('kind', ['threaded', 'asyncio'])
+def test_shared_memory_overflow(kind, monkeypatch):
+    if remote.remote_shm is None:
+        pytest.skip('Requires multiprocessing.shared_memory')
+    monkeypatch.setitem(remote.conf.prefs, 'remote_shm_size', 0.25)  # Room for 4 64 KiB arrays
+    server = start_server(kind)
+    host, port = server.server_address
+    session = ClientSession(host, port, 'test', heartbeat=0)
+
+    try:
+        sensor = open_sensor(session, 'M3')
+        shape = (256, 128)
+        frames = sensor.frames(6, shape)  # More than fits in the ring
+        assert [frame[0, 0] for frame in frames] == [0, 1, 2, 3, 4, 5]
+        assert [frame.flags.writeable for frame in frames] == [False]*4 + [True]*2
+
+        # The ring isn't reused while we still hold its arrays...
+        more_frames = sensor.frames(2, shape)
+        assert all(frame.flags.writeable for frame in more_frames)
+        assert [frame[0, 0] for frame in frames] == [0, 1, 2, 3, 4, 5]
+
+        # ...but is once they're gone
+        del frames, more_frames
+        assert not any(frame.flags.writeable for frame in sensor.frames(2, shape))
+    finally:
+        session.close()
+        stop_server(server)
+
+
+@pytest.mark.parametrize('kind', ['threaded', 'asyncio'])
+def test_shared_memory_stray_releases(kind, monkeypatch):
+    if remote.remote_shm is None:
+        pytest.skip('Requires multiprocessing.shared_memory')
+    monkeypatch.setitem(remote.conf.prefs, 'remote_shm_size', 0.25)  # Room for 4 64 KiB arrays
+    server = start_server(kind)
+    host, port = server.server_address
+    session = ClientSession(host, port, 'test', heartbeat=0)
+    other_session = ClientSession(host, port, 'test', heartbeat=0)
+
+    try:
+        sensor = open_sensor(session, 'M4')
+        shape = (256, 128)
+        frames = list(sensor.frames(4, shape))  # Fills the ring
+        name, = session.shared_views.segments
+
+        # Another session can't release our arrays...
+        other_session.shared_views.released.extend((name, n) for n in range(1, 5))
+        open_sensor(other_session, 'M5').read()
+        assert sensor.frame(shape).flags.writeable
+
+        # ...and releasing one of ours twice doesn't free its region once it's reused
+        del frames[0]
+        new_frame, = sensor.frames(1, shape)
+        assert not new_frame.flags.writeable
+        session.shared_views.released.append((name, 1))
+        assert sensor.frame(shape).flags.writeable
+        assert [frame[0, 0] for frame in frames] == [1, 2, 3] and new_frame[0, 0] == 0
+    finally:
+        session.close()
+        other_session.close()
+        stop_server(server)
+
+
+def count_requests(session):
+    requests = []
+    messenger = session.messengers[0]
+    make_request = messenger.make_request
+
+    def counting_make_request(*args, **kwds):
+        requests.append(args)
+        return make_request(*args, **kwds)
+    messenger.make_request = counting_make_request
+    return requests
+
+
+def test_method_calls_take_one_request(session):
+    sensor = open_sensor(session, 'E5')
+    requests = count_requests(session)
+
+    assert sensor.read() == 'E5'
+    assert sensor.read() == 'E5'
+    assert sensor.read is sensor.read
+    assert len(requests) == 2
+
+    sensor.gain = 2.
+    assert session.call_method(sensor._obj_id, 'facets.gain.get_value') == 2.
+    assert len(requests) == 4
+
+
+def test_batch(session):
+    sensor = open_sensor(session, 'F6')
+    requests = count_requests(session)
+
+    with session.batch() as batch:
+        batch.setattr(sensor, 'gain', 3.)
+        gain = batch.getattr(sensor, 'facets.gain.cached_val')
+        serial = batch.call(sensor, 'read')
+        failed = batch.call(sensor, 'fail')
+        facets = batch.getattr(sensor, 'facets')
+        with pytest.raises(remote.RemoteError):
+            gain.value
+
+    assert len(requests) == 1
+    assert gain.value == 3.
+    assert serial.value == 'F6'
+    with pytest.raises(ValueError):
+        failed.value
+    assert isinstance(facets.value, remote.RemoteObject)  # Unpicklable, so it stays remote
+    assert facets.value.gain.get_value() == 3.
+
+
+def test_stream(session):
+    sensor = open_sensor(session, 'G7')
+    with session.subscribe(sensor, 'count', rate='200 Hz', policy='block') as stream:
+        values = [stream.get(timeout=1) for _ in range(5)]
+        assert stream.seq == 5
+        assert stream.dropped == 0
+    assert values == [1, 2, 3, 4, 5]
+    assert list(stream) == []  # Closed
+
+
+def test_stream_latest_policy_drops_old_values(session):
+    sensor = open_sensor(session, 'H8')
+    stream = session.subscribe(sensor, 'count', args=(0.005,), policy='latest', window=1)
+    first = stream.get(timeout=1)
+    time.sleep(0.2)  # Fall behind
+
+    stream.get(timeout=1)  # Was already on its way when we read the first value
+    latest = stream.get(timeout=1)
+    assert latest > first + 10
+    assert stream.dropped > 10
+    assert stream.seq == 3
+    stream.close()
+
+
+def test_stream_block_policy_waits_for_client(session):
+    sensor = open_sensor(session, 'I9')
+    stream = session.subscribe(sensor, 'count', policy='block', window=2)
+    time.sleep(0.2)
+    assert sensor.n_counts == 2  # Only as many calls as the client has room for
+
+    assert [stream.get(timeout=1) for _ in range(3)] == [1, 2, 3]
+    stream.close()
+
+
+def test_stream_error(session):
+    sensor = open_sensor(session, 'J0')
+    stream = session.subscribe(sensor, 'fail')
+    with pytest.raises(ValueError):
+        stream.get(timeout=1)
+    with pytest.raises(ValueError):
+        stream.get(timeout=1)
+    stream.close()
+
+    with pytest.raises(AttributeError):
+        session.subscribe(sensor, 'nonexistent')
+
+
+def test_shared_reads_are_coalesced_and_cached(session, monkeypatch):
+    monkeypatch.setattr(remote, 'CACHE_TTL', 1.)
+    other_session = ClientSession(session.host, session.port, 'test', heartbeat=0)
+    try:
+        sensors = [open_sensor(session, 'M1', share=True),
+                   open_sensor(other_session, 'M1', share=True)]
+        values = []
+        threads = [threading.Thread(target=lambda s=s: values.append(s.level)) for s in sensors]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.05)
+        for thread in threads:
+            thread.join()
+
+        # The second read waits on the first, rather than going to the instrument again
+        assert values == [1, 1]
+        assert sensors[1].level == 2  # Not cached, as `level` isn't a cacheable facet
+
+        assert sensors[0].cached_level == 3
+        thread = threading.Thread(target=sensors[0].read, args=(0.3,))
+        thread.start()
+        time.sleep(0.05)
+        start = time.time()
+        assert sensors[1].cached_level == 3
+        assert time.time() - start < 0.2  # Served without waiting for the instrument
+        thread.join()
+
+        stats, = session.metrics()['reads']
+        assert (stats['reads'], stats['hits'], stats['coalesced']) == (5, 1, 1)
+        assert stats['hit_ratio'] == 0.4
+
+        # Other requests clear the cache, in case they changed the instrument's state
+        sensors[0].count()
+        assert sensors[1].cached_level == 3  # Re-read, then found in the Facet's own cache
+        assert other_session.metrics()['reads'][0]['hits'] == 1
+    finally:
+        other_session.close()
+
+
+def test_async_server_runs_instruments_in_parallel():
+    server = start_server('asyncio')
+    session = ClientSession(server.server_address[0], server.server_address[1], 'test',
+                            heartbeat=0)
+
+    try:
+        sensor_a = open_sensor(session, 'K1')
+        sensor_b = open_sensor(session, 'K2')
+        threads = [threading.Thread(target=sensor.read, args=(0.2,))
+                   for sensor in (sensor_a, sensor_a, sensor_a, sensor_b)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+
+        depths = {inst['name']: inst['queue_depth'] for inst in session.metrics()['instruments']}
+        assert sorted(depths.values()) == [1, 3]
+        assert session.metrics()['connections'] == 1
+
+        for thread in threads:
+            thread.join()
+        # Calls are serialized per instrument, but different instruments don't wait on each other
+        assert 0.6 <= time.time() - start < 0.75
+    finally:
+        session.close()
+        stop_server(server)
+
+
+@pytest.fixture
+def servers(monkeypatch):
+    """Two servers, each with one Sensor, plus one that never answers and one that's down"""
+    n_lists = []
+
+    def list_instruments():
+        n_lists.append(1)
+        return [ParamSet(module=__name__, serial='L1')]
+
+    running = [start_server('threaded'), start_server('threaded')]
+    stuck = socket.socket()  # Accepts connections, but never responds
+    stuck.bind(('127.0.0.1', 0))
+    stuck.listen(5)
+    down = socket.socket()
+    down.bind(('127.0.0.1', 0))  # Bound but not listening, so connecting fails
+
+    addresses = [server.server_address for server in running]
+    addresses += [stuck.getsockname(), down.getsockname()]
+    monkeypatch.setattr(remote, 'list_instruments', list_instruments)
+    monkeypatch.setattr(remote, '_list_cache', {})
+    monkeypatch.setattr(remote.client_session, 'sessions', {})
+    monkeypatch.setattr(remote.conf, 'servers', {
+        name: '{}:{}'.format(*address)
+        for name, address in zip(('one', 'two', 'stuck', 'down'), addresses)})
+    yield n_lists
+
+    for session in list(remote.client_session.sessions.values()):
+        session.close()
+    for server in running:
+        stop_server(server)
+    stuck.close()
+    down.close()
+
+
+def test_list_instruments_on_several_servers(servers):
+    start = time.time()
+    inst_list = remote.list_remote_instruments('all', timeout=0.5)
+    # Servers are queried at once, and the unresponsive ones are skipped
+    assert time.time() - start < 1.0
+    assert sorted((params['server'], params['serial']) for params in inst_list) == [
+        ('one', 'L1'), ('two', 'L1')]
+    assert len(servers) == 2
+
+    # Lists are cached, unless refreshed
+    assert drivers.list_instruments(servers=['two'])[0]['server'] == 'two'
+    assert len(servers) == 2
+    drivers.list_instruments(servers='two', refresh=True)
+    assert len(servers) == 3
+
+
+@pytest.mark.parametrize('kind', ['threaded', 'asyncio'])
+def test_directory_server(servers, kind, monkeypatch):
+    monkeypatch.setitem(remote.conf.prefs, 'remote_list_timeout', 0.5)
+    directory = start_server(kind, directory=['one', 'stuck'])
+    host, port = directory.server_address
+    session = ClientSession(host, port, 'test', heartbeat=0)
+
+    try:
+        inst_list = session.list_instruments()
+        assert [params.get('upstream') for params in inst_list] == [None, 'one']
+        assert all(params['server'] == 'test' for params in inst_list)
+
+        # Requests are relayed to the sensor on server 'one'
+        sensor = session.instrument(inst_list[1])
+        assert sensor.read() == 'L1'
+        assert [sensor.count(), sensor.count()] == [1, 2]
+        sensor.gain = 2.
+        assert sensor.gain == 2.
+        assert len(remote.client_session('one').instruments) == 1
+    finally:
+        session.close()
+        stop_server(directory)
@@ -0,0 +1,37 @@
+import os
+import sys
+import subprocess
+
+# Cold-import budget for `import instrumental.drivers`, in seconds. Override it on slow machines.
+IMPORT_BUDGET = float(os.environ.get('INSTRUMENTAL_IMPORT_BUDGET', '0.3'))
+
+COLD_IMPORT = """
+import sys, time
+start = time.time()
+import instrumental.drivers
+elapsed = time.time() - start
+print(elapsed, 'pint' in sys.modules, sys.modules['instrumental.conf']._loaded)
+"""
+
+
+def cold_import():
+    out = subprocess.check_output([sys.executable, '-c', COLD_IMPORT], universal_newlines=True)
+    elapsed, pint_loaded, conf_loaded = out.split()
+    return float(elapsed), pint_loaded == 'True', conf_loaded == 'True'
+
+
+def test_import_is_lazy():
+    _, pint_loaded, conf_loaded = cold_import()
+    assert not pint_loaded
+    assert not conf_loaded
+
+
+def test_import_budget():
+    elapsed = min(cold_import()[0] for _ in range(3))
+    assert elapsed < IMPORT_BUDGET, "Importing instrumental.drivers took {:.3f} s".format(elapsed)
+
+
+def test_units_load_on_access():
+    import instrumental
+    assert instrumental.Q_(1, 'mm').to('m').magnitude == 0.001
+    assert instrumental.u.parse_units('mm') == instrumental.Q_(1, 'mm').units
@@ -0,0 +1,123 @@
+import inspect
+import pytest
+from enum import Enum
+from pint.errors import DimensionalityError
+from instrumental import Q_, u
+from instrumental.drivers import Instrument, Facet
+from instrumental.drivers.util import magnitude_in, to_quantity, check_units, unit_mag, check_enums
+from instrumental.util import LRUCache
+
+
+class Source(Instrument):
+    def _initialize(self):
+        self.written = []
+
+    def _set_level(self, value):
+        self.written.append(value)
+
+    level = Facet(lambda self: 1500, _set_level, type=float, units='mV')
+
+
+def test_magnitude_in():
+    assert magnitude_in(Q_(250, 'mV'), u.V) == pytest.approx(0.25)
+    assert magnitude_in(Q_(3, 'V'), u.V) == 3
+    assert magnitude_in(Q_(100, 'degC'), u.degF) == pytest.approx(212)
+    with pytest.raises(DimensionalityError):
+        magnitude_in(Q_(1, 'A'), u.V)
+
+
+def test_raw_access():
+    source = Source()
+    assert Source.level.get_value(source, raw=True) == 1500.
+    assert source.level == Q_(1500, 'mV')
+    assert source.get('level', use_cache=True, raw=True) == 1500.
+
+    source.level = Q_(2, 'V')
+    source.facets.level.set_value(25, raw=True)
+    assert source.written == [2000., 25.]
+
+
+def test_lru_cache():
+    cache = LRUCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)  # Evicts 'b', the least recently used
+    assert cache.get('b') is None
+    assert 'a' in cache and 'c' in cache
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'size': 2, 'maxsize': 2}
+
+
+def test_to_quantity_cache():
+    to_quantity.cache.clear()
+    q1 = to_quantity('1.2345e-3 W')
+    q2 = to_quantity('1.2345e-3 W')
+    assert q1 == q2 == Q_(1.2345e-3, 'W')
+    assert q1 is not q2
+    q1 *= 2  # Mutating a result must not affect the cache
+    assert to_quantity('1.2345e-3 W') == Q_(1.2345e-3, 'W')
+    assert to_quantity.cache.stats()['hits'] == 2
+
+
+@check_units(value='V', limit='?A')
+def checked(value, limit=None):
+    return value, limit
+
+
+@unit_mag(value='V', ret=('mV', None))
+def magged(value):
+    return '{} V'.format(value), value
+
+
+def test_unit_decorators():
+    assert checked('5 mV') == (Q_(5, 'mV'), None)
+    assert checked(0) == (Q_(0, 'V'), None)
+    assert checked('5 mV', '2 A')[1] == Q_(2, 'A')
+    with pytest.raises(DimensionalityError):
+        checked('5 A')
+
+    assert magged('500 mV') == (Q_(0.5, 'V'), 0.5)
+    with pytest.raises(DimensionalityError):
+        magged('5 s')
+
+
+class Mode(Enum):
+    fast = 1
+    slow = 2
+
+
+@unit_mag(exposure='ms', gain='?dimensionless')
+def configure(cam, exposure='10 ms', gain=None, *extra, **options):
+    """Configure the camera"""
+    return exposure, gain, extra, options
+
+
+@check_enums(mode=Mode)
+def set_mode(mode='fast'):
+    return mode
+
+
+@unit_mag(angle='deg', fraction='percent')
+def set_angle(angle, fraction=0):
+    return angle, fraction
+
+
+def test_generated_wrappers():
+    assert configure.__name__ == 'configure'
+    assert configure.__doc__ == 'Configure the camera'
+    assert inspect.getsource(configure.__wrapped__).startswith('@unit_mag')
+
+    assert configure(None) == (10, None, (), {})
+    assert configure(None, Q_(2, 's'), 3, 'x', y=1) == (2000, 3, ('x',), {'y': 1})
+    assert configure(None, exposure=Q_(5, 'ms'), gain=0.5) == (5, 0.5, (), {})
+    with pytest.raises(DimensionalityError):
+        configure(None, 5.)
+
+    # Bare numbers are dimensionless, so are scaled to dimensionless units like deg and percent
+    assert set_angle(1.0)[0] == pytest.approx(57.2958, rel=1e-5)
+    assert set_angle(Q_(90, 'deg'), 0.5) == (90, pytest.approx(50))
+
+    assert set_mode() is Mode.fast
+    assert set_mode('slow') is Mode.slow
+    with pytest.raises(ValueError):
+        set_mode('medium')
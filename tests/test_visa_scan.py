@@ -0,0 +1,144 @@
+import os.path
+import time
+import threading
+import pytest
+from instrumental.drivers.discovery import scan_visa_addresses, visa_interface
+
+SIM_FILE = os.path.join(os.path.dirname(__file__), 'visa_sim.yaml')
+
+
+def test_visa_interface():
+    assert visa_interface('GPIB0::8::INSTR') == 'GPIB0'
+    assert visa_interface('TCPIP::10.0.0.1::INSTR') == 'TCPIP0'
+    assert visa_interface('ASRL3::INSTR') == 'ASRL3'
+
+
+def test_scan_is_concurrent():
+    addresses = ['TCPIP0::10.0.0.{}::INSTR'.format(i) for i in range(8)]
+
+    def probe(address):
+        time.sleep(0.2)
+        return address
+
+    start = time.time()
+    results = dict(scan_visa_addresses(addresses, probe))
+    assert time.time() - start < 0.6  # Serially, this would take 1.6 s
+    assert results == {a: a for a in addresses}
+
+
+def test_gpib_probes_are_serialized():
+    active = []
+    max_active = [0]
+    lock = threading.Lock()
+
+    def probe(address):
+        with lock:
+            active.append(address)
+            max_active[0] = max(max_active[0], len(active))
+        time.sleep(0.02)
+        with lock:
+            active.remove(address)
+
+    addresses = ['GPIB0::{}::INSTR'.format(i) for i in range(1, 5)]
+    assert len(list(scan_visa_addresses(addresses, probe))) == 4
+    assert max_active[0] == 1
+
+
+def test_deadline_and_errors():
+    def probe(address):
+        if address.startswith('TCPIP0::dead'):
+            time.sleep(1.)
+        elif address.startswith('TCPIP0::bad'):
+            raise RuntimeError
+        return 'ok'
+
+    addresses = ['TCPIP0::dead::INSTR', 'TCPIP0::bad::INSTR', 'TCPIP0::good::INSTR']
+    start = time.time()
+    results = dict(scan_visa_addresses(addresses, probe, deadline=0.1))
+    assert time.time() - start < 0.5
+    assert results == {'TCPIP0::bad::INSTR': None, 'TCPIP0::good::INSTR': 'ok'}
+
+
+def test_hung_probe_frees_its_board():
+    hang = threading.Event()
+
+    def probe(address):
+        if address == 'GPIB0::1::INSTR':
+            hang.wait(5.)
+        return 'ok'
+
+    addresses = ['GPIB0::{}::INSTR'.format(i) for i in range(1, 4)]
+    start = time.time()
+    results = dict(scan_visa_addresses(addresses, probe, deadline=0.2))
+    assert time.time() - start < 1.
+    assert results == {'GPIB0::2::INSTR': 'ok', 'GPIB0::3::INSTR': 'ok'}
+
+    # The whole scan gives up in time, even on addresses that never got to start
+    start = time.time()
+    assert list(scan_visa_addresses(addresses, lambda a: hang.wait(5.), deadline=0.2,
+                                    total_deadline=0.3)) == []
+    assert time.time() - start < 1.
+    hang.set()
+
+
+class SimResourceManager(object):
+    """pyvisa-sim needs explicit terminations, which real instruments signal via EOI"""
+    def __init__(self, rm):
+        self.rm = rm
+
+    def list_resources(self):
+        return self.rm.list_resources()
+
+    def open_resource(self, address, **kwds):
+        return self.rm.open_resource(address, read_termination='\n', write_termination='\n',
+                                     **kwds)
+
+
+def test_sim_backend():
+    pytest.importorskip('pyvisa_sim')
+    visa = pytest.importorskip('visa')
+    from instrumental.drivers import gen_visa_instruments
+
+    rm = SimResourceManager(visa.ResourceManager(SIM_FILE + '@sim'))
+    paramsets = list(gen_visa_instruments(rm=rm))
+    assert sorted(p['visa_address'] for p in paramsets) == ['TCPIP0::10.0.0.1::inst0::INSTR',
+                                                             'TCPIP0::10.0.0.2::inst0::INSTR']
+    assert all(p['classname'] == 'Model5005' for p in paramsets)
+
+
+def test_visa_driver_table():
+    from collections import OrderedDict
+    from instrumental.drivers.discovery import VisaDriverTable
+
+    info = OrderedDict([
+        ('scopes.tek', {'priority': 5, 'visa_check': False, 'visa_info': {
+            'TDS_3000': ('TEKTRONIX', ['TDS 3012', 'TDS 3*']),
+            'TDS_3054': ('TEKTRONIX', ['TDS 305*']),
+        }}),
+        ('scopes.other', {'priority': 5, 'visa_info': {'Other': ('TEKTRONIX', ['TDS 3012'])}}),
+        ('lasers.slow', {'priority': 5, 'visa_check': True, 'visa_info': {}}),
+        ('lasers.fast', {'priority': 5, 'visa_check': True, 'visa_info': {}}),
+        ('lasers.last', {'priority': 9, 'visa_check': True, 'visa_info': {}}),
+        ('daq.ni', {'priority': 5}),
+    ])
+    table = VisaDriverTable(info, miss_ttl=0.05)
+
+    assert table.match_idn('TEKTRONIX', 'TDS 3012') == ('scopes.tek', 'TDS_3000')
+    assert table.match_idn('TEKTRONIX', 'TDS 3012', 'scopes.other') == ('scopes.other', 'Other')
+    assert table.match_idn('TEKTRONIX', 'TDS 3054B') == ('scopes.tek', 'TDS_3054')
+    assert table.match_idn('TEKTRONIX', 'TDS 3032') == ('scopes.tek', 'TDS_3000')
+    assert table.match_idn('TEKTRONIX', 'TDS 2002') is None
+    assert not table.has_idn_info('lasers.slow')
+
+    # Checks are reordered by speed, but only within a priority level
+    assert table.check_order() == ['scopes.other', 'lasers.slow', 'lasers.fast', 'lasers.last']
+    table.record_check_time('lasers.slow', 0.2)
+    table.record_check_time('lasers.fast', 0.01)
+    table.record_check_time('lasers.last', 0.)
+    table.record_check_time('scopes.other', 0.05)
+    assert table.check_order() == ['lasers.fast', 'scopes.other', 'lasers.slow', 'lasers.last']
+
+    table.add_miss('ASRL1::INSTR')
+    assert table.is_miss('ASRL1::INSTR')
+    time.sleep(0.1)
+    assert not table.is_miss('ASRL1::INSTR')
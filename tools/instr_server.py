@@ -4,17 +4,36 @@
 Instrumental server script. Allows other machines to access and control this machine's instruments.
 """
 import time
+import argparse
 import threading
 import logging
 from instrumental.log import log_to_screen, DEBUG, WARNING
 from instrumental.drivers.remote import ThreadedTCPServer, DEFAULT_PORT
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                        help='port to listen on (default: %(default)s)')
+    parser.add_argument('--asyncio', action='store_true',
+                        help='serve from an asyncio event loop, running the requests for each '
+                             'instrument on its own thread (Python 3 only)')
+    parser.add_argument('--directory', nargs='*', metavar='SERVER',
+                        help='also list the instruments of these servers (by default, all those '
+                             'in instrumental.conf), and relay requests to them')
+    args = parser.parse_args()
+
     log_to_screen(level=DEBUG, fmt='[%(levelname)8s]%(filename)s/%(funcName)s: %(message)s')
     logging.getLogger('nicelib').setLevel(WARNING)
 
     HOST = ''  # Listen on all network interfaces
-    server = ThreadedTCPServer((HOST, DEFAULT_PORT))
+    directory = args.directory
+    if directory is not None and not directory:
+        directory = 'all'
+    if args.asyncio:
+        from instrumental.drivers.remote_async import AsyncServer
+        server = AsyncServer((HOST, args.port), directory)
+    else:
+        server = ThreadedTCPServer((HOST, args.port), directory)
     ip, port = server.server_address
     server_thread = threading.Thread(target=server.serve_forever)
     server_thread.daemon = True